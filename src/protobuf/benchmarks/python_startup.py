@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Measures how long generated Python modules take to import.
+
+Each run imports the named _pb2 modules in a fresh interpreter, after the
+protobuf runtime itself, and reports the time spent importing them and the
+part of it spent building message classes.  For example:
+
+  $ cd python && python setup.py build
+  $ PYTHONPATH=python python benchmarks/python_startup.py \\
+        google.protobuf.unittest_pb2
+"""
+
+import optparse
+import subprocess
+import sys
+
+# Run in the child interpreter.
+_CHILD = r'''
+import sys, time
+from google.protobuf import reflection
+from google.protobuf.internal import api_implementation
+
+init = reflection.GeneratedProtocolMessageType.__init__
+class_time = [0.0, 0]
+def TimedInit(cls, name, bases, dictionary):
+  start = time.time()
+  init(cls, name, bases, dictionary)
+  class_time[0] += time.time() - start
+  class_time[1] += 1
+reflection.GeneratedProtocolMessageType.__init__ = TimedInit
+
+start = time.time()
+for module in sys.argv[1:]:
+  __import__(module)
+total = time.time() - start
+print api_implementation.Type(), total, class_time[0], class_time[1]
+'''
+
+
+def _Median(values):
+  values = sorted(values)
+  return values[len(values) // 2]
+
+
+def main():
+  parser = optparse.OptionParser(
+      usage='%prog [options] module [module...]')
+  parser.add_option('-n', '--runs', type='int', default=10,
+                    help='number of fresh interpreters to time')
+  options, modules = parser.parse_args()
+  if not modules:
+    parser.error('no modules given')
+
+  totals = []
+  class_times = []
+  for _ in xrange(options.runs):
+    output = subprocess.check_output(
+        [sys.executable, '-c', _CHILD] + modules)
+    implementation, total, class_time, classes = output.split()
+    totals.append(float(total))
+    class_times.append(float(class_time))
+
+  print '%s implementation, %s message classes, median of %d runs:' % (
+      implementation, classes, options.runs)
+  print '  import:          %7.2f ms' % (_Median(totals) * 1000)
+  print '  class creation:  %7.2f ms' % (_Median(class_times) * 1000)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,191 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Decodes framed messages arriving on an asyncio connection.
+
+FrameProtocol is an asyncio protocol which splits incoming bytes into frames
+(see google.protobuf.framing) and passes each decoded message to a callback.
+Frames at least offload_size bytes long are parsed in the event loop's
+executor, so a large message does not hold up the other connections served by
+the loop.  Messages are still delivered in the order they arrived.
+
+Requires asyncio, or trollius on Python 2.
+"""
+
+import collections
+
+try:
+  import asyncio
+except ImportError:
+  import trollius as asyncio
+
+from google.protobuf import framing
+from google.protobuf import message
+
+
+_OFFLOAD_SIZE = 256 * 1024
+
+
+class FrameProtocol(asyncio.Protocol):
+
+  """Protocol which decodes a stream of framed messages.
+
+  For each frame, message_handler(message_type, message) is called on the
+  event loop.  A stream which cannot be decoded closes the transport, after
+  passing the message.DecodeError to error_handler if one was given.
+
+  While max_pending frames are waiting to be parsed in the executor, reading
+  from the transport is paused.
+  """
+
+  def __init__(self, message_handler, message_classes=None,
+               header_format=framing.DEFAULT_HEADER_FORMAT,
+               max_frame_size=framing.DEFAULT_MAX_FRAME_SIZE,
+               offload_size=_OFFLOAD_SIZE,
+               executor=None, max_pending=16, error_handler=None, loop=None):
+    """Args:
+      message_handler: Called with (message_type, message) for each frame.
+        Frames of types missing from message_classes pass their payload.
+      message_classes: Dict mapping message type numbers to message classes.
+      header_format: struct format of the frame header; see framing.
+      max_frame_size: The largest payload accepted, or None for no limit; see
+        framing.FrameDecoder.
+      offload_size: Payloads of at least this many bytes are parsed in
+        executor.  None parses everything on the event loop.
+      executor: The executor passed to loop.run_in_executor(); None uses the
+        loop's default executor.
+      max_pending: Number of frames queued behind the executor at which reading
+        is paused.
+      error_handler: If not None, called with the message.DecodeError that
+        ended the stream.
+      loop: The event loop.  Defaults to asyncio.get_event_loop().
+    """
+    self._decoder = framing.FrameDecoder(
+        message_classes, header_format, max_frame_size)
+    self._message_handler = message_handler
+    self._error_handler = error_handler
+    self._offload_size = offload_size
+    self._executor = executor
+    self._max_pending = max_pending
+    self._loop = loop or asyncio.get_event_loop()
+    self._transport = None
+    self._reading_paused = False
+    self._eof_received = False
+    self._closed = False
+    # Futures for frames not yet delivered, in stream order.
+    self._pending = collections.deque()
+
+  def connection_made(self, transport):
+    self._transport = transport
+
+  def data_received(self, data):
+    if self._closed:
+      return
+    try:
+      frames = self._decoder.Feed(data)
+    except message.DecodeError, e:
+      self._Fail(e)
+      return
+    decode_frame = self._decoder.DecodeFrame
+    offload_size = self._offload_size
+    for message_type, payload in frames:
+      if offload_size is not None and len(payload) >= offload_size:
+        future = self._loop.run_in_executor(
+            self._executor, decode_frame, message_type, payload)
+        future.add_done_callback(self._OnFrameDecoded)
+      elif not self._pending:
+        # Nothing to wait for, so skip the future.
+        try:
+          self._message_handler(*decode_frame(message_type, payload))
+        except message.DecodeError, e:
+          self._Fail(e)
+          return
+        continue
+      else:
+        future = asyncio.Future(loop=self._loop)
+        try:
+          future.set_result(decode_frame(message_type, payload))
+        except message.DecodeError, e:
+          future.set_exception(e)
+      self._pending.append(future)
+    if (self._pending and not self._reading_paused and
+        len(self._pending) >= self._max_pending):
+      self._reading_paused = True
+      self._transport.pause_reading()
+
+  def eof_received(self):
+    self._eof_received = True
+    if self._pending:
+      # Keep the transport open until the offloaded frames are delivered.
+      return True
+    self._Finish()
+
+  def connection_lost(self, exc):
+    self._closed = True
+    for future in self._pending:
+      future.cancel()
+    self._pending.clear()
+
+  def _OnFrameDecoded(self, unused_future):
+    pending = self._pending
+    while pending and pending[0].done() and not self._closed:
+      future = pending.popleft()
+      if future.cancelled():
+        continue
+      try:
+        message_type, msg = future.result()
+      except message.DecodeError, e:
+        self._Fail(e)
+        return
+      self._message_handler(message_type, msg)
+    if self._closed:
+      return
+    if self._reading_paused and len(pending) < self._max_pending:
+      self._reading_paused = False
+      self._transport.resume_reading()
+    if self._eof_received and not pending:
+      self._Finish()
+      if not self._closed:
+        self._transport.close()
+
+  def _Finish(self):
+    try:
+      self._decoder.Finish()
+    except message.DecodeError, e:
+      self._Fail(e)
+
+  def _Fail(self, error):
+    self._closed = True
+    for future in self._pending:
+      future.cancel()
+    self._pending.clear()
+    if self._error_handler is not None:
+      self._error_handler(error)
+    self._transport.close()
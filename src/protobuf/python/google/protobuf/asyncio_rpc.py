@@ -0,0 +1,373 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Calls protocol services over asyncio connections, many calls at a time.
+
+The channels here return an asyncio Future for the response of each call, so
+a stub built on one (see service_reflection) returns a Future from each of its
+methods, and many calls can be in flight at once:
+
+  stub = MyService_Stub(channel)
+  futures = [stub.Foo(asyncio_rpc.Controller(), request) for request in ...]
+  responses = yield From(asyncio.gather(*futures))
+
+A failed call's Future raises service.RpcException, and the error text is
+also passed to the controller's SetFailed().  A done callback may still be
+passed to a stub method; it is called with the response, or None on failure.
+
+RpcProtocol is the client end of a connection to a ServiceProtocol, which
+serves a Service.  Each request is sent in a frame (see framing) tagged with a
+call id, and its response comes back tagged with the same id, so the server
+may answer calls in any order.  Frames sent in the same pass of the event loop
+are written to the transport together.
+
+LoopbackRpcChannel calls a Service in the same process, for tests.
+
+Requires asyncio, or trollius on Python 2.
+"""
+
+import functools
+import struct
+
+from google.protobuf import asyncio_framing
+from google.protobuf import framing
+from google.protobuf import message
+from google.protobuf import service
+
+asyncio = asyncio_framing.asyncio
+
+
+# Each frame's payload starts with the id of the call it belongs to.  Request
+# frames are typed with the index of the method called, and response frames
+# with one of the types below.
+_CALL_ID = struct.Struct('>I')
+_RESPONSE = 0
+_FAILURE = 1
+
+_BUFFER_SIZE = 65536
+
+
+class Controller(service.RpcController):
+
+  """RpcController for the channels and services of this module.
+
+  Calls are canceled by canceling their futures, so the cancellation methods
+  of RpcController are not implemented.
+  """
+
+  def __init__(self):
+    self.Reset()
+
+  def Reset(self):
+    self._error_text = None
+
+  def Failed(self):
+    return self._error_text is not None
+
+  def ErrorText(self):
+    return self._error_text
+
+  def SetFailed(self, reason):
+    self._error_text = reason
+
+
+class _CallProtocol(asyncio_framing.FrameProtocol):
+
+  """Sends and receives the frames of calls over a connection."""
+
+  def __init__(self, buffer_size, max_frame_size, loop):
+    asyncio_framing.FrameProtocol.__init__(
+        self, self._OnFrame, max_frame_size=max_frame_size, offload_size=None,
+        error_handler=self._OnStreamError, loop=loop)
+    self._buffer_size = buffer_size
+    self._writer = None
+    self._flush_handle = None
+
+  def connection_made(self, transport):
+    asyncio_framing.FrameProtocol.connection_made(self, transport)
+    self._writer = framing.FrameWriter(
+        transport, {}, buffer_size=self._buffer_size)
+
+  def connection_lost(self, exc):
+    asyncio_framing.FrameProtocol.connection_lost(self, exc)
+    self._writer = None
+    if self._flush_handle is not None:
+      self._flush_handle.cancel()
+      self._flush_handle = None
+
+  def _OnFrame(self, message_type, payload):
+    if len(payload) < _CALL_ID.size:
+      self._Fail(message.DecodeError('Frame too short to hold a call id.'))
+      return
+    call_id, = _CALL_ID.unpack_from(payload)
+    self._OnCallFrame(message_type, call_id, payload[_CALL_ID.size:])
+
+  def _OnCallFrame(self, message_type, call_id, payload):
+    raise NotImplementedError
+
+  def _OnStreamError(self, error):
+    pass
+
+  def _Send(self, message_type, call_id, payload):
+    """Sends a frame on the next pass of the event loop, with any others."""
+    self._writer.WriteFrame(message_type, _CALL_ID.pack(call_id) + payload)
+    if self._flush_handle is None:
+      self._flush_handle = self._loop.call_soon(self._Flush)
+
+  def _Flush(self):
+    self._flush_handle = None
+    if self._writer is not None:
+      self._writer.Flush()
+
+
+class RpcProtocol(_CallProtocol, service.RpcChannel):
+
+  """Client end of a connection to a ServiceProtocol, used as an RpcChannel.
+
+  Calls made while the connection is not open fail.  All calls in flight
+  fail when the connection is lost.
+  """
+
+  def __init__(self, buffer_size=_BUFFER_SIZE,
+               max_frame_size=framing.DEFAULT_MAX_FRAME_SIZE, loop=None):
+    """Args:
+      buffer_size: Requests are gathered into writes of up to this many bytes.
+      max_frame_size: The largest response payload accepted, or None for no
+        limit.
+      loop: The event loop.  Defaults to asyncio.get_event_loop().
+    """
+    _CallProtocol.__init__(self, buffer_size, max_frame_size, loop)
+    # Maps the id of each call in flight to its future, response class and
+    # controller.
+    self._calls = {}
+    self._next_call_id = 0
+    self._error_text = 'Not connected.'
+
+  def connection_made(self, transport):
+    _CallProtocol.connection_made(self, transport)
+    self._error_text = None
+
+  def connection_lost(self, exc):
+    _CallProtocol.connection_lost(self, exc)
+    if self._error_text is None:
+      self._error_text = 'Connection lost: %s' % (exc or 'closed')
+    calls = self._calls
+    self._calls = {}
+    for future, _, rpc_controller in calls.itervalues():
+      _FailCall(future, rpc_controller, self._error_text)
+
+  def CallMethod(self, method_descriptor, rpc_controller, request,
+                 response_class, done=None):
+    """Calls the method over the connection.
+
+    Returns:
+      A Future for the response.
+    """
+    future = _StartCall(self._loop, done)
+    if self._writer is None:
+      _FailCall(future, rpc_controller, self._error_text)
+      return future
+    payload = request.SerializeToString()
+    call_id = self._next_call_id
+    while call_id in self._calls:
+      call_id = (call_id + 1) & 0xffffffff
+    self._next_call_id = (call_id + 1) & 0xffffffff
+    self._calls[call_id] = (future, response_class, rpc_controller)
+    self._Send(method_descriptor.index, call_id, payload)
+    return future
+
+  def _OnCallFrame(self, message_type, call_id, payload):
+    call = self._calls.pop(call_id, None)
+    if call is None:
+      # The call was canceled, and its id may be reused.
+      return
+    future, response_class, rpc_controller = call
+    if future.cancelled():
+      return
+    if message_type != _RESPONSE:
+      _FailCall(future, rpc_controller, payload.decode('utf-8', 'replace'))
+      return
+    response = response_class()
+    try:
+      response.MergeFromString(payload)
+    except message.DecodeError, e:
+      _FailCall(future, rpc_controller, 'Failed to parse response: %s' % e)
+      return
+    future.set_result(response)
+
+  def _OnStreamError(self, error):
+    self._error_text = 'Bad response stream: %s' % error
+
+
+class ServiceProtocol(_CallProtocol):
+
+  """Serves a Service to the RpcProtocol at the other end of a connection.
+
+  Each request is passed to the service's CallMethod() as it arrives, with a
+  new Controller, and its response is sent when the method calls done.  A
+  method may call done later, so that other calls are served meanwhile.
+  """
+
+  def __init__(self, service_impl, buffer_size=_BUFFER_SIZE,
+               max_frame_size=framing.DEFAULT_MAX_FRAME_SIZE, loop=None):
+    """Args:
+      service_impl: The Service to call.
+      buffer_size: Responses are gathered into writes of up to this many
+        bytes.
+      max_frame_size: The largest request payload accepted, or None for no
+        limit.
+      loop: The event loop.  Defaults to asyncio.get_event_loop().
+    """
+    _CallProtocol.__init__(self, buffer_size, max_frame_size, loop)
+    self._service = service_impl
+    self._methods = service_impl.GetDescriptor().methods
+
+  def _OnCallFrame(self, method_index, call_id, payload):
+    if method_index >= len(self._methods):
+      self._Send(_FAILURE, call_id, 'Service %s has no method %d.' % (
+          self._service.GetDescriptor().full_name, method_index))
+      return
+    method = self._methods[method_index]
+    request = self._service.GetRequestClass(method)()
+    try:
+      request.MergeFromString(payload)
+    except message.DecodeError, e:
+      self._Send(_FAILURE, call_id, 'Failed to parse request: %s' % e)
+      return
+    _CallService(self._service, method, request,
+                 functools.partial(self._Respond, call_id))
+
+  def _Respond(self, call_id, error_text, response):
+    if self._writer is None:
+      return
+    if error_text is None:
+      self._Send(_RESPONSE, call_id, response.SerializeToString())
+    else:
+      if isinstance(error_text, unicode):
+        error_text = error_text.encode('utf-8')
+      self._Send(_FAILURE, call_id, error_text)
+
+
+class LoopbackRpcChannel(service.RpcChannel):
+
+  """RpcChannel calling a Service in the same process, for tests.
+
+  Requests and responses are copied through their serialized form, as they
+  would be over a connection, and the service is called on a later pass of
+  the event loop, so calls made together are in flight together.
+  """
+
+  def __init__(self, service_impl, loop=None):
+    """Args:
+      service_impl: The Service to call.
+      loop: The event loop.  Defaults to asyncio.get_event_loop().
+    """
+    self._service = service_impl
+    self._loop = loop or asyncio.get_event_loop()
+
+  def CallMethod(self, method_descriptor, rpc_controller, request,
+                 response_class, done=None):
+    """Calls the method in the same process.
+
+    Returns:
+      A Future for the response.
+    """
+    future = _StartCall(self._loop, done)
+    self._loop.call_soon(
+        self._Call, method_descriptor, request.SerializeToString(),
+        future, response_class, rpc_controller)
+    return future
+
+  def _Call(self, method, payload, future, response_class, rpc_controller):
+    if future.cancelled():
+      return
+    request = self._service.GetRequestClass(method)()
+    request.MergeFromString(payload)
+    _CallService(self._service, method, request, functools.partial(
+        self._Respond, future, response_class, rpc_controller))
+
+  def _Respond(self, future, response_class, rpc_controller, error_text,
+               response):
+    if future.done():
+      return
+    if error_text is not None:
+      _FailCall(future, rpc_controller, error_text)
+      return
+    future.set_result(response_class.FromString(response.SerializeToString()))
+
+
+def _StartCall(loop, done):
+  """Returns the future for a call, which is passed on to done if given."""
+  future = asyncio.Future(loop=loop)
+  if done is not None:
+    future.add_done_callback(functools.partial(_CallDone, done))
+  return future
+
+
+def _CallDone(done, future):
+  if future.cancelled() or future.exception() is not None:
+    done(None)
+  else:
+    done(future.result())
+
+
+def _FailCall(future, rpc_controller, error_text):
+  if rpc_controller is not None:
+    rpc_controller.SetFailed(error_text)
+  if not future.done():
+    future.set_exception(service.RpcException(error_text))
+
+
+def _CallService(service_impl, method, request, respond):
+  """Calls a method of service_impl with a new Controller.
+
+  respond is called once, with the error text of a failed call and None, or
+  with None and the response.
+  """
+  controller = Controller()
+  responded = []
+
+  def Done(response):
+    if responded:
+      return
+    responded.append(True)
+    if controller.Failed():
+      respond(controller.ErrorText(), None)
+    elif response is None:
+      respond('Method %s gave no response.' % method.full_name, None)
+    else:
+      respond(None, response)
+
+  try:
+    service_impl.CallMethod(method, controller, request, Done)
+  except Exception, e:
+    controller.SetFailed('Method %s raised %s: %s' % (
+        method.full_name, e.__class__.__name__, e))
+    Done(None)
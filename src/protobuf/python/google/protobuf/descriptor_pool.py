@@ -53,7 +53,6 @@ decoded.
 
 __author__ = 'matthewtoia@google.com (Matt Toia)'
 
-from google.protobuf import descriptor_pb2
 from google.protobuf import descriptor
 from google.protobuf import descriptor_database
 
@@ -76,9 +75,14 @@ class DescriptorPool(object):
 
     self._internal_db = descriptor_database.DescriptorDatabase()
     self._descriptor_db = descriptor_db
+    # Every message and enum type in the pool, by full name.
     self._descriptors = {}
     self._enum_descriptors = {}
     self._file_descriptors = {}
+    # For each converted file, the names of its direct and indirect
+    # dependencies, and the symbols it contributes to its dependents' scopes.
+    self._file_dependencies = {}
+    self._file_scopes = {}
 
   def Add(self, file_desc_proto):
     """Adds the FileDescriptorProto and its types to this pool.
@@ -102,6 +106,8 @@ class DescriptorPool(object):
       KeyError: if the file can not be found in the pool.
     """
 
+    if file_name in self._file_descriptors:
+      return self._file_descriptors[file_name]
     try:
       file_proto = self._internal_db.FindFileByName(file_name)
     except KeyError as error:
@@ -147,6 +153,8 @@ class DescriptorPool(object):
       The descriptor for the named type.
     """
 
+    if full_name in self._descriptors:
+      return self._descriptors[full_name]
     full_name = full_name.lstrip('.')  # fix inconsistent qualified name formats
     if full_name not in self._descriptors:
       self.FindFileContainingSymbol(full_name)
@@ -162,6 +170,8 @@ class DescriptorPool(object):
       The enum descriptor for the named type.
     """
 
+    if full_name in self._enum_descriptors:
+      return self._enum_descriptors[full_name]
     full_name = full_name.lstrip('.')  # fix inconsistent qualified name formats
     if full_name not in self._enum_descriptors:
       self.FindFileContainingSymbol(full_name)
@@ -187,27 +197,11 @@ class DescriptorPool(object):
           options=file_proto.options,
           serialized_pb=file_proto.SerializeToString())
       scope = {}
-      dependencies = list(self._GetDeps(file_proto))
+      dependencies = self._GetDeps(file_proto)
 
+      # Each dependency's symbols were collected when it was converted.
       for dependency in dependencies:
-        dep_desc = self.FindFileByName(dependency.name)
-        dep_proto = descriptor_pb2.FileDescriptorProto.FromString(
-            dep_desc.serialized_pb)
-        package = '.' + dep_proto.package
-        package_prefix = package + '.'
-
-        def _strip_package(symbol):
-          if symbol.startswith(package_prefix):
-            return symbol[len(package_prefix):]
-          return symbol
-
-        symbols = list(self._ExtractSymbols(dep_proto.message_type, package))
-        scope.update(symbols)
-        scope.update((_strip_package(k), v) for k, v in symbols)
-
-        symbols = list(self._ExtractEnums(dep_proto.enum_type, package))
-        scope.update(symbols)
-        scope.update((_strip_package(k), v) for k, v in symbols)
+        scope.update(self._file_scopes[dependency])
 
       for message_type in file_proto.message_type:
         message_desc = self._ConvertMessageDescriptor(
@@ -224,9 +218,40 @@ class DescriptorPool(object):
         file_descriptor.message_types_by_name[desc_proto.name] = desc
       self.Add(file_proto)
       self._file_descriptors[file_proto.name] = file_descriptor
+      self._file_dependencies[file_proto.name] = dependencies
+      self._file_scopes[file_proto.name] = self._MakeFileScope(file_proto)
 
     return self._file_descriptors[file_proto.name]
 
+  def _MakeFileScope(self, file_proto):
+    """Collects the symbols a converted file adds to its dependents' scopes.
+
+    Args:
+      file_proto: The proto of the file, which must already be converted.
+
+    Returns:
+      A dict mapping each message and enum type in the file to its descriptor,
+      both by its full name and by its name relative to the file's package.
+    """
+
+    package = '.' + file_proto.package
+    package_prefix = package + '.'
+
+    def _strip_package(symbol):
+      if symbol.startswith(package_prefix):
+        return symbol[len(package_prefix):]
+      return symbol
+
+    scope = {}
+    symbols = list(self._ExtractSymbols(file_proto.message_type, package))
+    scope.update(symbols)
+    scope.update((_strip_package(k), v) for k, v in symbols)
+
+    symbols = list(self._ExtractEnums(file_proto.enum_type, package))
+    scope.update(symbols)
+    scope.update((_strip_package(k), v) for k, v in symbols)
+    return scope
+
   def _ConvertMessageDescriptor(self, desc_proto, package=None, file_desc=None,
                                 scope=None):
     """Adds the proto to the pool in the specified package.
@@ -511,17 +536,21 @@ class DescriptorPool(object):
   def _GetDeps(self, file_proto):
     """Recursively finds dependencies for file protos.
 
+    Converts each dependency not yet in the pool.
+
     Args:
       file_proto: The proto to get dependencies from.
 
-    Yields:
-      Each direct and indirect dependency.
+    Returns:
+      The names of each direct and indirect dependency, once each.
     """
 
+    dependencies = []
+    seen = set()
     for dependency in file_proto.dependency:
-      dep_desc = self.FindFileByName(dependency)
-      dep_proto = descriptor_pb2.FileDescriptorProto.FromString(
-          dep_desc.serialized_pb)
-      yield dep_proto
-      for parent_dep in self._GetDeps(dep_proto):
-        yield parent_dep
+      self.FindFileByName(dependency)
+      for name in [dependency] + self._file_dependencies[dependency]:
+        if name not in seen:
+          seen.add(name)
+          dependencies.append(name)
+    return dependencies
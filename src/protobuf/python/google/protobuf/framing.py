@@ -0,0 +1,292 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Reads and writes streams of framed protocol messages.
+
+Each frame is a fixed-size header followed by a serialized message.  The
+header holds the length of the message and a number identifying its type,
+packed with a struct format string, in that order.  The default header is the
+one used between rippled peers: a 4-byte big-endian payload length followed by
+a 2-byte big-endian MessageType from ripple.proto.
+
+The caller supplies a dict mapping type numbers to message classes:
+
+  classes = {ripple_pb2.mtPING: ripple_pb2.TMPing, ...}
+  for message_type, msg in framing.ReadFrames(open(path, 'rb'), classes):
+    ...
+
+Input is consumed in chunks, so only the frame being decoded is held in
+memory, and FrameWriter gathers small frames into large writes.
+"""
+
+import cStringIO
+import struct
+
+from google.protobuf import message
+
+
+# Payload length and MessageType, as written by rippled's overlay.
+DEFAULT_HEADER_FORMAT = '>IH'
+
+# The largest payload accepted unless the caller says otherwise.  A corrupt or
+# hostile header could otherwise make a decoder buffer up to 4 GiB.
+DEFAULT_MAX_FRAME_SIZE = 64 << 20
+
+_CHUNK_SIZE = 65536
+
+
+def _StrFromBuffer(data):
+  """Returns the bytes of a str, buffer, bytearray or memoryview as a str."""
+  if data.__class__ is str:
+    return data
+  if isinstance(data, memoryview):
+    return data.tobytes()
+  return str(data)
+
+
+class FrameDecoder(object):
+
+  """Splits a byte stream into frames, which may arrive in any pieces.
+
+  Bytes are passed to Feed() as they arrive and complete frames are returned
+  from it.  Pieces are only joined once they hold a whole frame, so a large
+  frame arriving in many small pieces is copied a constant number of times.
+  """
+
+  def __init__(self, message_classes=None, header_format=DEFAULT_HEADER_FORMAT,
+               max_frame_size=DEFAULT_MAX_FRAME_SIZE):
+    """Args:
+      message_classes: Dict mapping message type numbers to message classes.
+        Frames of other types are returned undecoded.
+      header_format: struct format of the frame header.  It must unpack to
+        the payload length and the message type.
+      max_frame_size: The largest payload accepted.  A header announcing a
+        larger payload raises message.DecodeError.  None accepts payloads of
+        any size.
+    """
+    self._message_classes = message_classes or {}
+    self._header = struct.Struct(header_format)
+    self._max_frame_size = max_frame_size
+    self._pieces = []
+    self._buffered = 0
+    # Number of buffered bytes needed before another frame can be returned.
+    self._wanted = self._header.size
+
+  def BytesWanted(self):
+    """Returns the number of bytes still missing from the current frame.
+
+    This is a lower bound when the frame's header has not arrived yet.
+    """
+    return self._wanted - self._buffered
+
+  def Feed(self, data):
+    """Adds bytes from the stream.
+
+    Args:
+      data: The next bytes of the stream, as a str, buffer, bytearray or
+        memoryview.
+
+    Returns:
+      A list of (message_type, payload) pairs for the frames completed by
+      data, in stream order.  payload is the undecoded message as a str.
+
+    Raises:
+      message.DecodeError: A frame exceeds max_frame_size.
+    """
+    if not data:
+      return []
+    self._pieces.append(_StrFromBuffer(data))
+    self._buffered += len(data)
+    if self._buffered < self._wanted:
+      return []
+
+    buf = ''.join(self._pieces)
+    end = len(buf)
+    header_size = self._header.size
+    unpack_from = self._header.unpack_from
+    max_frame_size = self._max_frame_size
+    frames = []
+    pos = 0
+    wanted = header_size
+    while end - pos >= header_size:
+      size, message_type = unpack_from(buf, pos)
+      if max_frame_size is not None and size > max_frame_size:
+        raise message.DecodeError(
+            'Frame of %d bytes exceeds the limit of %d.' %
+            (size, max_frame_size))
+      start = pos + header_size
+      frame_end = start + size
+      if frame_end > end:
+        wanted = frame_end - pos
+        break
+      frames.append((message_type, buf[start:frame_end]))
+      pos = frame_end
+
+    if pos == end:
+      self._pieces = []
+    elif pos == 0:
+      self._pieces = [buf]
+    else:
+      self._pieces = [buf[pos:]]
+    self._buffered = end - pos
+    self._wanted = wanted
+    return frames
+
+  def Finish(self):
+    """Checks that the stream did not end in the middle of a frame.
+
+    Raises:
+      message.DecodeError: Bytes of an incomplete frame are buffered.
+    """
+    if self._buffered:
+      raise message.DecodeError(
+          'Stream ended inside a frame (%d of %d bytes).' %
+          (self._buffered, self._wanted))
+
+  def DecodeFrame(self, message_type, payload):
+    """Parses the payload of a frame returned by Feed().
+
+    Returns:
+      A (message_type, message) pair.  If message_type has no class in
+      message_classes, the payload is returned in place of the message.
+    """
+    message_class = self._message_classes.get(message_type)
+    if message_class is None:
+      return message_type, payload
+    msg = message_class()
+    msg.MergeFromString(payload)
+    return message_type, msg
+
+
+def _ReadFunction(source):
+  if hasattr(source, 'read'):
+    return source.read
+  if hasattr(source, 'recv'):
+    return source.recv
+  # An in-memory buffer.  cStringIO reads it without copying it first.
+  return cStringIO.StringIO(source).read
+
+
+def ReadFrames(source, message_classes=None,
+               header_format=DEFAULT_HEADER_FORMAT,
+               max_frame_size=DEFAULT_MAX_FRAME_SIZE, chunk_size=_CHUNK_SIZE):
+  """Decodes the frames of a stream, one at a time.
+
+  Args:
+    source: A file-like object with a read() method, a socket, or a str,
+      buffer, bytearray, memoryview or mmap holding the whole stream.
+    message_classes: Dict mapping message type numbers to message classes.
+    header_format: struct format of the frame header; see FrameDecoder.
+    max_frame_size: The largest payload accepted, or None for no limit; see
+      FrameDecoder.
+    chunk_size: Number of bytes to read from source at a time.
+
+  Yields:
+    (message_type, message) pairs, in stream order.  Frames of types missing
+    from message_classes yield their payload as a str instead.
+
+  Raises:
+    message.DecodeError: The stream is not a valid sequence of frames.
+  """
+  decoder = FrameDecoder(message_classes, header_format, max_frame_size)
+  read = _ReadFunction(source)
+  decode_frame = decoder.DecodeFrame
+  while True:
+    # Read a large frame in as few calls as possible.
+    data = read(max(chunk_size, decoder.BytesWanted()))
+    if not data:
+      break
+    for message_type, payload in decoder.Feed(data):
+      yield decode_frame(message_type, payload)
+  decoder.Finish()
+
+
+class FrameWriter(object):
+
+  """Writes messages to a stream as frames.
+
+  Frames smaller than buffer_size are held back and written together, so
+  Flush() must be called once the last message has been written.  Larger
+  frames are written straight through.
+  """
+
+  def __init__(self, sink, message_classes, header_format=DEFAULT_HEADER_FORMAT,
+               buffer_size=_CHUNK_SIZE):
+    """Args:
+      sink: A file-like object with a write() method, or a socket.
+      message_classes: Dict mapping message type numbers to message classes.
+      header_format: struct format of the frame header; see FrameDecoder.
+      buffer_size: Number of bytes to gather before writing to sink.
+    """
+    if hasattr(sink, 'write'):
+      self._write = sink.write
+    else:
+      self._write = sink.sendall
+    self._message_types = dict(
+        (message_class, message_type)
+        for message_type, message_class in message_classes.iteritems())
+    self._header = struct.Struct(header_format)
+    self._buffer_size = buffer_size
+    self._pending = []
+    self._pending_size = 0
+
+  def Write(self, msg):
+    """Writes a message, framed with the type number of its class.
+
+    Raises:
+      message.EncodeError: The message's class has no type number, or the
+        message is not initialized.
+    """
+    message_type = self._message_types.get(msg.__class__)
+    if message_type is None:
+      raise message.EncodeError(
+          'No message type for %s.' % msg.DESCRIPTOR.full_name)
+    self.WriteFrame(message_type, msg.SerializeToString())
+
+  def WriteFrame(self, message_type, payload):
+    """Writes an already serialized message."""
+    header = self._header.pack(len(payload), message_type)
+    size = len(header) + len(payload)
+    if self._pending_size + size > self._buffer_size:
+      self.Flush()
+    if size >= self._buffer_size:
+      self._write(header)
+      self._write(payload)
+    else:
+      self._pending.append(header)
+      self._pending.append(payload)
+      self._pending_size += size
+
+  def Flush(self):
+    """Writes out any frames held back by Write() and WriteFrame()."""
+    if self._pending:
+      self._write(''.join(self._pending))
+      self._pending = []
+      self._pending_size = 0
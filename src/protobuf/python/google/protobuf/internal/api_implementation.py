@@ -74,6 +74,63 @@ if _implementation_version_str not in ('1', '2'):
 _implementation_version = int(_implementation_version_str)
 
 
+# This environment variable can be used to switch the pure-Python
+# implementation between its parse engines.  'default' looks up a decoder
+# closure for every field; 'table' uses the table-driven engine in
+# table_decoder.py.  It has no effect on the 'cpp' implementation.
+_parser_type = os.getenv('PROTOCOL_BUFFERS_PYTHON_PARSER', 'default')
+
+
+if _parser_type not in ('default', 'table'):
+  raise ValueError(
+      "unsupported PROTOCOL_BUFFERS_PYTHON_PARSER: '" +
+      _parser_type + "' (supported parsers: default, table)"
+      )
+
+
+# This environment variable selects which message fields the pure-Python
+# implementation parses lazily, i.e. keeps in encoded form until they are
+# first accessed.  'none' parses everything up front; 'hint' defers fields
+# declared with [lazy = true]; 'all' defers every non-extension message field.
+_lazy_parsing = os.getenv('PROTOCOL_BUFFERS_PYTHON_LAZY_PARSING', 'none')
+
+
+if _lazy_parsing not in ('none', 'hint', 'all'):
+  raise ValueError(
+      "unsupported PROTOCOL_BUFFERS_PYTHON_LAZY_PARSING: '" +
+      _lazy_parsing + "' (supported modes: none, hint, all)"
+      )
+
+
+# This environment variable controls when the pure-Python implementation
+# builds the encoders, decoders, properties and methods of a message class.
+# 'eager' builds them when the class is created, i.e. when its module is
+# imported; 'lazy' waits until the first instance of the class is created or
+# the class is asked for an attribute it does not have yet.
+_class_setup = os.getenv('PROTOCOL_BUFFERS_PYTHON_CLASS_SETUP', 'eager')
+
+
+if _class_setup not in ('eager', 'lazy'):
+  raise ValueError(
+      "unsupported PROTOCOL_BUFFERS_PYTHON_CLASS_SETUP: '" +
+      _class_setup + "' (supported modes: eager, lazy)"
+      )
+
+
+# This environment variable selects how the pure-Python implementation stores
+# the fields of a message instance.  'dict' keeps them in a per-instance dict
+# keyed by FieldDescriptor; 'slots' gives every declared field its own slot,
+# with a bitmap of the fields which are set, and only needs a dict once an
+# extension is set.
+_class_layout = os.getenv('PROTOCOL_BUFFERS_PYTHON_CLASS_LAYOUT', 'dict')
+
+
+if _class_layout not in ('dict', 'slots'):
+  raise ValueError(
+      "unsupported PROTOCOL_BUFFERS_PYTHON_CLASS_LAYOUT: '" +
+      _class_layout + "' (supported layouts: dict, slots)"
+      )
+
 
 # Usage of this function is discouraged. Clients shouldn't care which
 # implementation of the API is in use. Note that there is no guarantee
@@ -85,3 +142,19 @@ def Type():
 # See comment on 'Type' above.
 def Version():
   return _implementation_version
+
+# See comment on 'Type' above.
+def ParserType():
+  return _parser_type
+
+# See comment on 'Type' above.
+def LazyParsing():
+  return _lazy_parsing
+
+# See comment on 'Type' above.
+def ClassSetup():
+  return _class_setup
+
+# See comment on 'Type' above.
+def ClassLayout():
+  return _class_layout
@@ -0,0 +1,157 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.asyncio_framing."""
+
+import cStringIO
+import socket
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf import framing
+from google.protobuf import message
+
+try:
+  from google.protobuf import asyncio_framing
+except ImportError:
+  # Neither asyncio nor trollius is installed.
+  asyncio_framing = None
+
+
+_CLASSES = {
+    1: unittest_pb2.TestAllTypes,
+    2: unittest_pb2.ForeignMessage,
+}
+
+
+if asyncio_framing is not None:
+  asyncio = asyncio_framing.asyncio
+
+  class _RecordingProtocol(asyncio_framing.FrameProtocol):
+
+    def __init__(self, done, **kwargs):
+      self.messages = []
+      self.errors = []
+      self.done = done
+      asyncio_framing.FrameProtocol.__init__(
+          self, self._OnMessage, error_handler=self.errors.append, **kwargs)
+
+    def _OnMessage(self, message_type, msg):
+      self.messages.append((message_type, msg))
+
+    def connection_lost(self, exc):
+      asyncio_framing.FrameProtocol.connection_lost(self, exc)
+      if not self.done.done():
+        self.done.set_result(None)
+
+
+@unittest.skipIf(asyncio_framing is None, 'requires asyncio or trollius')
+class AsyncioFramingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.all_types = unittest_pb2.TestAllTypes()
+    self.all_types.optional_int32 = 101
+    self.all_types.repeated_string.append('x' * 300)
+    self.foreign = unittest_pb2.ForeignMessage(c=7)
+
+  def tearDown(self):
+    self.loop.close()
+
+  def _Encode(self, messages):
+    out = cStringIO.StringIO()
+    writer = framing.FrameWriter(out, _CLASSES)
+    for msg in messages:
+      writer.Write(msg)
+    writer.Flush()
+    return out.getvalue()
+
+  def _Receive(self, data, **kwargs):
+    """Sends data over a socket pair and returns the receiving protocol."""
+    ours, theirs = socket.socketpair()
+    theirs.sendall(data)
+    theirs.close()
+    done = asyncio.Future(loop=self.loop)
+    protocol = _RecordingProtocol(
+        done, message_classes=_CLASSES, loop=self.loop, **kwargs)
+    self.loop.run_until_complete(
+        self.loop.create_connection(lambda: protocol, sock=ours))
+    self.loop.run_until_complete(done)
+    return protocol
+
+  def testDecodeOnLoop(self):
+    messages = [self.all_types, self.foreign]
+    protocol = self._Receive(self._Encode(messages), offload_size=None)
+    self.assertEqual([(1, self.all_types), (2, self.foreign)],
+                     protocol.messages)
+    self.assertEqual([], protocol.errors)
+
+  def testOffloadedFramesKeepOrder(self):
+    messages = [self.foreign, self.all_types, self.foreign, self.all_types,
+                self.foreign]
+    protocol = self._Receive(self._Encode(messages), offload_size=100)
+    self.assertEqual(messages, [msg for _, msg in protocol.messages])
+    self.assertEqual([2, 1, 2, 1, 2],
+                     [message_type for message_type, _ in protocol.messages])
+    self.assertEqual([], protocol.errors)
+
+  def testPausesReading(self):
+    messages = [self.all_types] * 10 + [self.foreign]
+    protocol = self._Receive(self._Encode(messages), offload_size=100,
+                             max_pending=2)
+    self.assertEqual(messages, [msg for _, msg in protocol.messages])
+
+  def testTruncatedStream(self):
+    data = self._Encode([self.foreign, self.all_types])
+    protocol = self._Receive(data[:-1])
+    self.assertEqual([(2, self.foreign)], protocol.messages)
+    self.assertEqual(1, len(protocol.errors))
+    self.assertTrue(isinstance(protocol.errors[0], message.DecodeError))
+
+  def testOversizedFrame(self):
+    data = self._Encode([self.all_types])
+    protocol = self._Receive(data, max_frame_size=100)
+    self.assertEqual([], protocol.messages)
+    self.assertEqual(1, len(protocol.errors))
+
+  def testUndecodablePayload(self):
+    data = self._Encode([self.all_types])
+    # Cut the repeated_string length-delimited value short.
+    data = data[:3] + chr(ord(data[3]) - 1) + data[4:-1]
+    for offload_size in (None, 1):
+      protocol = self._Receive(data, offload_size=offload_size)
+      self.assertEqual([], protocol.messages)
+      self.assertEqual(1, len(protocol.errors))
+      self.assertTrue(isinstance(protocol.errors[0], message.DecodeError))
+
+
+if __name__ == '__main__':
+  unittest.main()
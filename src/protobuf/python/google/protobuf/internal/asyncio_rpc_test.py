@@ -0,0 +1,190 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.asyncio_rpc."""
+
+import socket
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf import framing
+from google.protobuf import service
+
+try:
+  from google.protobuf import asyncio_rpc
+except ImportError:
+  # Neither asyncio nor trollius is installed.
+  asyncio_rpc = None
+
+
+class _HeldService(unittest_pb2.TestService):
+
+  """Holds the done callbacks of Foo calls until the test answers them."""
+
+  def __init__(self, loop, expected_calls):
+    self.held = []
+    self.all_held = asyncio.Future(loop=loop)
+    self._expected_calls = expected_calls
+
+  def Foo(self, rpc_controller, request, done):
+    self.held.append((rpc_controller, done))
+    if len(self.held) == self._expected_calls:
+      self.all_held.set_result(None)
+
+  def Bar(self, rpc_controller, request, done):
+    raise ValueError('no bar')
+
+
+if asyncio_rpc is not None:
+  asyncio = asyncio_rpc.asyncio
+
+  class _RecordingTransport(asyncio.Transport):
+
+    def __init__(self):
+      asyncio.Transport.__init__(self)
+      self.writes = []
+
+    def write(self, data):
+      self.writes.append(data)
+
+
+@unittest.skipIf(asyncio_rpc is None, 'requires asyncio or trollius')
+class AsyncioRpcTest(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def _Connect(self, service_impl):
+    """Returns the client RpcProtocol of a connection to service_impl."""
+    ours, theirs = socket.socketpair()
+    self.server = asyncio_rpc.ServiceProtocol(service_impl, loop=self.loop)
+    client = asyncio_rpc.RpcProtocol(loop=self.loop)
+    self.loop.run_until_complete(
+        self.loop.create_connection(lambda: self.server, sock=theirs))
+    self.loop.run_until_complete(
+        self.loop.create_connection(lambda: client, sock=ours))
+    return client
+
+  def _Wait(self, futures):
+    self.loop.run_until_complete(asyncio.wait(futures, loop=self.loop))
+
+  def _CheckPipelinedCalls(self, channel, service_impl):
+    stub = unittest_pb2.TestService_Stub(channel)
+    controllers = [asyncio_rpc.Controller() for _ in range(4)]
+    futures = [stub.Foo(controller, unittest_pb2.FooRequest())
+               for controller in controllers]
+    self.loop.run_until_complete(service_impl.all_held)
+
+    # Answer the calls in reverse order, failing every other one.
+    for i, (rpc_controller, done) in reversed(list(
+        enumerate(service_impl.held))):
+      if i % 2:
+        rpc_controller.SetFailed('call %d failed' % i)
+        done(None)
+      else:
+        done(unittest_pb2.FooResponse())
+    self._Wait(futures)
+
+    for i, future in enumerate(futures):
+      if i % 2:
+        self.assertRaises(service.RpcException, future.result)
+        self.assertEqual('call %d failed' % i, controllers[i].ErrorText())
+      else:
+        self.assertTrue(isinstance(future.result(), unittest_pb2.FooResponse))
+        self.assertFalse(controllers[i].Failed())
+
+  def testPipelinedCallsOverConnection(self):
+    service_impl = _HeldService(self.loop, 4)
+    self._CheckPipelinedCalls(self._Connect(service_impl), service_impl)
+
+  def testPipelinedCallsOverLoopback(self):
+    service_impl = _HeldService(self.loop, 4)
+    self._CheckPipelinedCalls(
+        asyncio_rpc.LoopbackRpcChannel(service_impl, loop=self.loop),
+        service_impl)
+
+  def testFailedMethods(self):
+    for channel in (
+        asyncio_rpc.LoopbackRpcChannel(_HeldService(self.loop, 1),
+                                       loop=self.loop),
+        self._Connect(_HeldService(self.loop, 1)),
+        asyncio_rpc.LoopbackRpcChannel(unittest_pb2.TestService(),
+                                       loop=self.loop)):
+      stub = unittest_pb2.TestService_Stub(channel)
+      controller = asyncio_rpc.Controller()
+      responses = []
+      future = stub.Bar(controller, unittest_pb2.BarRequest(),
+                        responses.append)
+      self._Wait([future])
+      self.assertRaises(service.RpcException, future.result)
+      self.assertTrue(controller.Failed())
+      self.assertTrue(controller.ErrorText() in (
+          'Method protobuf_unittest.TestService.Bar raised ValueError: no bar',
+          'Method Bar not implemented.'))
+      self.assertEqual([None], responses)
+
+  def testConnectionLost(self):
+    service_impl = _HeldService(self.loop, 1)
+    client = self._Connect(service_impl)
+    stub = unittest_pb2.TestService_Stub(client)
+    future = stub.Foo(asyncio_rpc.Controller(), unittest_pb2.FooRequest())
+    self.loop.run_until_complete(service_impl.all_held)
+    self.server._transport.close()
+    self._Wait([future])
+    self.assertRaises(service.RpcException, future.result)
+
+    # The server's response is dropped, and later calls fail at once.
+    service_impl.held[0][1](unittest_pb2.FooResponse())
+    future = stub.Foo(asyncio_rpc.Controller(), unittest_pb2.FooRequest())
+    self.assertTrue(future.done())
+    self.assertRaises(service.RpcException, future.result)
+
+  def testRequestsAreWrittenTogether(self):
+    client = asyncio_rpc.RpcProtocol(loop=self.loop)
+    transport = _RecordingTransport()
+    client.connection_made(transport)
+    stub = unittest_pb2.TestService_Stub(client)
+    stub.Foo(None, unittest_pb2.FooRequest())
+    stub.Bar(None, unittest_pb2.BarRequest())
+    stub.Foo(None, unittest_pb2.FooRequest())
+    self.assertEqual([], transport.writes)
+    self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+    self.assertEqual(1, len(transport.writes))
+    frames = framing.FrameDecoder().Feed(transport.writes[0])
+    self.assertEqual([(0, '\0\0\0\0'), (1, '\0\0\0\1'), (0, '\0\0\0\2')],
+                     frames)
+
+
+if __name__ == '__main__':
+  unittest.main()
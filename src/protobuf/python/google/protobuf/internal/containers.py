@@ -35,12 +35,16 @@ buffer field types which need extra maintenance. Currently these categories
 are:
   - Repeated scalar fields - These are all repeated fields which aren't
     composite (e.g. they are of simple types like int32, string, etc).
+    Numeric ones are stored in an array.array rather than a list, so their
+    values read back converted to the field's numeric type.
   - Repeated composite fields - Repeated fields which are composite. This
     includes groups and nested messages.
 """
 
 __author__ = 'petar@google.com (Petar Petrov)'
 
+import array
+
 
 class BaseContainer(object):
 
@@ -85,6 +89,7 @@ class BaseContainer(object):
     if 'sort_function' in kwargs:
       kwargs['cmp'] = kwargs.pop('sort_function')
     self._values.sort(*args, **kwargs)
+    self._message_listener.Modified()
 
 
 class RepeatedScalarFieldContainer(BaseContainer):
@@ -92,7 +97,7 @@ class RepeatedScalarFieldContainer(BaseContainer):
   """Simple, type-checked, list-like container for holding repeated scalars."""
 
   # Disallows assignment to other attributes.
-  __slots__ = ['_type_checker']
+  __slots__ = ['_type_checker', '_shared']
 
   def __init__(self, message_listener, type_checker):
     """
@@ -105,10 +110,27 @@ class RepeatedScalarFieldContainer(BaseContainer):
     """
     super(RepeatedScalarFieldContainer, self).__init__(message_listener)
     self._type_checker = type_checker
+    # Whether _values may be shared with another container; see
+    # _ShareValues().
+    self._shared = False
+
+  def _ShareValues(self, other):
+    """Makes this container hold the same values as |other| without copying
+    them.  Whichever of the two is modified first copies the values then.
+    """
+    self._values = other._values
+    self._shared = other._shared = True
+
+  def _CopyOnWrite(self):
+    """Gives this container its own copy of values shared by _ShareValues()."""
+    self._values = self._values[:]
+    self._shared = False
 
   def append(self, value):
     """Appends an item to the list. Similar to list.append()."""
     self._type_checker.CheckValue(value)
+    if self._shared:
+      self._CopyOnWrite()
     self._values.append(value)
     if not self._message_listener.dirty:
       self._message_listener.Modified()
@@ -116,6 +138,8 @@ class RepeatedScalarFieldContainer(BaseContainer):
   def insert(self, key, value):
     """Inserts the item at the specified position. Similar to list.insert()."""
     self._type_checker.CheckValue(value)
+    if self._shared:
+      self._CopyOnWrite()
     self._values.insert(key, value)
     if not self._message_listener.dirty:
       self._message_listener.Modified()
@@ -129,6 +153,8 @@ class RepeatedScalarFieldContainer(BaseContainer):
     for elem in elem_seq:
       self._type_checker.CheckValue(elem)
       new_values.append(elem)
+    if self._shared:
+      self._CopyOnWrite()
     self._values.extend(new_values)
     self._message_listener.Modified()
 
@@ -136,17 +162,32 @@ class RepeatedScalarFieldContainer(BaseContainer):
     """Appends the contents of another repeated field of the same type to this
     one. We do not check the types of the individual fields.
     """
+    if self._shared:
+      self._CopyOnWrite()
     self._values.extend(other._values)
     self._message_listener.Modified()
 
+  def _ExtendUnchecked(self, elem_seq):
+    """Like extend(), but for values which are already known to be valid, such
+    as values the decoder has just read, so they are not type-checked."""
+    if self._shared:
+      self._CopyOnWrite()
+    self._values.extend(elem_seq)
+    if not self._message_listener.dirty:
+      self._message_listener.Modified()
+
   def remove(self, elem):
     """Removes an item from the list. Similar to list.remove()."""
+    if self._shared:
+      self._CopyOnWrite()
     self._values.remove(elem)
     self._message_listener.Modified()
 
   def __setitem__(self, key, value):
     """Sets the item on the specified position."""
     self._type_checker.CheckValue(value)
+    if self._shared:
+      self._CopyOnWrite()
     self._values[key] = value
     self._message_listener.Modified()
 
@@ -160,19 +201,30 @@ class RepeatedScalarFieldContainer(BaseContainer):
     for value in values:
       self._type_checker.CheckValue(value)
       new_values.append(value)
+    if self._shared:
+      self._CopyOnWrite()
     self._values[start:stop] = new_values
     self._message_listener.Modified()
 
   def __delitem__(self, key):
     """Deletes the item at the specified position."""
+    if self._shared:
+      self._CopyOnWrite()
     del self._values[key]
     self._message_listener.Modified()
 
   def __delslice__(self, start, stop):
     """Deletes the subset of items from between the specified indices."""
+    if self._shared:
+      self._CopyOnWrite()
     del self._values[start:stop]
     self._message_listener.Modified()
 
+  def sort(self, *args, **kwargs):
+    if self._shared:
+      self._CopyOnWrite()
+    super(RepeatedScalarFieldContainer, self).sort(*args, **kwargs)
+
   def __eq__(self, other):
     """Compares the current instance with another one."""
     if self is other:
@@ -184,6 +236,112 @@ class RepeatedScalarFieldContainer(BaseContainer):
     return other == self._values
 
 
+class RepeatedNumericFieldContainer(RepeatedScalarFieldContainer):
+
+  """RepeatedScalarFieldContainer for integer and floating-point fields, which
+  keeps its values unboxed in an array.array instead of a list.
+
+  It behaves like a list of numbers, just as RepeatedScalarFieldContainer
+  does; slices in particular are lists.  extend() checks all of the new values
+  at once: array.array does the range checking while converting them, and
+  the type checker only needs to see one value of each type.
+
+  Unlike a list, it does not keep the objects it is given: a value reads back
+  as the array's item type, whichever numeric type it was added as.  Values of
+  float and double fields read back as floats (append(1) reads back as 1.0),
+  values of uint32 and uint64 fields as longs, and those of the other integer
+  and enum fields as ints.  True and False read back as 1 and 0.
+  """
+
+  # Disallows assignment to other attributes.
+  __slots__ = []
+
+  def __init__(self, message_listener, type_checker, typecode):
+    """
+    Args:
+      message_listener: A MessageListener implementation.
+        The RepeatedNumericFieldContainer will call this object's
+        Modified() method when it is modified.
+      type_checker: A type_checkers.ValueChecker instance to run on elements
+        inserted into this container.
+      typecode: The array.array typecode to store the elements with.  Its
+        range must be that of the field's type; see
+        type_checkers.CPPTYPE_TO_ARRAY_TYPECODE.
+    """
+    super(RepeatedNumericFieldContainer, self).__init__(message_listener,
+                                                        type_checker)
+    self._values = array.array(typecode)
+
+  def _CheckedArray(self, elem_seq):
+    """Returns the values in elem_seq as an array, checking all of them."""
+    if not isinstance(elem_seq, (list, tuple, array.array)):
+      elem_seq = list(elem_seq)
+    # Type-check the first value of each type.
+    types = map(type, elem_seq)
+    for value_type in set(types):
+      self._type_checker.CheckValue(elem_seq[types.index(value_type)])
+    try:
+      return array.array(self._values.typecode, elem_seq)
+    except OverflowError:
+      # Report the value which is out of range as the type checker would.
+      for value in elem_seq:
+        self._type_checker.CheckValue(value)
+      raise
+
+  def extend(self, elem_seq):
+    """Extends by appending the given sequence. Similar to list.extend()."""
+    if not elem_seq:
+      return
+
+    if self._shared:
+      self._CopyOnWrite()
+    self._values.extend(self._CheckedArray(elem_seq))
+    self._message_listener.Modified()
+
+  def __iter__(self):
+    return iter(self._values)
+
+  def __getitem__(self, key):
+    """Retrieves item by the specified key."""
+    if key.__class__ is slice:
+      return self._values[key].tolist()
+    return self._values[key]
+
+  def __getslice__(self, start, stop):
+    """Retrieves the subset of items from between the specified indices."""
+    return self._values[start:stop].tolist()
+
+  def __setslice__(self, start, stop, values):
+    """Sets the subset of items from between the specified indices."""
+    if self._shared:
+      self._CopyOnWrite()
+    self._values[start:stop] = self._CheckedArray(values)
+    self._message_listener.Modified()
+
+  def __eq__(self, other):
+    """Compares the current instance with another one."""
+    if self is other:
+      return True
+    if isinstance(other, RepeatedScalarFieldContainer):
+      other = other._values
+      if (isinstance(other, array.array) and
+          other.typecode == self._values.typecode):
+        return other == self._values
+    return other == self._values.tolist()
+
+  def __repr__(self):
+    return repr(self._values.tolist())
+
+  def sort(self, *args, **kwargs):
+    # array.array has no sort(), so sort a list of the values.
+    values = self._values.tolist()
+    if 'sort_function' in kwargs:
+      kwargs['cmp'] = kwargs.pop('sort_function')
+    values.sort(*args, **kwargs)
+    self._values = array.array(self._values.typecode, values)
+    self._message_listener.Modified()
+
+
 class RepeatedCompositeFieldContainer(BaseContainer):
 
   """Simple, list-like container for holding repeated composite fields."""
@@ -653,6 +653,60 @@ def _AddMessageMethods(message_descriptor, cls):
     return msg
   cls.FromString = staticmethod(FromString)
 
+  def ParseMany(strings):
+    return [FromString(string) for string in strings]
+  cls.ParseMany = staticmethod(ParseMany)
+
+  def SerializeMany(messages, join=False):
+    results = [msg.SerializeToString() for msg in messages]
+    if join:
+      return ''.join(results)
+    return results
+  cls.SerializeMany = staticmethod(SerializeMany)
+
+  def FromStringProjected(string, field_paths, keep_skipped_fields=False):
+    # The whole message is parsed, then the fields not asked for are cleared.
+    msg = FromString(string)
+    if isinstance(field_paths, basestring):
+      field_paths = [field_paths]
+    _KeepFieldPaths(msg, field_paths, keep_skipped_fields)
+    return msg
+  cls.FromStringProjected = staticmethod(FromStringProjected)
+
+
+def _KeepFieldPaths(msg, field_paths, keep_other_fields):
+  """Clears the fields of msg not named by field_paths; see
+  FromStringProjected() in python_message."""
+  message_descriptor = msg.DESCRIPTOR
+  sub_paths = {}
+  for path in field_paths:
+    name, _, rest = path.partition('.')
+    field = message_descriptor.fields_by_name.get(name)
+    if field is None:
+      raise ValueError('Protocol message has no "%s" field.' % name)
+    if not rest:
+      sub_paths[name] = None
+    elif field.type != _TYPE_MESSAGE:
+      raise ValueError('Field "%s" of "%s" is not a message; cannot parse "%s".'
+                       % (name, message_descriptor.full_name, path))
+    elif sub_paths.get(name, ()) is not None:
+      sub_paths.setdefault(name, []).append(rest)
+  for field, value in msg.ListFields():
+    paths = sub_paths.get(field.name, ())
+    if paths == ():
+      if keep_other_fields:
+        pass
+      elif field.is_extension:
+        msg.ClearExtension(field)
+      else:
+        msg.ClearField(field.name)
+    elif paths is not None:
+      if field.label == _LABEL_REPEATED:
+        for element in value:
+          _KeepFieldPaths(element, paths, keep_other_fields)
+      else:
+        _KeepFieldPaths(value, paths, keep_other_fields)
+
 
 
 def _AddPropertiesForExtensions(message_descriptor, cls):
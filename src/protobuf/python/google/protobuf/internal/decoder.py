@@ -35,15 +35,18 @@ This code is very similar to encoder.py -- read the docs for that module first.
 A "decoder" is a function with the signature:
   Decode(buffer, pos, end, message, field_dict)
 The arguments are:
-  buffer:     The string containing the encoded message.
+  buffer:     The string containing the encoded message.  This may also be a
+              memoryview, or a buffer() wrapping some other object which
+              supports the buffer interface -- see AsBuffer().
   pos:        The current position in the string.
   end:        The position in the string where the current message ends.  May be
               less than len(buffer) if we're reading a sub-message.
   message:    The message object into which we're parsing.
   field_dict: message._fields (avoids a hashtable lookup).
-The decoder reads the field and stores it into field_dict, returning the new
-buffer position.  A decoder for a repeated field may proactively decode all of
-the elements of that field, if they appear consecutively.
+The decoder reads the field and stores it into field_dict, or into the
+field's slot (see below), returning the new buffer position.  A decoder
+for a repeated field may proactively decode all of the elements of that
+field, if they appear consecutively.
 
 Note that decoders may throw any of the following:
   IndexError:  Indicates a truncated message.
@@ -71,6 +74,12 @@ The arguments are:
                  returns a new instance of the default value for this field.
                  (This is called for repeated fields and sub-messages, when an
                  instance does not already exist.)
+  slot:          Optional.  For a field of a message class which gives every
+                 declared field a slot of its own (see
+                 api_implementation.ClassLayout()), a (member, bit) tuple of
+                 the slot's member descriptor and the field's bit in
+                 message._has_bits.  The decoder then keeps the field's value
+                 in the slot, setting the bit, instead of in field_dict.
 
 As with encoders, we define a decoder constructor for every type of field.
 Then, for every field of every message class we construct an actual decoder.
@@ -97,6 +106,43 @@ _NAN = _POS_INF * 0
 # variables named "message".
 _DecodeError = message.DecodeError
 
+try:
+  _memoryview = memoryview
+except NameError:
+  # Python before 2.7 has no memoryview.  Nothing can be an instance of this
+  # placeholder, so every input is treated as slicing to a str.
+  class _memoryview(object):
+    pass
+
+
+def AsBuffer(serialized):
+  """Returns an object through which the decoders can read |serialized|.
+
+  str inputs are returned unchanged.  So are memoryview inputs: slicing a
+  memoryview does not copy, so bytes fields parsed from one come back as
+  memoryview slices of the input rather than as str copies, and they keep
+  the input alive.  Any other object supporting the buffer interface, such
+  as a bytearray or an mmap, is wrapped in a read-only buffer() so that it
+  is parsed in place instead of being copied into a str first; its slices
+  are ordinary str objects.
+  """
+
+  if isinstance(serialized, (str, unicode, _memoryview, buffer)):
+    return serialized
+  return buffer(serialized)
+
+
+def StringOf(value):
+  """Returns |value|, a slice of a buffer being decoded, as a str.
+
+  Slices of a memoryview are themselves memoryviews, which cannot be hashed
+  or decoded as UTF-8.  Those are copied; anything else is returned as is.
+  """
+
+  if value.__class__ is _memoryview:
+    return value.tobytes()
+  return value
+
 
 def _VarintDecoder(mask):
   """Return an encoder for a basic varint value (does not include tag).
@@ -157,6 +203,57 @@ _DecodeVarint32 = _VarintDecoder((1 << 32) - 1)
 _DecodeSignedVarint32 = _SignedVarintDecoder((1 << 32) - 1)
 
 
+def _PackedVarintDecoder(mask, signed):
+  """Return a decoder for the payload of a packed varint field.
+
+  The returned decoder takes (buffer, pos, end) and returns a list of all of
+  the varints in buffer[pos:end], decoded as _VarintDecoder(mask) (or
+  _SignedVarintDecoder(mask) if |signed|) would decode them.  It works on a
+  bytearray copy of the payload, so that it does not need to call ord() for
+  every byte, and it returns the payload's bytes directly when every value
+  fits in one byte.
+  """
+
+  local_bytearray = bytearray
+  local_max = max
+  def DecodePackedVarints(buffer, pos, end):
+    data = local_bytearray(buffer[pos:end])
+    if not data or local_max(data) < 0x80:
+      return list(data)
+    values = []
+    append = values.append
+    size = len(data)
+    i = 0
+    try:
+      while i < size:
+        b = data[i]
+        i += 1
+        if b < 0x80:
+          append(b)
+          continue
+        result = b & 0x7f
+        shift = 7
+        while 1:
+          b = data[i]
+          i += 1
+          result |= ((b & 0x7f) << shift)
+          if not (b & 0x80):
+            break
+          shift += 7
+          if shift >= 64:
+            raise _DecodeError('Too many bytes when decoding varint.')
+        if signed and result > 0x7fffffffffffffff:
+          result -= (1 << 64)
+          result |= ~mask
+        else:
+          result &= mask
+        append(result)
+    except IndexError:
+      raise _DecodeError('Packed element was truncated.')
+    return values
+  return DecodePackedVarints
+
+
 def ReadTag(buffer, pos):
   """Read a tag from the buffer, and return a (tag_bytes, new_pos) tuple.
 
@@ -175,25 +272,90 @@ def ReadTag(buffer, pos):
   return (buffer[start:pos], pos)
 
 
+def ReadViewTag(buffer, pos):
+  """Like ReadTag(), but for memoryview buffers.
+
+  Slices of a memoryview cannot be used as dict keys, so the tag bytes are
+  copied into a str.
+  """
+
+  start = pos
+  while ord(buffer[pos]) & 0x80:
+    pos += 1
+  pos += 1
+  return (buffer[start:pos].tobytes(), pos)
+
+
 # --------------------------------------------------------------------
 
 
-def _SimpleDecoder(wire_type, decode_value):
+def _SlotValueGetter(slot, new_default):
+  """Returns a function which returns the value kept in a field's slot,
+  storing new_default(message) there first if the field is not set.
+
+  Args:
+      slot:  The slot argument of a decoder constructor.
+      new_default:  Like the new_default argument of a decoder constructor.
+  """
+
+  get_slot = slot[0].__get__
+  set_slot = slot[0].__set__
+  has_bit = slot[1]
+
+  def GetValue(message):
+    if message._has_bits & has_bit:
+      return get_slot(message)
+    value = new_default(message)
+    set_slot(message, value)
+    message._has_bits |= has_bit
+    return value
+
+  return GetValue
+
+
+def _SimpleDecoder(wire_type, decode_value, decode_packed=None):
   """Return a constructor for a decoder for fields of a particular type.
 
   Args:
       wire_type:  The field's wire type.
       decode_value:  A function which decodes an individual value, e.g.
         _DecodeVarint()
+      decode_packed:  Optionally, a function which decodes the whole payload
+        of a packed field at once, e.g. _PackedVarintDecoder().  It takes
+        (buffer, pos, end) and returns a sequence of values.  Without it,
+        packed fields are decoded one element at a time with decode_value.
   """
 
-  def SpecificDecoder(field_number, is_repeated, is_packed, key, new_default):
-    if is_packed:
+  def SpecificDecoder(field_number, is_repeated, is_packed, key, new_default,
+                      slot=None):
+    get_value = None
+    if slot is not None:
+      get_value = _SlotValueGetter(slot, new_default)
+    if is_packed and decode_packed is not None:
       local_DecodeVarint = _DecodeVarint
       def DecodePackedField(buffer, pos, end, message, field_dict):
-        value = field_dict.get(key)
-        if value is None:
-          value = field_dict.setdefault(key, new_default(message))
+        if get_value is not None:
+          value = get_value(message)
+        else:
+          value = field_dict.get(key)
+          if value is None:
+            value = field_dict.setdefault(key, new_default(message))
+        (endpoint, pos) = local_DecodeVarint(buffer, pos)
+        endpoint += pos
+        if endpoint > end:
+          raise _DecodeError('Truncated message.')
+        value._ExtendUnchecked(decode_packed(buffer, pos, endpoint))
+        return endpoint
+      return DecodePackedField
+    elif is_packed:
+      local_DecodeVarint = _DecodeVarint
+      def DecodePackedField(buffer, pos, end, message, field_dict):
+        if get_value is not None:
+          value = get_value(message)
+        else:
+          value = field_dict.get(key)
+          if value is None:
+            value = field_dict.setdefault(key, new_default(message))
         (endpoint, pos) = local_DecodeVarint(buffer, pos)
         endpoint += pos
         if endpoint > end:
@@ -210,9 +372,12 @@ def _SimpleDecoder(wire_type, decode_value):
       tag_bytes = encoder.TagBytes(field_number, wire_type)
       tag_len = len(tag_bytes)
       def DecodeRepeatedField(buffer, pos, end, message, field_dict):
-        value = field_dict.get(key)
-        if value is None:
-          value = field_dict.setdefault(key, new_default(message))
+        if get_value is not None:
+          value = get_value(message)
+        else:
+          value = field_dict.get(key)
+          if value is None:
+            value = field_dict.setdefault(key, new_default(message))
         while 1:
           (element, new_pos) = decode_value(buffer, pos)
           value.append(element)
@@ -225,6 +390,17 @@ def _SimpleDecoder(wire_type, decode_value):
               raise _DecodeError('Truncated message.')
             return new_pos
       return DecodeRepeatedField
+    elif slot is not None:
+      set_slot = slot[0].__set__
+      has_bit = slot[1]
+      def DecodeField(buffer, pos, end, message, field_dict):
+        (value, pos) = decode_value(buffer, pos)
+        if pos > end:
+          raise _DecodeError('Truncated message.')
+        set_slot(message, value)
+        message._has_bits |= has_bit
+        return pos
+      return DecodeField
     else:
       def DecodeField(buffer, pos, end, message, field_dict):
         (field_dict[key], pos) = decode_value(buffer, pos)
@@ -237,7 +413,8 @@ def _SimpleDecoder(wire_type, decode_value):
   return SpecificDecoder
 
 
-def _ModifiedDecoder(wire_type, decode_value, modify_value):
+def _ModifiedDecoder(wire_type, decode_value, modify_value,
+                     decode_packed=None):
   """Like SimpleDecoder but additionally invokes modify_value on every value
   before storing it.  Usually modify_value is ZigZagDecode.
   """
@@ -248,7 +425,45 @@ def _ModifiedDecoder(wire_type, decode_value, modify_value):
   def InnerDecode(buffer, pos):
     (result, new_pos) = decode_value(buffer, pos)
     return (modify_value(result), new_pos)
-  return _SimpleDecoder(wire_type, InnerDecode)
+
+  if decode_packed is None:
+    return _SimpleDecoder(wire_type, InnerDecode)
+
+  def InnerDecodePacked(buffer, pos, end):
+    return map(modify_value, decode_packed(buffer, pos, end))
+  return _SimpleDecoder(wire_type, InnerDecode, InnerDecodePacked)
+
+
+def _PackedStructDecoder(format):
+  """Return a decoder for the payload of a packed fixed-width field, which
+  unpacks all of the values with a single struct.unpack() call.
+
+  Args:
+      format:  The format string for one value, e.g. '<I'.
+  """
+
+  value_size = struct.calcsize(format)
+  byte_order = format[0]
+  value_format = format[1:]
+  local_unpack = struct.unpack
+
+  def DecodePackedValues(buffer, pos, end):
+    (count, remainder) = divmod(end - pos, value_size)
+    if remainder:
+      raise _DecodeError('Packed element was truncated.')
+    return local_unpack('%s%d%s' % (byte_order, count, value_format),
+                        buffer[pos:end])
+  return DecodePackedValues
+
+
+def _StructUnpacksNonFinite():
+  """Returns true if struct.unpack() decodes non-finite floating-point values
+  correctly.  Python 2.4 turns them into finite values, which the float and
+  double decoders below work around value by value.
+  """
+  inf = struct.unpack('<f', '\x00\x00\x80\x7F')[0]
+  nan = struct.unpack('<d', '\x00\x00\x00\x00\x00\x00\xF8\x7F')[0]
+  return inf == _POS_INF and nan != nan
 
 
 def _StructPackDecoder(wire_type, format):
@@ -273,7 +488,7 @@ def _StructPackDecoder(wire_type, format):
     new_pos = pos + value_size
     result = local_unpack(format, buffer[pos:new_pos])[0]
     return (result, new_pos)
-  return _SimpleDecoder(wire_type, InnerDecode)
+  return _SimpleDecoder(wire_type, InnerDecode, _PackedStructDecoder(format))
 
 
 def _FloatDecoder():
@@ -309,6 +524,10 @@ def _FloatDecoder():
     # handling blocks every time we parse one value.
     result = local_unpack('<f', float_bytes)[0]
     return (result, new_pos)
+
+  if _StructUnpacksNonFinite():
+    return _SimpleDecoder(wire_format.WIRETYPE_FIXED32, InnerDecode,
+                          _PackedStructDecoder('<f'))
   return _SimpleDecoder(wire_format.WIRETYPE_FIXED32, InnerDecode)
 
 
@@ -339,6 +558,10 @@ def _DoubleDecoder():
     # handling blocks every time we parse one value.
     result = local_unpack('<d', double_bytes)[0]
     return (result, new_pos)
+
+  if _StructUnpacksNonFinite():
+    return _SimpleDecoder(wire_format.WIRETYPE_FIXED64, InnerDecode,
+                          _PackedStructDecoder('<d'))
   return _SimpleDecoder(wire_format.WIRETYPE_FIXED64, InnerDecode)
 
 
@@ -346,18 +569,26 @@ def _DoubleDecoder():
 
 
 Int32Decoder = EnumDecoder = _SimpleDecoder(
-    wire_format.WIRETYPE_VARINT, _DecodeSignedVarint32)
+    wire_format.WIRETYPE_VARINT, _DecodeSignedVarint32,
+    _PackedVarintDecoder((1 << 32) - 1, True))
 
 Int64Decoder = _SimpleDecoder(
-    wire_format.WIRETYPE_VARINT, _DecodeSignedVarint)
+    wire_format.WIRETYPE_VARINT, _DecodeSignedVarint,
+    _PackedVarintDecoder((1 << 64) - 1, True))
 
-UInt32Decoder = _SimpleDecoder(wire_format.WIRETYPE_VARINT, _DecodeVarint32)
-UInt64Decoder = _SimpleDecoder(wire_format.WIRETYPE_VARINT, _DecodeVarint)
+UInt32Decoder = _SimpleDecoder(
+    wire_format.WIRETYPE_VARINT, _DecodeVarint32,
+    _PackedVarintDecoder((1 << 32) - 1, False))
+UInt64Decoder = _SimpleDecoder(
+    wire_format.WIRETYPE_VARINT, _DecodeVarint,
+    _PackedVarintDecoder((1 << 64) - 1, False))
 
 SInt32Decoder = _ModifiedDecoder(
-    wire_format.WIRETYPE_VARINT, _DecodeVarint32, wire_format.ZigZagDecode)
+    wire_format.WIRETYPE_VARINT, _DecodeVarint32, wire_format.ZigZagDecode,
+    _PackedVarintDecoder((1 << 32) - 1, False))
 SInt64Decoder = _ModifiedDecoder(
-    wire_format.WIRETYPE_VARINT, _DecodeVarint, wire_format.ZigZagDecode)
+    wire_format.WIRETYPE_VARINT, _DecodeVarint, wire_format.ZigZagDecode,
+    _PackedVarintDecoder((1 << 64) - 1, False))
 
 # Note that Python conveniently guarantees that when using the '<' prefix on
 # formats, they will also have the same size across all platforms (as opposed
@@ -371,14 +602,20 @@ FloatDecoder = _FloatDecoder()
 DoubleDecoder = _DoubleDecoder()
 
 BoolDecoder = _ModifiedDecoder(
-    wire_format.WIRETYPE_VARINT, _DecodeVarint, bool)
+    wire_format.WIRETYPE_VARINT, _DecodeVarint, bool,
+    _PackedVarintDecoder((1 << 64) - 1, False))
 
 
-def StringDecoder(field_number, is_repeated, is_packed, key, new_default):
+def StringDecoder(field_number, is_repeated, is_packed, key, new_default,
+                  slot=None):
   """Returns a decoder for a string field."""
 
   local_DecodeVarint = _DecodeVarint
   local_unicode = unicode
+  local_memoryview = _memoryview
+  get_value = None
+  if slot is not None:
+    get_value = _SlotValueGetter(slot, new_default)
 
   assert not is_packed
   if is_repeated:
@@ -386,36 +623,68 @@ def StringDecoder(field_number, is_repeated, is_packed, key, new_default):
                                  wire_format.WIRETYPE_LENGTH_DELIMITED)
     tag_len = len(tag_bytes)
     def DecodeRepeatedField(buffer, pos, end, message, field_dict):
-      value = field_dict.get(key)
-      if value is None:
-        value = field_dict.setdefault(key, new_default(message))
+      if get_value is not None:
+        value = get_value(message)
+      else:
+        value = field_dict.get(key)
+        if value is None:
+          value = field_dict.setdefault(key, new_default(message))
       while 1:
         (size, pos) = local_DecodeVarint(buffer, pos)
         new_pos = pos + size
         if new_pos > end:
           raise _DecodeError('Truncated string.')
-        value.append(local_unicode(buffer[pos:new_pos], 'utf-8'))
+        element = buffer[pos:new_pos]
+        if element.__class__ is local_memoryview:
+          element = element.tobytes()
+        value.append(local_unicode(element, 'utf-8'))
         # Predict that the next tag is another copy of the same repeated field.
         pos = new_pos + tag_len
         if buffer[new_pos:pos] != tag_bytes or new_pos == end:
           # Prediction failed.  Return.
           return new_pos
     return DecodeRepeatedField
+  elif slot is not None:
+    set_slot = slot[0].__set__
+    has_bit = slot[1]
+    def DecodeField(buffer, pos, end, message, field_dict):
+      (size, pos) = local_DecodeVarint(buffer, pos)
+      new_pos = pos + size
+      if new_pos > end:
+        raise _DecodeError('Truncated string.')
+      value = buffer[pos:new_pos]
+      if value.__class__ is local_memoryview:
+        value = value.tobytes()
+      set_slot(message, local_unicode(value, 'utf-8'))
+      message._has_bits |= has_bit
+      return new_pos
+    return DecodeField
   else:
     def DecodeField(buffer, pos, end, message, field_dict):
       (size, pos) = local_DecodeVarint(buffer, pos)
       new_pos = pos + size
       if new_pos > end:
         raise _DecodeError('Truncated string.')
-      field_dict[key] = local_unicode(buffer[pos:new_pos], 'utf-8')
+      value = buffer[pos:new_pos]
+      if value.__class__ is local_memoryview:
+        value = value.tobytes()
+      field_dict[key] = local_unicode(value, 'utf-8')
       return new_pos
     return DecodeField
 
 
-def BytesDecoder(field_number, is_repeated, is_packed, key, new_default):
-  """Returns a decoder for a bytes field."""
+def BytesDecoder(field_number, is_repeated, is_packed, key, new_default,
+                 slot=None):
+  """Returns a decoder for a bytes field.
+
+  Values are slices of the buffer, so when decoding a memoryview they are
+  memoryviews sharing its memory.
+  """
 
   local_DecodeVarint = _DecodeVarint
+  get_value = None
+  if slot is not None:
+    get_value = _SlotValueGetter(slot, new_default)
 
   assert not is_packed
   if is_repeated:
@@ -423,9 +692,12 @@ def BytesDecoder(field_number, is_repeated, is_packed, key, new_default):
                                  wire_format.WIRETYPE_LENGTH_DELIMITED)
     tag_len = len(tag_bytes)
     def DecodeRepeatedField(buffer, pos, end, message, field_dict):
-      value = field_dict.get(key)
-      if value is None:
-        value = field_dict.setdefault(key, new_default(message))
+      if get_value is not None:
+        value = get_value(message)
+      else:
+        value = field_dict.get(key)
+        if value is None:
+          value = field_dict.setdefault(key, new_default(message))
       while 1:
         (size, pos) = local_DecodeVarint(buffer, pos)
         new_pos = pos + size
@@ -438,6 +710,18 @@ def BytesDecoder(field_number, is_repeated, is_packed, key, new_default):
           # Prediction failed.  Return.
           return new_pos
     return DecodeRepeatedField
+  elif slot is not None:
+    set_slot = slot[0].__set__
+    has_bit = slot[1]
+    def DecodeField(buffer, pos, end, message, field_dict):
+      (size, pos) = local_DecodeVarint(buffer, pos)
+      new_pos = pos + size
+      if new_pos > end:
+        raise _DecodeError('Truncated string.')
+      set_slot(message, buffer[pos:new_pos])
+      message._has_bits |= has_bit
+      return new_pos
+    return DecodeField
   else:
     def DecodeField(buffer, pos, end, message, field_dict):
       (size, pos) = local_DecodeVarint(buffer, pos)
@@ -449,9 +733,13 @@ def BytesDecoder(field_number, is_repeated, is_packed, key, new_default):
     return DecodeField
 
 
-def GroupDecoder(field_number, is_repeated, is_packed, key, new_default):
+def GroupDecoder(field_number, is_repeated, is_packed, key, new_default,
+                 slot=None):
   """Returns a decoder for a group field."""
 
+  get_value = None
+  if slot is not None:
+    get_value = _SlotValueGetter(slot, new_default)
   end_tag_bytes = encoder.TagBytes(field_number,
                                    wire_format.WIRETYPE_END_GROUP)
   end_tag_len = len(end_tag_bytes)
@@ -462,13 +750,19 @@ def GroupDecoder(field_number, is_repeated, is_packed, key, new_default):
                                  wire_format.WIRETYPE_START_GROUP)
     tag_len = len(tag_bytes)
     def DecodeRepeatedField(buffer, pos, end, message, field_dict):
-      value = field_dict.get(key)
-      if value is None:
-        value = field_dict.setdefault(key, new_default(message))
-      while 1:
+      if get_value is not None:
+        value = get_value(message)
+      else:
         value = field_dict.get(key)
         if value is None:
           value = field_dict.setdefault(key, new_default(message))
+      while 1:
+        if get_value is not None:
+          value = get_value(message)
+        else:
+          value = field_dict.get(key)
+          if value is None:
+            value = field_dict.setdefault(key, new_default(message))
         # Read sub-message.
         pos = value.add()._InternalParse(buffer, pos, end)
         # Read end tag.
@@ -483,9 +777,12 @@ def GroupDecoder(field_number, is_repeated, is_packed, key, new_default):
     return DecodeRepeatedField
   else:
     def DecodeField(buffer, pos, end, message, field_dict):
-      value = field_dict.get(key)
-      if value is None:
-        value = field_dict.setdefault(key, new_default(message))
+      if get_value is not None:
+        value = get_value(message)
+      else:
+        value = field_dict.get(key)
+        if value is None:
+          value = field_dict.setdefault(key, new_default(message))
       # Read sub-message.
       pos = value._InternalParse(buffer, pos, end)
       # Read end tag.
@@ -496,10 +793,14 @@ def GroupDecoder(field_number, is_repeated, is_packed, key, new_default):
     return DecodeField
 
 
-def MessageDecoder(field_number, is_repeated, is_packed, key, new_default):
+def MessageDecoder(field_number, is_repeated, is_packed, key, new_default,
+                   slot=None):
   """Returns a decoder for a message field."""
 
   local_DecodeVarint = _DecodeVarint
+  get_value = None
+  if slot is not None:
+    get_value = _SlotValueGetter(slot, new_default)
 
   assert not is_packed
   if is_repeated:
@@ -507,13 +808,19 @@ def MessageDecoder(field_number, is_repeated, is_packed, key, new_default):
                                  wire_format.WIRETYPE_LENGTH_DELIMITED)
     tag_len = len(tag_bytes)
     def DecodeRepeatedField(buffer, pos, end, message, field_dict):
-      value = field_dict.get(key)
-      if value is None:
-        value = field_dict.setdefault(key, new_default(message))
-      while 1:
+      if get_value is not None:
+        value = get_value(message)
+      else:
         value = field_dict.get(key)
         if value is None:
           value = field_dict.setdefault(key, new_default(message))
+      while 1:
+        if get_value is not None:
+          value = get_value(message)
+        else:
+          value = field_dict.get(key)
+          if value is None:
+            value = field_dict.setdefault(key, new_default(message))
         # Read length.
         (size, pos) = local_DecodeVarint(buffer, pos)
         new_pos = pos + size
@@ -532,9 +839,12 @@ def MessageDecoder(field_number, is_repeated, is_packed, key, new_default):
     return DecodeRepeatedField
   else:
     def DecodeField(buffer, pos, end, message, field_dict):
-      value = field_dict.get(key)
-      if value is None:
-        value = field_dict.setdefault(key, new_default(message))
+      if get_value is not None:
+        value = get_value(message)
+      else:
+        value = field_dict.get(key)
+        if value is None:
+          value = field_dict.setdefault(key, new_default(message))
       # Read length.
       (size, pos) = local_DecodeVarint(buffer, pos)
       new_pos = pos + size
@@ -549,6 +859,89 @@ def MessageDecoder(field_number, is_repeated, is_packed, key, new_default):
     return DecodeField
 
 
+def LazyMessageDecoder(field_number, is_repeated, is_packed, key, new_lazy,
+                       slot=None):
+  """Returns a decoder for a message field which is parsed on first access.
+
+  Rather than parsing each sub-message, the decoder records where it lies:
+  the field's value is a placeholder made by new_lazy(key), and the decoder
+  appends a (buffer, start, end) range to its _ranges list for every
+  occurrence.  Turning the placeholder into a real value is up to the
+  caller.  If the field already holds a real value, the sub-message is parsed
+  into it straight away, as MessageDecoder would.
+
+  A buffer() wraps an object which may change or go away after parsing (a
+  bytearray or an mmap), so ranges of one are copied.  Other buffers are
+  referenced as they are.
+  """
+
+  local_DecodeVarint = _DecodeVarint
+  local_buffer = buffer
+  get_value = None
+  if slot is not None:
+    get_value = _SlotValueGetter(slot, lambda message: new_lazy(key))
+
+  assert not is_packed
+  if is_repeated:
+    tag_bytes = encoder.TagBytes(field_number,
+                                 wire_format.WIRETYPE_LENGTH_DELIMITED)
+    tag_len = len(tag_bytes)
+    def DecodeRepeatedField(buffer, pos, end, message, field_dict):
+      if get_value is not None:
+        value = get_value(message)
+      else:
+        value = field_dict.get(key)
+        if value is None:
+          value = field_dict.setdefault(key, new_lazy(key))
+      is_lazy = value.__class__ is new_lazy
+      copy = buffer.__class__ is local_buffer
+      while 1:
+        # Read length.
+        (size, pos) = local_DecodeVarint(buffer, pos)
+        new_pos = pos + size
+        if new_pos > end:
+          raise _DecodeError('Truncated message.')
+        if not is_lazy:
+          if value.add()._InternalParse(buffer, pos, new_pos) != new_pos:
+            # The only reason _InternalParse would return early is if it
+            # encountered an end-group tag.
+            raise _DecodeError('Unexpected end-group tag.')
+        elif copy:
+          value._ranges.append((buffer[pos:new_pos], 0, size))
+        else:
+          value._ranges.append((buffer, pos, new_pos))
+        # Predict that the next tag is another copy of the same repeated field.
+        pos = new_pos + tag_len
+        if buffer[new_pos:pos] != tag_bytes or new_pos == end:
+          # Prediction failed.  Return.
+          return new_pos
+    return DecodeRepeatedField
+  else:
+    def DecodeField(buffer, pos, end, message, field_dict):
+      if get_value is not None:
+        value = get_value(message)
+      else:
+        value = field_dict.get(key)
+        if value is None:
+          value = field_dict.setdefault(key, new_lazy(key))
+      # Read length.
+      (size, pos) = local_DecodeVarint(buffer, pos)
+      new_pos = pos + size
+      if new_pos > end:
+        raise _DecodeError('Truncated message.')
+      if value.__class__ is not new_lazy:
+        if value._InternalParse(buffer, pos, new_pos) != new_pos:
+          # The only reason _InternalParse would return early is if it
+          # encountered an end-group tag.
+          raise _DecodeError('Unexpected end-group tag.')
+      elif buffer.__class__ is local_buffer:
+        value._ranges.append((buffer[pos:new_pos], 0, size))
+      else:
+        value._ranges.append((buffer, pos, new_pos))
+      return new_pos
+    return DecodeField
+
+
 # --------------------------------------------------------------------
 
 MESSAGE_SET_ITEM_TAG = encoder.TagBytes(1, wire_format.WIRETYPE_START_GROUP)
@@ -618,8 +1011,9 @@ def MessageSetItemDecoder(extensions_by_number):
     else:
       if not message._unknown_fields:
         message._unknown_fields = []
-      message._unknown_fields.append((MESSAGE_SET_ITEM_TAG,
-                                      buffer[message_set_item_start:pos]))
+      message._unknown_fields.append(
+          (MESSAGE_SET_ITEM_TAG,
+           StringOf(buffer[message_set_item_start:pos])))
 
     return pos
 
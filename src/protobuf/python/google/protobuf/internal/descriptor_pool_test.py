@@ -216,5 +216,53 @@ class DescriptorPoolTest(unittest.TestCase):
     db.Add(self.factory_test2_fd)
     self.testFindMessageTypeByName()
 
+
+class DescriptorPoolDependencyTest(unittest.TestCase):
+
+  def _AddFile(self, name, package, dependencies, message_name, fields):
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name=name, package=package, dependency=dependencies)
+    message_proto = file_proto.message_type.add(name=message_name)
+    for number, (field_name, field_type, type_name) in enumerate(fields):
+      message_proto.field.add(
+          name=field_name, number=number + 1, type=field_type,
+          label=descriptor.FieldDescriptor.LABEL_OPTIONAL, type_name=type_name)
+    self.pool.Add(file_proto)
+
+  def setUp(self):
+    # d.proto imports b.proto and c.proto, which both import a.proto.
+    self.pool = descriptor_pool.DescriptorPool()
+    message = descriptor.FieldDescriptor.TYPE_MESSAGE
+    enum = descriptor.FieldDescriptor.TYPE_ENUM
+    file_proto = descriptor_pb2.FileDescriptorProto(name='a.proto', package='a')
+    file_proto.message_type.add(name='A')
+    file_proto.enum_type.add(name='E').value.add(name='E0', number=0)
+    self.pool.Add(file_proto)
+    self._AddFile('b.proto', 'b', ['a.proto'], 'B', [('a', message, '.a.A')])
+    self._AddFile('c.proto', 'c', ['a.proto'], 'C', [('e', enum, '.a.E')])
+    self._AddFile('d.proto', 'd', ['b.proto', 'c.proto'], 'D',
+                  [('b', message, '.b.B'), ('c', message, '.c.C')])
+
+  def testResolvesTypesAcrossFiles(self):
+    d = self.pool.FindMessageTypeByName('d.D')
+    b = self.pool.FindMessageTypeByName('b.B')
+    self.assertTrue(d.fields_by_name['b'].message_type is b)
+    self.assertTrue(d.fields_by_name['c'].message_type is
+                    self.pool.FindMessageTypeByName('c.C'))
+    self.assertTrue(b.fields_by_name['a'].message_type is
+                    self.pool.FindMessageTypeByName('.a.A'))
+    self.assertTrue(
+        self.pool.FindMessageTypeByName('c.C').fields_by_name['e'].enum_type is
+        self.pool.FindEnumTypeByName('a.E'))
+
+  def testEachFileIsConvertedOnce(self):
+    file_d = self.pool.FindFileByName('d.proto')
+    self.assertEqual(['b.proto', 'a.proto', 'c.proto'],
+                     self.pool._file_dependencies['d.proto'])
+    self.assertTrue(file_d is self.pool.FindFileByName('d.proto'))
+    self.assertTrue(self.pool.FindFileByName('a.proto') is
+                    self.pool.FindFileContainingSymbol('a.A'))
+
+
 if __name__ == '__main__':
   unittest.main()
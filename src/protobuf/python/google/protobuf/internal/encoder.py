@@ -41,7 +41,8 @@ FieldDescriptor) we construct two functions:  a "sizer" and an "encoder".  The
 sizer takes a value of this field's type and computes its byte size.  The
 encoder takes a writer function and a value.  It encodes the value into byte
 strings and invokes the writer function to write those strings.  Typically the
-writer function is the write() method of a cStringIO.
+writer function is the append() method of a list which is joined afterwards,
+so only str objects may be written.
 
 We try to do as much work as possible when constructing the writer and the
 sizer rather than when calling them.  In particular:
@@ -66,6 +67,7 @@ sizer rather than when calling them.  In particular:
 
 __author__ = 'kenton@google.com (Kenton Varda)'
 
+import array
 import struct
 from google.protobuf.internal import wire_format
 
@@ -128,10 +130,10 @@ def _SimpleSizer(compute_value_size):
     tag_size = _TagSize(field_number)
     if is_packed:
       local_VarintSize = _VarintSize
+      local_sum = sum
+      local_map = map
       def PackedFieldSize(value):
-        result = 0
-        for element in value:
-          result += compute_value_size(element)
+        result = local_sum(local_map(compute_value_size, value))
         return result + local_VarintSize(result) + tag_size
       return PackedFieldSize
     elif is_repeated:
@@ -157,10 +159,11 @@ def _ModifiedSizer(compute_value_size, modify_value):
     tag_size = _TagSize(field_number)
     if is_packed:
       local_VarintSize = _VarintSize
+      local_sum = sum
+      local_map = map
       def PackedFieldSize(value):
-        result = 0
-        for element in value:
-          result += compute_value_size(modify_value(element))
+        result = local_sum(local_map(compute_value_size,
+                                     local_map(modify_value, value)))
         return result + local_VarintSize(result) + tag_size
       return PackedFieldSize
     elif is_repeated:
@@ -376,6 +379,49 @@ _EncodeVarint = _VarintEncoder()
 _EncodeSignedVarint = _SignedVarintEncoder()
 
 
+def _PackedVarintEncoder(signed):
+  """Return an encoder for the payload of a packed varint field.
+
+  The returned function takes a sequence of values and returns all of them
+  encoded as consecutive varints, as a single string.  Values below 0x80 are
+  looked up in a table, and when every value is below 0x80 the whole payload
+  is converted at once.
+  """
+
+  local_array = array.array
+  local_min = min
+  local_max = max
+  local_chr = chr
+  one_byte = [chr(i) for i in xrange(0x80)]
+  def EncodePackedVarints(values):
+    if not values:
+      return ''
+    if local_max(values) <= 0x7f and local_min(values) >= 0:
+      return local_array('B', values).tostring()
+    pieces = []
+    append = pieces.append
+    for value in values:
+      if 0 <= value <= 0x7f:
+        append(one_byte[value])
+        continue
+      if signed and value < 0:
+        value += (1 << 64)
+      bits = value & 0x7f
+      value >>= 7
+      while value:
+        append(local_chr(0x80|bits))
+        bits = value & 0x7f
+        value >>= 7
+      append(local_chr(bits))
+    return ''.join(pieces)
+
+  return EncodePackedVarints
+
+
+_EncodePackedVarints = _PackedVarintEncoder(False)
+_EncodePackedSignedVarints = _PackedVarintEncoder(True)
+
+
 def _VarintBytes(value):
   """Encode the given integer as a varint and return the bytes.  This is only
   called at startup time so it doesn't need to be fast."""
@@ -385,17 +431,28 @@ def _VarintBytes(value):
   return "".join(pieces)
 
 
+# Maps a packed tag to its encoding.  Most messages number their fields from 1,
+# so the same few tags are encoded for almost every message class.
+_tag_bytes_cache = {}
+
+
 def TagBytes(field_number, wire_type):
   """Encode the given tag and return the bytes.  Only called at startup."""
 
-  return _VarintBytes(wire_format.PackTag(field_number, wire_type))
+  tag = wire_format.PackTag(field_number, wire_type)
+  try:
+    return _tag_bytes_cache[tag]
+  except KeyError:
+    tag_bytes = _tag_bytes_cache[tag] = _VarintBytes(tag)
+    return tag_bytes
 
 # --------------------------------------------------------------------
 # As with sizers (see above), we have a number of common encoder
 # implementations.
 
 
-def _SimpleEncoder(wire_type, encode_value, compute_value_size):
+def _SimpleEncoder(wire_type, encode_value, compute_value_size,
+                   encode_packed=None):
   """Return a constructor for an encoder for fields of a particular type.
 
   Args:
@@ -404,10 +461,22 @@ def _SimpleEncoder(wire_type, encode_value, compute_value_size):
         _EncodeVarint().
       compute_value_size:  A function which computes the size of an individual
         value, e.g. _VarintSize().
+      encode_packed:  Optionally, a function which encodes a whole sequence of
+        values at once and returns the bytes, e.g. _EncodePackedVarints().
+        Without it, packed fields are encoded one element at a time.
   """
 
   def SpecificEncoder(field_number, is_repeated, is_packed):
-    if is_packed:
+    if is_packed and encode_packed is not None:
+      tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
+      local_EncodeVarint = _EncodeVarint
+      def EncodePackedField(write, value):
+        write(tag_bytes)
+        data = encode_packed(value)
+        local_EncodeVarint(write, len(data))
+        return write(data)
+      return EncodePackedField
+    elif is_packed:
       tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
       local_EncodeVarint = _EncodeVarint
       def EncodePackedField(write, value):
@@ -436,12 +505,23 @@ def _SimpleEncoder(wire_type, encode_value, compute_value_size):
   return SpecificEncoder
 
 
-def _ModifiedEncoder(wire_type, encode_value, compute_value_size, modify_value):
+def _ModifiedEncoder(wire_type, encode_value, compute_value_size, modify_value,
+                     encode_packed=None):
   """Like SimpleEncoder but additionally invokes modify_value on every value
   before passing it to encode_value.  Usually modify_value is ZigZagEncode."""
 
   def SpecificEncoder(field_number, is_repeated, is_packed):
-    if is_packed:
+    if is_packed and encode_packed is not None:
+      tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
+      local_EncodeVarint = _EncodeVarint
+      local_map = map
+      def EncodePackedField(write, value):
+        write(tag_bytes)
+        data = encode_packed(local_map(modify_value, value))
+        local_EncodeVarint(write, len(data))
+        return write(data)
+      return EncodePackedField
+    elif is_packed:
       tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
       local_EncodeVarint = _EncodeVarint
       def EncodePackedField(write, value):
@@ -479,6 +559,8 @@ def _StructPackEncoder(wire_type, format):
   """
 
   value_size = struct.calcsize(format)
+  byte_order = format[0]
+  value_format = format[1:]
 
   def SpecificEncoder(field_number, is_repeated, is_packed):
     local_struct_pack = struct.pack
@@ -487,9 +569,11 @@ def _StructPackEncoder(wire_type, format):
       local_EncodeVarint = _EncodeVarint
       def EncodePackedField(write, value):
         write(tag_bytes)
-        local_EncodeVarint(write, len(value) * value_size)
-        for element in value:
-          write(local_struct_pack(format, element))
+        count = len(value)
+        local_EncodeVarint(write, count * value_size)
+        # Pack every element with one call.
+        return write(local_struct_pack(
+            '%s%d%s' % (byte_order, count, value_format), *value))
       return EncodePackedField
     elif is_repeated:
       tag_bytes = TagBytes(field_number, wire_type)
@@ -546,6 +630,9 @@ def _FloatingPointEncoder(wire_type, format):
     raise ValueError('Can\'t encode floating-point values that are '
                      '%d bytes long (only 4 or 8)' % value_size)
 
+  byte_order = format[0]
+  value_format = format[1:]
+
   def SpecificEncoder(field_number, is_repeated, is_packed):
     local_struct_pack = struct.pack
     if is_packed:
@@ -553,7 +640,15 @@ def _FloatingPointEncoder(wire_type, format):
       local_EncodeVarint = _EncodeVarint
       def EncodePackedField(write, value):
         write(tag_bytes)
-        local_EncodeVarint(write, len(value) * value_size)
+        count = len(value)
+        local_EncodeVarint(write, count * value_size)
+        # Pack every element with one call.  If that fails because some
+        # element is not finite, fall back to packing them one by one.
+        try:
+          return write(local_struct_pack(
+              '%s%d%s' % (byte_order, count, value_format), *value))
+        except SystemError:
+          pass
         for element in value:
           # This try/except block is going to be faster than any code that
           # we could write to check whether element is finite.
@@ -591,14 +686,16 @@ def _FloatingPointEncoder(wire_type, format):
 
 
 Int32Encoder = Int64Encoder = EnumEncoder = _SimpleEncoder(
-    wire_format.WIRETYPE_VARINT, _EncodeSignedVarint, _SignedVarintSize)
+    wire_format.WIRETYPE_VARINT, _EncodeSignedVarint, _SignedVarintSize,
+    _EncodePackedSignedVarints)
 
 UInt32Encoder = UInt64Encoder = _SimpleEncoder(
-    wire_format.WIRETYPE_VARINT, _EncodeVarint, _VarintSize)
+    wire_format.WIRETYPE_VARINT, _EncodeVarint, _VarintSize,
+    _EncodePackedVarints)
 
 SInt32Encoder = SInt64Encoder = _ModifiedEncoder(
     wire_format.WIRETYPE_VARINT, _EncodeVarint, _VarintSize,
-    wire_format.ZigZagEncode)
+    wire_format.ZigZagEncode, _EncodePackedVarints)
 
 # Note that Python conveniently guarantees that when using the '<' prefix on
 # formats, they will also have the same size across all platforms (as opposed
@@ -623,11 +720,8 @@ def BoolEncoder(field_number, is_repeated, is_packed):
     def EncodePackedField(write, value):
       write(tag_bytes)
       local_EncodeVarint(write, len(value))
-      for element in value:
-        if element:
-          write(true_byte)
-        else:
-          write(false_byte)
+      return write(''.join([element and true_byte or false_byte
+                            for element in value]))
     return EncodePackedField
   elif is_repeated:
     tag_bytes = TagBytes(field_number, wire_format.WIRETYPE_VARINT)
@@ -676,21 +770,30 @@ def StringEncoder(field_number, is_repeated, is_packed):
 def BytesEncoder(field_number, is_repeated, is_packed):
   """Returns an encoder for a bytes field."""
 
+  # decoder imports this module, so it can only be imported once both exist.
+  from google.protobuf.internal import decoder
+
   tag = TagBytes(field_number, wire_format.WIRETYPE_LENGTH_DELIMITED)
   local_EncodeVarint = _EncodeVarint
   local_len = len
+  # Values parsed from a memoryview are memoryviews; writers only take strs.
+  local_memoryview = decoder._memoryview
   assert not is_packed
   if is_repeated:
     def EncodeRepeatedField(write, value):
       for element in value:
         write(tag)
         local_EncodeVarint(write, local_len(element))
+        if element.__class__ is local_memoryview:
+          element = element.tobytes()
         write(element)
     return EncodeRepeatedField
   else:
     def EncodeField(write, value):
       write(tag)
       local_EncodeVarint(write, local_len(value))
+      if value.__class__ is local_memoryview:
+        value = value.tobytes()
       return write(value)
     return EncodeField
 
@@ -0,0 +1,198 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.framing."""
+
+import cStringIO
+import struct
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf import framing
+from google.protobuf import message
+
+
+_CLASSES = {
+    1: unittest_pb2.TestAllTypes,
+    2: unittest_pb2.ForeignMessage,
+    3: unittest_pb2.TestRequired,
+}
+
+
+class _RecordingSink(object):
+
+  def __init__(self):
+    self.writes = []
+
+  def write(self, data):
+    self.writes.append(data)
+
+
+class FramingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.all_types = unittest_pb2.TestAllTypes()
+    self.all_types.optional_int32 = 101
+    self.all_types.repeated_string.append('x' * 300)
+    self.foreign = unittest_pb2.ForeignMessage(c=7)
+
+  def _Encode(self, messages, **kwargs):
+    out = cStringIO.StringIO()
+    writer = framing.FrameWriter(out, _CLASSES, **kwargs)
+    for msg in messages:
+      writer.Write(msg)
+    writer.Flush()
+    return out.getvalue()
+
+  def testRippleHeader(self):
+    data = self._Encode([self.foreign])
+    self.assertEqual('\x00\x00\x00\x02\x00\x02\x08\x07', data)
+
+  def testRoundTrip(self):
+    messages = [self.all_types, self.foreign, self.all_types]
+    data = self._Encode(messages)
+    frames = list(framing.ReadFrames(cStringIO.StringIO(data), _CLASSES))
+    self.assertEqual([1, 2, 1], [message_type for message_type, _ in frames])
+    self.assertEqual(messages, [msg for _, msg in frames])
+    self.assertTrue(isinstance(frames[1][1], unittest_pb2.ForeignMessage))
+
+  def testReadInMemoryBuffers(self):
+    data = self._Encode([self.all_types, self.foreign])
+    for source in (data, bytearray(data), buffer(data), memoryview(data)):
+      frames = list(framing.ReadFrames(source, _CLASSES, chunk_size=7))
+      self.assertEqual([self.all_types, self.foreign],
+                       [msg for _, msg in frames])
+
+  def testFeedBytewise(self):
+    data = self._Encode([self.all_types, self.foreign, self.foreign])
+    decoder = framing.FrameDecoder(_CLASSES)
+    frames = []
+    for i in xrange(len(data)):
+      frames.extend(decoder.Feed(data[i]))
+    decoder.Finish()
+    self.assertEqual(3, len(frames))
+    self.assertEqual((2, self.foreign), decoder.DecodeFrame(*frames[2]))
+
+  def testBytesWanted(self):
+    data = self._Encode([self.all_types])
+    decoder = framing.FrameDecoder(_CLASSES)
+    self.assertEqual(6, decoder.BytesWanted())
+    self.assertEqual([], decoder.Feed(data[:10]))
+    self.assertEqual(len(data) - 10, decoder.BytesWanted())
+    self.assertEqual(1, len(decoder.Feed(data[10:])))
+    self.assertEqual(6, decoder.BytesWanted())
+
+  def testUnknownTypeReturnsPayload(self):
+    writer_classes = {9: unittest_pb2.ForeignMessage}
+    out = cStringIO.StringIO()
+    writer = framing.FrameWriter(out, writer_classes)
+    writer.Write(self.foreign)
+    writer.Flush()
+    frames = list(framing.ReadFrames(out.getvalue(), _CLASSES))
+    self.assertEqual([(9, self.foreign.SerializeToString())], frames)
+
+  def testTruncatedStream(self):
+    data = self._Encode([self.all_types, self.foreign])
+    frames = framing.ReadFrames(data[:-1], _CLASSES)
+    self.assertEqual((1, self.all_types), frames.next())
+    self.assertRaises(message.DecodeError, list, frames)
+
+  def testMaxFrameSize(self):
+    data = self._Encode([self.foreign, self.all_types])
+    frames = framing.ReadFrames(data, _CLASSES, max_frame_size=100,
+                                 chunk_size=8)
+    self.assertEqual((2, self.foreign), frames.next())
+    self.assertRaises(message.DecodeError, list, frames)
+
+  def testDefaultMaxFrameSize(self):
+    # A header announcing a huge payload fails at once, rather than making the
+    # decoder buffer the stream until the payload arrives.
+    header = struct.pack(framing.DEFAULT_HEADER_FORMAT, 0xffffffff, 1)
+    decoder = framing.FrameDecoder(_CLASSES)
+    self.assertRaises(message.DecodeError, decoder.Feed, header)
+    self.assertRaises(message.DecodeError, list,
+                      framing.ReadFrames(header + 'x' * 100, _CLASSES))
+
+    size = framing.DEFAULT_MAX_FRAME_SIZE
+    decoder = framing.FrameDecoder(_CLASSES)
+    self.assertEqual([], decoder.Feed(
+        struct.pack(framing.DEFAULT_HEADER_FORMAT, size, 9)))
+    self.assertRaises(message.DecodeError, framing.FrameDecoder().Feed,
+                      struct.pack(framing.DEFAULT_HEADER_FORMAT, size + 1, 9))
+
+    # None opts out of the limit.
+    decoder = framing.FrameDecoder(_CLASSES, max_frame_size=None)
+    self.assertEqual([], decoder.Feed(header))
+    self.assertEqual(0xffffffff, decoder.BytesWanted())
+
+  def testCustomHeaderFormat(self):
+    data = self._Encode([self.foreign], header_format='<HB')
+    self.assertEqual('\x02\x00\x02\x08\x07', data)
+    self.assertEqual(
+        [(2, self.foreign)],
+        list(framing.ReadFrames(data, _CLASSES, header_format='<HB')))
+
+  def testWriterBatchesSmallFrames(self):
+    sink = _RecordingSink()
+    writer = framing.FrameWriter(sink, _CLASSES, buffer_size=100)
+    for _ in xrange(5):
+      writer.Write(self.foreign)
+    self.assertEqual([], sink.writes)
+    writer.Flush()
+    self.assertEqual(['\x00\x00\x00\x02\x00\x02\x08\x07' * 5], sink.writes)
+
+  def testWriterWritesLargeFramesDirectly(self):
+    sink = _RecordingSink()
+    writer = framing.FrameWriter(sink, _CLASSES, buffer_size=100)
+    writer.Write(self.foreign)
+    writer.Write(self.all_types)
+    payload = self.all_types.SerializeToString()
+    self.assertEqual(
+        ['\x00\x00\x00\x02\x00\x02\x08\x07',
+         '\x00\x00\x01\x32\x00\x01', payload],
+        sink.writes)
+    self.assertEqual(0x132, len(payload))
+    writer.Flush()
+    self.assertEqual(3, len(sink.writes))
+
+  def testWriteUnregisteredClass(self):
+    writer = framing.FrameWriter(_RecordingSink(), _CLASSES)
+    self.assertRaises(message.EncodeError, writer.Write,
+                      unittest_pb2.TestEmptyMessage())
+
+  def testWriteUninitialized(self):
+    writer = framing.FrameWriter(_RecordingSink(), _CLASSES)
+    self.assertRaises(message.EncodeError, writer.Write,
+                      unittest_pb2.TestRequired())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,173 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Test for google.protobuf.json_format."""
+
+import json
+
+import unittest
+from google.protobuf import json_format
+from google.protobuf.internal import test_util
+from google.protobuf import unittest_pb2
+
+
+class JsonFormatTest(unittest.TestCase):
+
+  def testMessageToDict(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_int64 = -5
+    message.optional_bytes = '\x00\xff'
+    message.optional_nested_enum = unittest_pb2.TestAllTypes.BAZ
+    message.optional_nested_message.bb = 1
+    message.repeated_string.extend([u'\xfc', 'b'])
+    message.repeated_nested_message.add()
+    message.repeated_float.append(float('-inf'))
+    self.assertEqual(
+        {'optional_int64': -5,
+         'optional_bytes': 'AP8=',
+         'optional_nested_enum': 'BAZ',
+         'optional_nested_message': {'bb': 1},
+         'repeated_string': [u'\xfc', 'b'],
+         'repeated_nested_message': [{}],
+         'repeated_float': ['-Infinity']},
+        json_format.MessageToDict(message))
+    self.assertEqual(
+        {'optional_int64': -5,
+         'optional_bytes': '00ff',
+         'optional_nested_enum': 3,
+         'optional_nested_message': {'bb': 1},
+         'repeated_string': [u'\xfc', 'b'],
+         'repeated_nested_message': [{}],
+         'repeated_float': ['-Infinity']},
+        json_format.MessageToDict(message, bytes_format='hex',
+                                  use_integers_for_enums=True))
+
+  def testRoundTrip(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    message.repeated_double.extend([float('inf'), float('nan')])
+    for bytes_format in ('base64', 'hex'):
+      text = json_format.MessageToJson(message, bytes_format=bytes_format)
+      parsed = json_format.Parse(text, unittest_pb2.TestAllTypes(),
+                                 bytes_format=bytes_format)
+      self.assertEqual(text, json_format.MessageToJson(
+          parsed, bytes_format=bytes_format))
+
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    self.assertEqual(message, json_format.ParseDict(
+        json_format.MessageToDict(message), unittest_pb2.TestAllExtensions()))
+
+  def testMessageToJsonChunks(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    chunks = list(json_format.MessageToJsonChunks(message, chunk_size=100))
+    self.assertTrue(len(chunks) > 1)
+    self.assertEqual(json.loads(json_format.MessageToJson(message)),
+                     json.loads(''.join(chunks)))
+    self.assertEqual(['{}'], list(json_format.MessageToJsonChunks(
+        unittest_pb2.TestAllTypes())))
+
+  def testMessageToJsonChunksJoinToMessageToJson(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    message.repeated_double.append(float('nan'))
+    for chunk_size in (1, 100, 1 << 16):
+      self.assertEqual(json_format.MessageToJson(message), ''.join(
+          json_format.MessageToJsonChunks(message, chunk_size=chunk_size)))
+    self.assertEqual(
+        ['optional_int32', 'optional_int64', 'optional_uint32'],
+        json_format.MessageToDict(message).keys()[:3])
+
+    message = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(message)
+    self.assertEqual(json_format.MessageToJson(message, bytes_format='hex'),
+                     ''.join(json_format.MessageToJsonChunks(
+                         message, bytes_format='hex')))
+
+  def testParseDict(self):
+    message = json_format.ParseDict(
+        {'optional_int32': '-3',
+         'optional_uint64': 1e3,
+         'optional_double': 'NaN',
+         'optional_float': '1.5',
+         'optional_nested_enum': 'BAR',
+         'optional_foreign_enum': 6,
+         'optional_nested_message': {},
+         'optional_string': None,
+         'repeated_bytes': ['AP8='],
+         'repeated_nested_message': [{'bb': 1}, {}]},
+        unittest_pb2.TestAllTypes())
+    self.assertEqual(-3, message.optional_int32)
+    self.assertEqual(1000, message.optional_uint64)
+    self.assertTrue(message.optional_double != message.optional_double)
+    self.assertEqual(1.5, message.optional_float)
+    self.assertEqual(unittest_pb2.TestAllTypes.BAR,
+                     message.optional_nested_enum)
+    self.assertEqual(unittest_pb2.FOREIGN_BAZ, message.optional_foreign_enum)
+    self.assertTrue(message.HasField('optional_nested_message'))
+    self.assertFalse(message.HasField('optional_string'))
+    self.assertEqual(['\x00\xff'], message.repeated_bytes)
+    self.assertEqual(1, message.repeated_nested_message[0].bb)
+    self.assertEqual(2, len(message.repeated_nested_message))
+
+  def testParseErrors(self):
+    message = unittest_pb2.TestAllTypes()
+    for js_dict in ({'unknown_field': 1},
+                    {'optional_int32': 1.5},
+                    {'optional_int32': 'inf'},
+                    {'optional_int32': True},
+                    {'optional_int32': 1 << 40},
+                    {'optional_string': 1},
+                    {'optional_bytes': 'AP8'},
+                    {'optional_nested_enum': 'QUUX'},
+                    {'optional_nested_message': []},
+                    {'optional_nested_message': {'cc': 1}},
+                    {'repeated_int32': 1},
+                    {'[protobuf_unittest.optional_int32_extension]': 1}):
+      self.assertRaises(json_format.ParseError,
+                        json_format.ParseDict, js_dict, message)
+    self.assertRaises(json_format.ParseError,
+                      json_format.Parse, '{', message)
+
+    json_format.ParseDict({'unknown_field': 1, 'optional_int32': 2}, message,
+                          ignore_unknown_fields=True)
+    self.assertEqual(2, message.optional_int32)
+
+  def testUnknownBytesFormat(self):
+    self.assertRaises(ValueError, json_format.MessageToDict,
+                      unittest_pb2.TestAllTypes(), bytes_format='base32')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,171 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Tests for message classes whose setup is deferred until they are used.
+
+Runs the message and reflection tests again with every class set up lazily.
+"""
+
+import os
+os.environ['PROTOCOL_BUFFERS_PYTHON_CLASS_SETUP'] = 'lazy'
+
+import threading
+import time
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import python_message
+from google.protobuf.internal import test_util
+from google.protobuf import message
+from google.protobuf import reflection
+from google.protobuf.internal.message_test import *
+from google.protobuf.internal.reflection_test import *
+
+
+class LazyClassSetupTest(unittest.TestCase):
+
+  def setUp(self):
+    # The classes of unittest_pb2 are completed by the other tests, so each
+    # test builds its own for an existing descriptor.
+    self.descriptors = [unittest_pb2.TestAllTypes.DESCRIPTOR,
+                        unittest_pb2.TestAllExtensions.DESCRIPTOR]
+    self.classes = [d._concrete_class for d in self.descriptors]
+
+  def tearDown(self):
+    for descriptor, cls in zip(self.descriptors, self.classes):
+      descriptor._concrete_class = cls
+
+  def MakeClass(self, descriptor):
+    class NewMessage(message.Message):
+      __metaclass__ = reflection.GeneratedProtocolMessageType
+      DESCRIPTOR = descriptor
+    return NewMessage
+
+  def assertPending(self, cls):
+    self.assertTrue('_pending_descriptor' in cls.__dict__)
+
+  def assertComplete(self, cls):
+    self.assertFalse('_pending_descriptor' in cls.__dict__)
+
+  def testClassSetupSetting(self):
+    self.assertEqual('lazy', api_implementation.ClassSetup())
+
+  def testCompletedByFirstInstance(self):
+    cls = self.MakeClass(unittest_pb2.TestAllTypes.DESCRIPTOR)
+    self.assertPending(cls)
+    # Enum values and static methods are there from the start.
+    self.assertEqual(3, cls.BAZ)
+    self.assertPending(cls)
+    self.assertFalse('optional_int32' in cls.__dict__)
+
+    proto = cls.FromString(
+        unittest_pb2.TestAllTypes(optional_int32=5).SerializeToString())
+    self.assertComplete(cls)
+    self.assertEqual(5, proto.optional_int32)
+    self.assertTrue('optional_int32' in cls.__dict__)
+
+  def testCompletedByClassAttributeLookup(self):
+    cls = self.MakeClass(unittest_pb2.TestAllTypes.DESCRIPTOR)
+    self.assertEqual(1, cls.OPTIONAL_INT32_FIELD_NUMBER)
+    self.assertComplete(cls)
+    self.assertRaises(AttributeError, getattr, cls, 'NO_SUCH_FIELD_NUMBER')
+
+    cls = self.MakeClass(unittest_pb2.TestAllTypes.DESCRIPTOR)
+    self.assertFalse(hasattr(cls, 'no_such_attribute'))
+    self.assertComplete(cls)
+    self.assertEqual(1, len(cls.ParseMany(['\x08\x01'])))
+
+  def testParseMany(self):
+    cls = self.MakeClass(unittest_pb2.TestAllTypes.DESCRIPTOR)
+    protos = cls.ParseMany(['\x08\x01', '\x08\x02'])
+    self.assertEqual([1, 2], [proto.optional_int32 for proto in protos])
+
+  def testExtensionsRegisteredBeforeCompletion(self):
+    cls = self.MakeClass(unittest_pb2.TestAllExtensions.DESCRIPTOR)
+    for extension_handle in (
+        unittest_pb2.TestAllExtensions._extensions_by_number.itervalues()):
+      cls.RegisterExtension(extension_handle)
+    self.assertPending(cls)
+
+    all_set = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(all_set)
+    data = all_set.SerializeToString()
+    proto = cls.FromString(data)
+    self.assertEqual(101,
+                     proto.Extensions[unittest_pb2.optional_int32_extension])
+    self.assertEqual(data, proto.SerializeToString())
+
+  def testLookupWhileAnotherThreadCompletesClass(self):
+    cls = self.MakeClass(unittest_pb2.TestAllTypes.DESCRIPTOR)
+    results = []
+    def LookUp():
+      try:
+        results.append(cls.OPTIONAL_INT32_FIELD_NUMBER)
+      except AttributeError, e:
+        results.append(e)
+
+    # The lookup waits for the lock, which this thread holds while it
+    # completes the class.
+    python_message._class_setup_lock.acquire()
+    try:
+      thread = threading.Thread(target=LookUp)
+      thread.start()
+      time.sleep(0.05)
+      self.assertEqual([], results)
+      python_message.MaterializeMessage(cls)
+    finally:
+      python_message._class_setup_lock.release()
+    thread.join()
+    self.assertEqual([1], results)
+
+  def testInitReplacedLast(self):
+    cls = self.MakeClass(unittest_pb2.TestAllTypes.DESCRIPTOR)
+    deferred_init = cls.__dict__['__init__']
+    inits = []
+    add_private_helper_methods = python_message._AddPrivateHelperMethods
+    def RecordInit(cls):
+      add_private_helper_methods(cls)
+      inits.append(cls.__dict__['__init__'])
+    python_message._AddPrivateHelperMethods = RecordInit
+    try:
+      proto = cls()
+    finally:
+      python_message._AddPrivateHelperMethods = add_private_helper_methods
+    # Instances created while the class was completed would have waited.
+    self.assertEqual([deferred_init], inits)
+    self.assertFalse(cls.__dict__['__init__'] is deferred_init)
+    self.assertEqual(0, proto.ByteSize())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,206 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Tests for lazily parsed message fields in the pure-Python implementation.
+
+Runs the message and reflection tests again with every message field parsed
+lazily.
+"""
+
+import os
+os.environ['PROTOCOL_BUFFERS_PYTHON_LAZY_PARSING'] = 'all'
+
+import copy
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import python_message
+from google.protobuf.internal import test_util
+from google.protobuf import message
+from google.protobuf.internal.message_test import *
+from google.protobuf.internal.reflection_test import *
+
+
+class LazyParsingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.all_set = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(self.all_set)
+    self.data = self.all_set.SerializeToString()
+    self.descriptor = unittest_pb2.TestAllTypes.DESCRIPTOR
+
+  def assertUnparsed(self, proto, field_name):
+    field = self.descriptor.fields_by_name[field_name]
+    self.assertTrue(isinstance(proto._fields[field], python_message._LazyField))
+
+  def assertParsed(self, proto, field_name):
+    field = self.descriptor.fields_by_name[field_name]
+    self.assertFalse(
+        isinstance(proto._fields[field], python_message._LazyField))
+
+  def testLazyParsingSetting(self):
+    self.assertEqual('all', api_implementation.LazyParsing())
+
+  def testFieldsAreParsedOnAccess(self):
+    proto = unittest_pb2.TestAllTypes.FromString(self.data)
+    self.assertUnparsed(proto, 'optional_nested_message')
+    self.assertUnparsed(proto, 'repeated_foreign_message')
+    self.assertEqual(101, proto.optional_int32)
+    self.assertTrue(proto.HasField('optional_nested_message'))
+    self.assertUnparsed(proto, 'optional_nested_message')
+
+    self.assertEqual(118, proto.optional_nested_message.bb)
+    self.assertParsed(proto, 'optional_nested_message')
+    self.assertEqual(2, len(proto.repeated_foreign_message))
+    self.assertParsed(proto, 'repeated_foreign_message')
+    self.assertEqual(self.all_set, proto)
+
+  def testUntouchedFieldsKeepTheirEncoding(self):
+    # optional_nested_message whose bb (field 1) varint is padded to two
+    # bytes, and which is split across two occurrences.
+    data = '\x92\x01\x03\x08\x85\x00\x92\x01\x00'
+    proto = unittest_pb2.TestAllTypes.FromString(data)
+    self.assertEqual(6, proto.ByteSize())
+    self.assertEqual('\x92\x01\x03\x08\x85\x00', proto.SerializeToString())
+
+    proto.optional_int32 = 1
+    self.assertEqual('\x08\x01\x92\x01\x03\x08\x85\x00',
+                     proto.SerializeToString())
+
+    self.assertEqual(5, proto.optional_nested_message.bb)
+    self.assertEqual('\x08\x01\x92\x01\x02\x08\x05', proto.SerializeToString())
+
+  def testModifyingParsedField(self):
+    proto = unittest_pb2.TestAllTypes.FromString(self.data)
+    proto.ByteSize()
+    proto.optional_nested_message.bb = 1000
+    proto.repeated_nested_message.add().bb = 5
+    expected = unittest_pb2.TestAllTypes()
+    expected.MergeFrom(self.all_set)
+    expected.optional_nested_message.bb = 1000
+    expected.repeated_nested_message.add().bb = 5
+    self.assertEqual(expected.ByteSize(), proto.ByteSize())
+    self.assertEqual(expected.SerializeToString(), proto.SerializeToString())
+
+  def testMergeFromLeavesFieldsUnparsed(self):
+    source = unittest_pb2.TestAllTypes.FromString(self.data)
+    proto = unittest_pb2.TestAllTypes.FromString(self.data)
+    proto.MergeFrom(source)
+    self.assertUnparsed(source, 'optional_nested_message')
+    # Both have the singular field, so merging parses the target's.
+    self.assertParsed(proto, 'optional_nested_message')
+    self.assertUnparsed(proto, 'repeated_nested_message')
+    self.assertEqual(4, len(proto.repeated_nested_message))
+
+    proto = unittest_pb2.TestAllTypes()
+    proto.MergeFrom(source)
+    self.assertUnparsed(proto, 'optional_nested_message')
+
+    # Merging into a parsed field parses the source.
+    proto = unittest_pb2.TestAllTypes()
+    proto.optional_nested_message.bb = 1
+    proto.MergeFrom(source)
+    self.assertEqual(118, proto.optional_nested_message.bb)
+    self.assertUnparsed(source, 'optional_nested_message')
+
+    # Merging a parsed field into an unparsed one parses the target.
+    proto = unittest_pb2.TestAllTypes.FromString(self.data)
+    proto.MergeFrom(self.all_set)
+    self.assertEqual(4, len(proto.repeated_foreign_message))
+
+  def testRepeatedMergeFromKeepsEncoding(self):
+    source = unittest_pb2.TestAllTypes.FromString(self.data)
+    proto = unittest_pb2.TestAllTypes.FromString(self.data)
+    expected = unittest_pb2.TestAllTypes()
+    expected.MergeFrom(self.all_set)
+    for _ in range(10):
+      proto.MergeFrom(source)
+      expected.MergeFrom(self.all_set)
+    self.assertUnparsed(source, 'optional_nested_message')
+    self.assertUnparsed(proto, 'repeated_nested_message')
+    self.assertEqual(expected.ByteSize(), proto.ByteSize())
+    self.assertEqual(expected.SerializeToString(), proto.SerializeToString())
+    self.assertEqual(expected, proto)
+
+  def testCopyIsIndependent(self):
+    source = unittest_pb2.TestAllTypes.FromString(self.data)
+    proto = copy.deepcopy(source)
+    proto.repeated_nested_message.add().bb = 1
+    self.assertEqual(2, len(source.repeated_nested_message))
+    self.assertEqual(3, len(proto.repeated_nested_message))
+
+  def testParseFromBytearray(self):
+    data = bytearray(self.data)
+    proto = unittest_pb2.TestAllTypes()
+    proto.MergeFromString(data)
+    # Ranges of a bytearray are copied, so changing it afterwards is safe.
+    data[:] = '\0' * len(data)
+    self.assertEqual(self.all_set, proto)
+
+  def testSerializeFromMemoryview(self):
+    proto = unittest_pb2.TestAllTypes.FromString(memoryview(self.data))
+    self.assertUnparsed(proto, 'optional_nested_message')
+    self.assertEqual(self.data, proto.SerializeToString())
+
+  def testIsInitializedWithoutParsing(self):
+    proto = unittest_pb2.TestRequiredForeign()
+    proto.optional_message.a = 1
+    proto.repeated_message.add().a = 1
+    data = proto.SerializePartialToString()
+
+    parsed = unittest_pb2.TestRequiredForeign.FromString(data)
+    self.assertFalse(parsed.IsInitialized())
+    self.assertTrue(isinstance(
+        parsed._fields[parsed.DESCRIPTOR.fields_by_name['optional_message']],
+        python_message._LazyField))
+    self.assertEqual(['optional_message.b', 'optional_message.c',
+                      'repeated_message[0].b', 'repeated_message[0].c'],
+                     sorted(parsed.FindInitializationErrors()))
+
+    for sub_message in (proto.optional_message, proto.repeated_message[0]):
+      sub_message.b = 2
+      sub_message.c = 3
+    parsed = unittest_pb2.TestRequiredForeign.FromString(
+        proto.SerializeToString())
+    self.assertTrue(parsed.IsInitialized())
+    self.assertEqual(proto.SerializeToString(), parsed.SerializeToString())
+
+  def testErrorsAreReportedOnAccess(self):
+    # optional_nested_message containing a truncated varint.
+    proto = unittest_pb2.TestAllTypes.FromString('\x92\x01\x02\x08\x85')
+    self.assertRaises(message.DecodeError,
+                      getattr, proto, 'optional_nested_message')
+
+
+if __name__ == '__main__':
+  unittest.main()
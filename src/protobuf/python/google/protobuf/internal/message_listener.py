@@ -76,3 +76,8 @@ class NullMessageListener(object):
 
   def Modified(self):
     pass
+
+
+# NullMessageListener has no state, so messages without a parent all share
+# this instance.
+NULL_MESSAGE_LISTENER = NullMessageListener()
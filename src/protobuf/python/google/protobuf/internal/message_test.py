@@ -45,8 +45,10 @@ __author__ = 'gps@google.com (Gregory P. Smith)'
 
 import copy
 import math
+import mmap
 import operator
 import pickle
+import tempfile
 
 import unittest
 from google.protobuf import unittest_import_pb2
@@ -483,6 +485,168 @@ class MessageTest(unittest.TestCase):
         unittest_pb2.TestParsingMerge.repeated_ext]), 3)
 
 
+  def testParseFromBufferTypes(self):
+    golden_data = test_util.GoldenFile('golden_message').read()
+    temp_file = tempfile.TemporaryFile()
+    temp_file.write(golden_data)
+    temp_file.flush()
+    mapped = mmap.mmap(temp_file.fileno(), 0, access=mmap.ACCESS_READ)
+    for data in (bytearray(golden_data), buffer(golden_data), mapped,
+                 memoryview(golden_data)):
+      golden_message = unittest_pb2.TestAllTypes()
+      golden_message.ParseFromString(data)
+      test_util.ExpectAllFieldsSet(self, golden_message)
+      self.assertEqual(golden_data, golden_message.SerializeToString())
+    mapped.close()
+    temp_file.close()
+
+  def testParseFromMemoryViewSharesBytes(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_bytes = 'x' * 100
+    message.repeated_bytes.append('y' * 10)
+    message.optional_string = u'\u00e9t\u00e9'
+    source = bytearray(message.SerializeToString() + '\xa0\x1f\x01')
+    parsed = unittest_pb2.TestAllTypes()
+    parsed.MergeFromString(memoryview(source))
+
+    self.assertTrue(isinstance(parsed.optional_bytes, memoryview))
+    self.assertEqual('x' * 100, parsed.optional_bytes)
+    self.assertEqual('y' * 10, parsed.repeated_bytes[0])
+    self.assertEqual(u'\u00e9t\u00e9', parsed.optional_string)
+    # Unknown fields are always copied.
+    self.assertEqual([('\xa0\x1f', '\x01')], parsed._unknown_fields)
+    self.assertEqual(str(source), parsed.SerializeToString())
+
+    # The value is a view of the source, not a copy.
+    offset = str(source).index('x' * 100)
+    source[offset] = 'z'
+    self.assertEqual('z' + 'x' * 99, parsed.optional_bytes)
+
+  def testPackedFieldsMatchUnpacked(self):
+    # Packed payloads are decoded and encoded in bulk, unpacked ones value by
+    # value; both must agree.
+    values = {
+        'int32': [0, 1, 127, 128, -1, -2**31, 2**31 - 1],
+        'int64': [0, 127, 300, -1, -2**63, 2**63 - 1],
+        'uint32': [0, 1, 127, 128, 2**32 - 1],
+        'uint64': [0, 127, 16384, 2**64 - 1],
+        'sint32': [0, -1, 1, -64, 64, -2**31, 2**31 - 1],
+        'sint64': [0, -1, -2**63, 2**63 - 1],
+        'fixed32': [0, 1, 2**32 - 1],
+        'fixed64': [0, 1, 2**64 - 1],
+        'sfixed32': [0, -1, -2**31, 2**31 - 1],
+        'sfixed64': [0, -1, -2**63, 2**63 - 1],
+        'float': [0.0, -1.5, 1e10],
+        'double': [0.0, -1.5, 1e100],
+        'bool': [True, False, True],
+        }
+    packed = unittest_pb2.TestPackedTypes()
+    unpacked = unittest_pb2.TestUnpackedTypes()
+    for name, field_values in values.iteritems():
+      getattr(packed, 'packed_' + name).extend(field_values)
+      getattr(unpacked, 'unpacked_' + name).extend(field_values)
+
+    parsed = unittest_pb2.TestUnpackedTypes()
+    parsed.ParseFromString(packed.SerializeToString())
+    self.assertEqual(unpacked, parsed)
+    parsed = unittest_pb2.TestPackedTypes()
+    parsed.ParseFromString(unpacked.SerializeToString())
+    self.assertEqual(packed, parsed)
+    self.assertEqual(packed.SerializeToString(), parsed.SerializeToString())
+    self.assertEqual(packed.ByteSize(), len(packed.SerializeToString()))
+
+  def testTruncatedPackedFields(self):
+    proto = unittest_pb2.TestPackedTypes()
+    for data in ('\xd2\x05\x02\x01\x80',       # packed_int32, last varint
+                 '\xd2\x05\x01\x80\x01',       # cut short by the length
+                 '\x82\x06\x05\x01\x00\x00\x00\x02'):  # packed_fixed32
+      self.assertRaises(message.DecodeError, proto.ParseFromString, data)
+
+  def testParseMany(self):
+    golden = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(golden)
+    data = [golden.SerializeToString(), '', '\x08\x01']
+    parsed = unittest_pb2.TestAllTypes.ParseMany(iter(data))
+    self.assertEqual(
+        [golden, unittest_pb2.TestAllTypes(), unittest_pb2.TestAllTypes(
+            optional_int32=1)],
+        parsed)
+    self.assertEqual([], unittest_pb2.TestAllTypes.ParseMany([]))
+    self.assertRaises(message.DecodeError,
+                      unittest_pb2.TestAllTypes.ParseMany, ['', '\x08'])
+
+  def testSerializeMany(self):
+    messages = [unittest_pb2.TestAllTypes(optional_int32=i) for i in range(3)]
+    messages[1].optional_nested_message.bb = 1
+    data = [proto.SerializeToString() for proto in messages]
+    self.assertEqual(data, unittest_pb2.TestAllTypes.SerializeMany(messages))
+    self.assertEqual(
+        ''.join(data),
+        unittest_pb2.TestAllTypes.SerializeMany(iter(messages), join=True))
+    self.assertEqual([], unittest_pb2.TestAllTypes.SerializeMany([]))
+
+    required = [unittest_pb2.TestRequired(a=1, b=2, c=3),
+                unittest_pb2.TestRequired(a=1)]
+    self.assertRaises(message.EncodeError,
+                      unittest_pb2.TestRequired.SerializeMany, required)
+    self.assertEqual(
+        [required[0].SerializeToString()],
+        unittest_pb2.TestRequired.SerializeMany(required[:1]))
+
+  def testFromStringProjected(self):
+    golden = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(golden)
+    data = golden.SerializeToString()
+    proto = unittest_pb2.TestAllTypes.FromStringProjected(
+        data, ['optional_int32', 'repeated_nested_message.bb',
+               'optional_foreign_message', 'repeated_int64'])
+
+    expected = unittest_pb2.TestAllTypes()
+    expected.optional_int32 = golden.optional_int32
+    expected.optional_foreign_message.c = golden.optional_foreign_message.c
+    expected.repeated_int64.extend(golden.repeated_int64)
+    for nested in golden.repeated_nested_message:
+      expected.repeated_nested_message.add(bb=nested.bb)
+    self.assertEqual(expected, proto)
+    self.assertEqual(expected.SerializeToString(), proto.SerializeToString())
+
+    # Asking for a whole field and part of it asks for the whole field.
+    proto = unittest_pb2.TestRecursiveMessage(i=1)
+    proto.a.i = 2
+    proto.a.a.i = 3
+    data = proto.SerializeToString()
+    projected = unittest_pb2.TestRecursiveMessage.FromStringProjected(
+        data, ['a.a.i', 'a.a'])
+    self.assertEqual(proto.a.a, projected.a.a)
+    self.assertFalse(projected.HasField('i'))
+    self.assertFalse(projected.a.HasField('i'))
+    projected = unittest_pb2.TestRecursiveMessage.FromStringProjected(
+        data, 'a.i')
+    self.assertEqual(2, projected.a.i)
+    self.assertFalse(projected.a.HasField('a'))
+
+    self.assertRaises(ValueError, unittest_pb2.TestAllTypes.FromStringProjected,
+                      data, ['no_such_field'])
+    self.assertRaises(ValueError, unittest_pb2.TestAllTypes.FromStringProjected,
+                      data, ['optional_int32.value'])
+    self.assertRaises(message.DecodeError,
+                      unittest_pb2.TestAllTypes.FromStringProjected,
+                      '\x08', ['optional_int32'])
+
+  def testFromStringProjectedKeepingSkippedFields(self):
+    golden = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(golden)
+    proto = unittest_pb2.TestAllTypes.FromStringProjected(
+        golden.SerializeToString(), ['optional_nested_message.bb'],
+        keep_skipped_fields=True)
+    self.assertEqual(golden.optional_nested_message.bb,
+                     proto.optional_nested_message.bb)
+    self.assertFalse(proto.HasField('optional_int32'))
+
+    # The skipped fields are serialized again.
+    reparsed = unittest_pb2.TestAllTypes.FromString(proto.SerializeToString())
+    self.assertEqual(golden, reparsed)
+
   def testSortEmptyRepeatedCompositeContainer(self):
     """Exercise a scenario that has led to segfaults in the past.
     """
@@ -50,20 +50,22 @@ this file*.
 
 __author__ = 'robinson@google.com (Will Robinson)'
 
-try:
-  from cStringIO import StringIO
-except ImportError:
-  from StringIO import StringIO
 import copy_reg
+import itertools
+import operator
 import struct
+import sys
+import threading
 import weakref
 
 # We use "as" to avoid name collisions with variables.
+from google.protobuf.internal import api_implementation
 from google.protobuf.internal import containers
 from google.protobuf.internal import decoder
 from google.protobuf.internal import encoder
 from google.protobuf.internal import enum_type_wrapper
 from google.protobuf.internal import message_listener as message_listener_mod
+from google.protobuf.internal import table_decoder
 from google.protobuf.internal import type_checkers
 from google.protobuf.internal import wire_format
 from google.protobuf import descriptor as descriptor_mod
@@ -83,6 +85,50 @@ def InitMessage(descriptor, cls):
   cls._decoders_by_tag = {}
   cls._extensions_by_name = {}
   cls._extensions_by_number = {}
+  # Maps each declared field to a (member, bit) tuple of the member descriptor
+  # of its slot and its bit in _has_bits.  Only filled in with the 'slots'
+  # class layout; see _AddSlots().
+  cls._field_slots = {}
+  _AddEnumValues(descriptor, cls)
+  _AddStaticMethods(cls)
+  if api_implementation.ClassSetup() == 'lazy':
+    # See MaterializeMessage().
+    cls._pending_descriptor = descriptor
+    _AddDeferredInitMethod(cls)
+  else:
+    _CompleteMessage(descriptor, cls)
+
+
+# Held while a class set up lazily is completed, or an extension registered.
+_class_setup_lock = threading.RLock()
+
+
+def MaterializeMessage(cls):
+  """Completes a class whose setup InitMessage() deferred.
+
+  Called when the first instance of the class is created and, by
+  GeneratedProtocolMessageType, when the class is asked for an attribute it
+  lacks.
+
+  Returns:
+    True if the class was completed by this call, False if there was nothing
+    left to do.
+  """
+  _class_setup_lock.acquire()
+  try:
+    descriptor = cls.__dict__.get('_pending_descriptor')
+    if descriptor is None:
+      return False
+    # Removed first, so that lookups made while completing the class do not
+    # start over.
+    del cls._pending_descriptor
+    _CompleteMessage(descriptor, cls)
+    return True
+  finally:
+    _class_setup_lock.release()
+
+
+def _CompleteMessage(descriptor, cls):
   if (descriptor.has_options and
       descriptor.GetOptions().message_set_wire_format):
     cls._decoders_by_tag[decoder.MESSAGE_SET_ITEM_TAG] = (
@@ -91,15 +137,20 @@ def InitMessage(descriptor, cls):
   # Attach stuff to each FieldDescriptor for quick lookup later on.
   for field in descriptor.fields:
     _AttachFieldHelpers(cls, field)
+  # Extensions registered while the class setup was deferred.
+  for extension_handle in cls._extensions_by_number.itervalues():
+    _AttachFieldHelpers(cls, extension_handle)
 
-  _AddEnumValues(descriptor, cls)
-  _AddInitMethod(descriptor, cls)
+  if api_implementation.ClassLayout() == 'slots':
+    cls._fields = property(_SlotFieldDict)
   _AddPropertiesForFields(descriptor, cls)
   _AddPropertiesForExtensions(descriptor, cls)
-  _AddStaticMethods(cls)
   _AddMessageMethods(descriptor, cls)
   _AddPrivateHelperMethods(cls)
   copy_reg.pickle(cls, lambda obj: (cls, (), obj.__getstate__()))
+  # Last, so that until the class is complete, instances created by other
+  # threads go through the deferred __init__, which waits for it.
+  _AddInitMethod(descriptor, cls)
 
 
 # Stateless helpers for GeneratedProtocolMessageType below.
@@ -165,18 +216,40 @@ def _AddSlots(message_descriptor, dictionary):
   """Adds a __slots__ entry to dictionary, containing the names of all valid
   attributes for this message type.
 
+  With the 'slots' class layout (see api_implementation.ClassLayout()), the
+  values of the declared fields are not kept in a _fields dict but each in a
+  slot of its own, named by _SlotName().  A bit of _has_bits, the field's
+  _dirty_bit, is set while the slot holds a value.  Extensions are kept in
+  _extension_fields, a dict created when the first one is set.  _fields is
+  then a property returning a _SlotFieldDict view of all of these.
+
   Args:
     message_descriptor: A Descriptor instance describing this message type.
     dictionary: Class dictionary to which we'll add a '__slots__' entry.
   """
-  dictionary['__slots__'] = ['_cached_byte_size',
-                             '_cached_byte_size_dirty',
-                             '_fields',
-                             '_unknown_fields',
-                             '_is_present_in_parent',
-                             '_listener',
-                             '_listener_for_children',
-                             '__weakref__']
+  slots = ['_cached_byte_size',
+           '_cached_byte_size_dirty',
+           '_field_sizes',
+           '_dirty_bits',
+           '_unchecked_bits',
+           '_cached_serialization',
+           '_unknown_fields',
+           '_is_present_in_parent',
+           '_listener',
+           '_listeners_for_children',
+           '__weakref__']
+  if api_implementation.ClassLayout() == 'slots':
+    slots.append('_has_bits')
+    slots.append('_extension_fields')
+    slots.extend(_SlotName(field) for field in message_descriptor.fields)
+  else:
+    slots.append('_fields')
+  dictionary['__slots__'] = slots
+
+
+def _SlotName(field):
+  """Returns the name of the slot holding |field| in the 'slots' layout."""
+  return '_%s_value' % field.name
 
 
 def _IsMessageSetExtension(field):
@@ -188,6 +261,18 @@ def _IsMessageSetExtension(field):
           field.label == _FieldDescriptor.LABEL_OPTIONAL)
 
 
+def _IsLazyField(field):
+  """Returns true if |field| is to be kept encoded until it is accessed.
+  See api_implementation.LazyParsing()."""
+  if field.type != _FieldDescriptor.TYPE_MESSAGE or field.is_extension:
+    return False
+  lazy_parsing = api_implementation.LazyParsing()
+  if lazy_parsing == 'all':
+    return True
+  return (lazy_parsing == 'hint' and
+          field.has_options and field.GetOptions().lazy)
+
+
 def _AttachFieldHelpers(cls, field_descriptor):
   is_repeated = (field_descriptor.label == _FieldDescriptor.LABEL_REPEATED)
   is_packed = (field_descriptor.has_options and
@@ -206,13 +291,37 @@ def _AttachFieldHelpers(cls, field_descriptor):
   field_descriptor._sizer = sizer
   field_descriptor._default_constructor = _DefaultValueConstructorForField(
       field_descriptor)
+  field_descriptor._lazy = _IsLazyField(field_descriptor)
+  # The bit marking the field as modified in _dirty_bits.  Extensions have
+  # none, so modifying one makes ByteSize() size the whole message again.
+  if field_descriptor.is_extension:
+    field_descriptor._dirty_bit = 0
+  else:
+    field_descriptor._dirty_bit = 1 << field_descriptor.index
+
+  # With the 'slots' layout, decoders keep declared fields' values in slots.
+  slot = None
+  if (api_implementation.ClassLayout() == 'slots' and
+      not field_descriptor.is_extension):
+    slot = cls._field_slots[field_descriptor] = (
+        cls.__dict__[_SlotName(field_descriptor)],
+        field_descriptor._dirty_bit)
 
   def AddDecoder(wiretype, is_packed):
     tag_bytes = encoder.TagBytes(field_descriptor.number, wiretype)
-    cls._decoders_by_tag[tag_bytes] = (
-        type_checkers.TYPE_TO_DECODER[field_descriptor.type](
-            field_descriptor.number, is_repeated, is_packed,
-            field_descriptor, field_descriptor._default_constructor))
+    if field_descriptor._lazy:
+      if is_repeated:
+        new_lazy = _LazyRepeatedMessages
+      else:
+        new_lazy = _LazyMessage
+      field_decoder = decoder.LazyMessageDecoder(
+          field_descriptor.number, is_repeated, is_packed,
+          field_descriptor, new_lazy, slot)
+    else:
+      field_decoder = type_checkers.TYPE_TO_DECODER[field_descriptor.type](
+          field_descriptor.number, is_repeated, is_packed,
+          field_descriptor, field_descriptor._default_constructor, slot)
+    cls._decoders_by_tag[tag_bytes] = field_decoder
 
   AddDecoder(type_checkers.FIELD_TYPE_TO_WIRE_TYPE[field_descriptor.type],
              False)
@@ -269,13 +378,19 @@ def _DefaultValueConstructorForField(field):
       message_type = field.message_type
       def MakeRepeatedMessageDefault(message):
         return containers.RepeatedCompositeFieldContainer(
-            message._listener_for_children, field.message_type)
+            message._ListenerForField(field), field.message_type)
       return MakeRepeatedMessageDefault
     else:
       type_checker = type_checkers.GetTypeChecker(field.cpp_type, field.type)
+      typecode = type_checkers.CPPTYPE_TO_ARRAY_TYPECODE.get(field.cpp_type)
+      if typecode is not None:
+        def MakeRepeatedNumericDefault(message):
+          return containers.RepeatedNumericFieldContainer(
+              message._ListenerForField(field), type_checker, typecode)
+        return MakeRepeatedNumericDefault
       def MakeRepeatedScalarDefault(message):
         return containers.RepeatedScalarFieldContainer(
-            message._listener_for_children, type_checker)
+            message._ListenerForField(field), type_checker)
       return MakeRepeatedScalarDefault
 
   if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
@@ -283,7 +398,7 @@ def _DefaultValueConstructorForField(field):
     message_type = field.message_type
     def MakeSubMessageDefault(message):
       result = message_type._concrete_class()
-      result._SetListener(message._listener_for_children)
+      result._SetListener(message._ListenerForField(field))
       return result
     return MakeSubMessageDefault
 
@@ -297,16 +412,36 @@ def _DefaultValueConstructorForField(field):
 def _AddInitMethod(message_descriptor, cls):
   """Adds an __init__ method to cls."""
   fields = message_descriptor.fields
+  local_null_listener = message_listener_mod.NULL_MESSAGE_LISTENER
+  slot_layout = api_implementation.ClassLayout() == 'slots'
   def init(self, **kwargs):
     self._cached_byte_size = 0
     self._cached_byte_size_dirty = len(kwargs) > 0
-    self._fields = {}
+    # Each declared field's contribution to _cached_byte_size, indexed like
+    # DESCRIPTOR.fields, and a bitmap of the fields modified since it was
+    # computed (see _AttachFieldHelpers()).  None means it must be computed
+    # from scratch.
+    self._field_sizes = None
+    self._dirty_bits = None
+    # A bitmap of the fields which IsInitialized() has to check again, along
+    # with those in _dirty_bits.  None means all of them.
+    self._unchecked_bits = None
+    # What SerializePartialToString() returned while the message was clean,
+    # if it has been called since; dropped as soon as the message is modified.
+    self._cached_serialization = None
+    if slot_layout:
+      self._has_bits = 0
+      self._extension_fields = None
+    else:
+      self._fields = {}
     # _unknown_fields is () when empty for efficiency, and will be turned into
     # a list if fields are added.
     self._unknown_fields = ()
     self._is_present_in_parent = False
-    self._listener = message_listener_mod.NullMessageListener()
-    self._listener_for_children = _Listener(self)
+    self._listener = local_null_listener
+    # Maps a field to the listener registered with its value.  None until the
+    # first child needs one, since most messages are leaves.
+    self._listeners_for_children = None
     for field_name, field_value in kwargs.iteritems():
       field = _GetFieldByName(message_descriptor, field_name)
       if field is None:
@@ -332,6 +467,18 @@ def _AddInitMethod(message_descriptor, cls):
   cls.__init__ = init
 
 
+def _AddDeferredInitMethod(cls):
+  """Adds an __init__ method to cls which completes the class, replacing
+  itself with the one added by _AddInitMethod()."""
+  def init(self, **kwargs):
+    MaterializeMessage(cls)
+    cls.__init__(self, **kwargs)
+
+  init.__module__ = None
+  init.__doc__ = None
+  cls.__init__ = init
+
+
 def _GetFieldByName(message_descriptor, field_name):
   """Returns a field descriptor by field name.
 
@@ -399,6 +546,7 @@ def _AddPropertiesForRepeatedField(field, cls):
   """
   proto_field_name = field.name
   property_name = _PropertyName(proto_field_name)
+  slot = cls._field_slots.get(field)
 
   def getter(self):
     field_value = self._fields.get(field)
@@ -413,7 +561,25 @@ def _AddPropertiesForRepeatedField(field, cls):
       #   in CPython but we haven't investigated others.  This warning appears
       #   in several other locations in this file.
       field_value = self._fields.setdefault(field, field_value)
+    elif field_value.__class__ is _LazyRepeatedMessages:
+      field_value = field_value._Materialize(self)
     return field_value
+
+  if slot is not None:
+    get_slot = slot[0].__get__
+    set_slot = slot[0].__set__
+    has_bit = slot[1]
+    # Unlike the setdefault() above, this is not atomic.
+    def getter(self):
+      if self._has_bits & has_bit:
+        field_value = get_slot(self)
+        if field_value.__class__ is _LazyRepeatedMessages:
+          field_value = field_value._Materialize(self)
+        return field_value
+      field_value = field._default_constructor(self)
+      set_slot(self, field_value)
+      self._has_bits |= has_bit
+      return field_value
   getter.__module__ = None
   getter.__doc__ = 'Getter for %s.' % proto_field_name
 
@@ -442,22 +608,47 @@ def _AddPropertiesForNonRepeatedScalarField(field, cls):
   property_name = _PropertyName(proto_field_name)
   type_checker = type_checkers.GetTypeChecker(field.cpp_type, field.type)
   default_value = field.default_value
+  dirty_bit = field._dirty_bit
   valid_values = set()
+  slot = cls._field_slots.get(field)
 
   def getter(self):
     # TODO(protobuf-team): This may be broken since there may not be
     # default_value.  Combine with has_default_value somehow.
     return self._fields.get(field, default_value)
-  getter.__module__ = None
-  getter.__doc__ = 'Getter for %s.' % proto_field_name
   def setter(self, new_value):
     type_checker.CheckValue(new_value)
     self._fields[field] = new_value
     # Check _cached_byte_size_dirty inline to improve performance, since scalar
     # setters are called frequently.
-    if not self._cached_byte_size_dirty:
-      self._Modified()
+    if self._cached_byte_size_dirty:
+      dirty_bits = self._dirty_bits
+      if dirty_bits is not None:
+        self._dirty_bits = dirty_bits | dirty_bit
+    else:
+      self._FieldModified(field)
+
+  if slot is not None:
+    get_slot = slot[0].__get__
+    set_slot = slot[0].__set__
+    # The field's bit in _has_bits is its dirty bit.
+    def getter(self):
+      if self._has_bits & dirty_bit:
+        return get_slot(self)
+      return default_value
+    def setter(self, new_value):
+      type_checker.CheckValue(new_value)
+      set_slot(self, new_value)
+      self._has_bits |= dirty_bit
+      if self._cached_byte_size_dirty:
+        dirty_bits = self._dirty_bits
+        if dirty_bits is not None:
+          self._dirty_bits = dirty_bits | dirty_bit
+      else:
+        self._FieldModified(field)
 
+  getter.__module__ = None
+  getter.__doc__ = 'Getter for %s.' % proto_field_name
   setter.__module__ = None
   setter.__doc__ = 'Setter for %s.' % proto_field_name
 
@@ -487,13 +678,14 @@ def _AddPropertiesForNonRepeatedCompositeField(field, cls):
   # What if someone sets message_type later on (which makes for simpler
   # dyanmic proto descriptor and class creation code).
   message_type = field.message_type
+  slot = cls._field_slots.get(field)
 
   def getter(self):
     field_value = self._fields.get(field)
     if field_value is None:
       # Construct a new object to represent this field.
       field_value = message_type._concrete_class()  # use field.message_type?
-      field_value._SetListener(self._listener_for_children)
+      field_value._SetListener(self._ListenerForField(field))
 
       # Atomically check if another thread has preempted us and, if not, swap
       # in the new object we just created.  If someone has preempted us, we
@@ -502,7 +694,26 @@ def _AddPropertiesForNonRepeatedCompositeField(field, cls):
       #   in CPython but we haven't investigated others.  This warning appears
       #   in several other locations in this file.
       field_value = self._fields.setdefault(field, field_value)
+    elif field_value.__class__ is _LazyMessage:
+      field_value = field_value._Materialize(self)
     return field_value
+
+  if slot is not None:
+    get_slot = slot[0].__get__
+    set_slot = slot[0].__set__
+    has_bit = slot[1]
+    # Unlike the setdefault() above, this is not atomic.
+    def getter(self):
+      if self._has_bits & has_bit:
+        field_value = get_slot(self)
+        if field_value.__class__ is _LazyMessage:
+          field_value = field_value._Materialize(self)
+        return field_value
+      field_value = message_type._concrete_class()
+      field_value._SetListener(self._ListenerForField(field))
+      set_slot(self, field_value)
+      self._has_bits |= has_bit
+      return field_value
   getter.__module__ = None
   getter.__doc__ = 'Getter for %s.' % proto_field_name
 
@@ -526,29 +737,37 @@ def _AddPropertiesForExtensions(descriptor, cls):
 
 
 def _AddStaticMethods(cls):
-  # TODO(robinson): This probably needs to be thread-safe(?)
   def RegisterExtension(extension_handle):
     extension_handle.containing_type = cls.DESCRIPTOR
-    _AttachFieldHelpers(cls, extension_handle)
-
-    # Try to insert our extension, failing if an extension with the same number
-    # already exists.
-    actual_handle = cls._extensions_by_number.setdefault(
-        extension_handle.number, extension_handle)
-    if actual_handle is not extension_handle:
-      raise AssertionError(
-          'Extensions "%s" and "%s" both try to extend message type "%s" with '
-          'field number %d.' %
-          (extension_handle.full_name, actual_handle.full_name,
-           cls.DESCRIPTOR.full_name, extension_handle.number))
-
-    cls._extensions_by_name[extension_handle.full_name] = extension_handle
-
-    handle = extension_handle  # avoid line wrapping
-    if _IsMessageSetExtension(handle):
-      # MessageSet extension.  Also register under type name.
-      cls._extensions_by_name[
-          extension_handle.message_type.full_name] = extension_handle
+    _class_setup_lock.acquire()
+    try:
+      # Until the class is completed, its extensions only need to be recorded.
+      if '_pending_descriptor' not in cls.__dict__:
+        _AttachFieldHelpers(cls, extension_handle)
+      # The table-driven parser compiles _decoders_by_tag on first use; make
+      # it pick up the new extension.
+      cls._parse_table = None
+
+      # Try to insert our extension, failing if an extension with the same
+      # number already exists.
+      actual_handle = cls._extensions_by_number.setdefault(
+          extension_handle.number, extension_handle)
+      if actual_handle is not extension_handle:
+        raise AssertionError(
+            'Extensions "%s" and "%s" both try to extend message type "%s" '
+            'with field number %d.' %
+            (extension_handle.full_name, actual_handle.full_name,
+             cls.DESCRIPTOR.full_name, extension_handle.number))
+
+      cls._extensions_by_name[extension_handle.full_name] = extension_handle
+
+      handle = extension_handle  # avoid line wrapping
+      if _IsMessageSetExtension(handle):
+        # MessageSet extension.  Also register under type name.
+        cls._extensions_by_name[
+            extension_handle.message_type.full_name] = extension_handle
+    finally:
+      _class_setup_lock.release()
 
   cls.RegisterExtension = staticmethod(RegisterExtension)
 
@@ -558,6 +777,110 @@ def _AddStaticMethods(cls):
     return message
   cls.FromString = staticmethod(FromString)
 
+  local_AsBuffer = decoder.AsBuffer
+
+  def ParseMany(serialized_messages):
+    """Parses each string of an iterable into a new message; returns a list."""
+    messages = []
+    append = messages.append
+    internal_parse = cls._InternalParse
+    try:
+      for serialized in serialized_messages:
+        message = cls()
+        serialized = local_AsBuffer(serialized)
+        length = len(serialized)
+        if internal_parse(message, serialized, 0, length) != length:
+          raise message_mod.DecodeError('Unexpected end-group tag.')
+        append(message)
+    except IndexError:
+      raise message_mod.DecodeError('Truncated message.')
+    except struct.error, e:
+      raise message_mod.DecodeError(e)
+    return messages
+  cls.ParseMany = staticmethod(ParseMany)
+
+  # Maps a (field paths, keep_skipped_fields) key to the function compiled
+  # for it by _ProjectedParser().
+  projections = {}
+
+  def FromStringProjected(s, field_paths, keep_skipped_fields=False):
+    """Parses only some fields of a serialized message into a new message.
+
+    Args:
+      s: The serialized message, as accepted by MergeFromString().
+      field_paths: Iterable of the fields to parse.  A path names a field of
+        this message or, separated by dots, a field of a message field, like
+        'nodes.nodeid'.  The whole of a field named by a path is parsed.
+      keep_skipped_fields: If true, the fields which are not parsed are kept
+        in encoded form among the unknown fields of their message, so that
+        they are serialized again.  Otherwise they are dropped, as are
+        unknown fields.
+
+    Returns:
+      The new message.
+
+    Raises:
+      ValueError: A path names a field which does not exist, or continues past
+        a field which is not a message.
+      message.DecodeError: The parsed part of |s| is invalid.
+    """
+    if isinstance(field_paths, basestring):
+      field_paths = [field_paths]
+    message = cls()
+    key = (frozenset(field_paths), bool(keep_skipped_fields))
+    projected_parse = projections.get(key)
+    if projected_parse is None:
+      projected_parse = projections[key] = _ProjectedParser(
+          cls, _ProjectionTree(cls.DESCRIPTOR, key[0]), key[1])
+    s = local_AsBuffer(s)
+    length = len(s)
+    try:
+      if projected_parse(message, s, 0, length) != length:
+        raise message_mod.DecodeError('Unexpected end-group tag.')
+    except IndexError:
+      raise message_mod.DecodeError('Truncated message.')
+    except struct.error, e:
+      raise message_mod.DecodeError(e)
+    return message
+  cls.FromStringProjected = staticmethod(FromStringProjected)
+
+  # Whether a message of this type can be missing required fields, i.e.
+  # whether IsInitialized() has anything to check.  None until first needed.
+  cls._may_lack_required_fields = None
+
+  def SerializeMany(messages, join=False):
+    """Serializes an iterable of messages of this type.
+
+    Returns:
+      A list holding the serialized messages or, if |join| is true, a single
+      str of all of them concatenated.
+    """
+    check_initialized = cls._may_lack_required_fields
+    if check_initialized is None:
+      check_initialized = cls._may_lack_required_fields = (
+          _MayLackRequiredFields(cls.DESCRIPTOR))
+    results = []
+    out = []
+    write_bytes = out.append
+    for message in messages:
+      if message.__class__ is not cls:
+        raise TypeError(
+            'SerializeMany() expected %s got %s.' %
+            (cls.__name__, type(message).__name__))
+      if check_initialized and not message.IsInitialized():
+        raise message_mod.EncodeError(
+            'Message %s is missing required fields: %s' % (
+            cls.DESCRIPTOR.full_name,
+            ','.join(message.FindInitializationErrors())))
+      message._InternalSerialize(write_bytes)
+      if not join:
+        results.append(''.join(out))
+        del out[:]
+    if join:
+      return ''.join(out)
+    return results
+  cls.SerializeMany = staticmethod(SerializeMany)
+
 
 def _IsPresent(item):
   """Given a (FieldDescriptor, value) tuple from _fields, return true if the
@@ -571,15 +894,214 @@ def _IsPresent(item):
     return True
 
 
+_FieldNumber = operator.attrgetter('number')
+
+
+def _ItemFieldNumber(item):
+  return item[0].number
+
+
+def _MergeByNumber(items, extension_items):
+  """Yields the (FieldDescriptor, value) tuples of two sequences which are
+  each in field number order, merged in field number order."""
+  extension_items = iter(extension_items)
+  extension_item = next(extension_items, None)
+  for item in items:
+    number = item[0].number
+    while extension_item is not None and extension_item[0].number < number:
+      yield extension_item
+      extension_item = next(extension_items, None)
+    yield item
+  if extension_item is not None:
+    yield extension_item
+    for extension_item in extension_items:
+      yield extension_item
+
+
+def _PresentExtensions(extension_items):
+  """Returns the present ones of (FieldDescriptor, value) tuples of
+  extensions, in field number order.  There are usually few of these."""
+  present = [item for item in extension_items if _IsPresent(item)]
+  present.sort(key=_ItemFieldNumber)
+  return present
+
+
 def _AddListFieldsMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
+  # The declared fields in field number order, each with whether it is
+  # repeated and whether it is a message, so that present values can be told
+  # apart without calling _IsPresent().  Once a quarter or so of the fields
+  # are set, walking this is cheaper than sorting the set ones.
+  cls._fields_in_order = [
+      (field, field.label == _FieldDescriptor.LABEL_REPEATED,
+       field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE)
+      for field in sorted(message_descriptor.fields, key=_FieldNumber)]
+  # The number of set fields from which to walk _fields_in_order.
+  # Extensions are not in it, so messages which can have them always sort.
+  if message_descriptor.is_extendable:
+    cls._min_fields_to_walk = sys.maxint
+  else:
+    cls._min_fields_to_walk = len(cls._fields_in_order) // 4 + 1
+  fields_in_order = cls._fields_in_order
+  min_fields_to_walk = cls._min_fields_to_walk
+
   def ListFields(self):
-    all_fields = [item for item in self._fields.iteritems() if _IsPresent(item)]
-    all_fields.sort(key = lambda item: item[0].number)
+    fields = self._fields
+    if len(fields) < min_fields_to_walk:
+      all_fields = [item for item in fields.iteritems() if _IsPresent(item)]
+      all_fields.sort(key=_ItemFieldNumber)
+      return all_fields
+    all_fields = []
+    for field, is_repeated, is_message in fields_in_order:
+      value = fields.get(field)
+      if value is None:
+        continue
+      if is_repeated:
+        if not value:
+          continue
+      elif is_message and not value._is_present_in_parent:
+        continue
+      all_fields.append((field, value))
     return all_fields
 
+  def IterDeclaredFields(fields, remaining):
+    # Stops once the |remaining| declared fields in |fields| have been seen.
+    for field, is_repeated, is_message in fields_in_order:
+      if not remaining:
+        return
+      value = fields.get(field)
+      if value is None:
+        continue
+      remaining -= 1
+      if is_repeated:
+        if not value:
+          continue
+      elif is_message and not value._is_present_in_parent:
+        continue
+      yield (field, value)
+
+  is_extendable = message_descriptor.is_extendable
+  def IterFields(self):
+    fields = self._fields
+    if not is_extendable:
+      return IterDeclaredFields(fields, len(fields))
+    extension_items = [item for item in fields.iteritems()
+                       if item[0].is_extension]
+    declared = IterDeclaredFields(fields, len(fields) - len(extension_items))
+    if not extension_items:
+      return declared
+    return _MergeByNumber(declared, _PresentExtensions(extension_items))
+
+  if api_implementation.ClassLayout() == 'slots':
+    # Like _fields_in_order, with each field's slot getter, but indexed like
+    # DESCRIPTOR.fields so that the bits of _has_bits lead to the set fields.
+    cls._slots_by_index = [None] * len(fields_in_order)
+    for field, is_repeated, is_message in fields_in_order:
+      cls._slots_by_index[field.index] = (
+          field, cls._field_slots[field][0].__get__, is_repeated, is_message)
+    # Whether the fields are declared in number order, as they usually are,
+    # so that going through the bits lists them without sorting.
+    cls._slots_in_number_order = (
+        [field for field, _, _ in fields_in_order] ==
+        list(message_descriptor.fields))
+    slots_by_index = cls._slots_by_index
+    slots_in_number_order = cls._slots_in_number_order
+    # Like _fields_in_order, with each field's slot getter and bit.
+    slots_in_order = [
+        (field, cls._field_slots[field][0].__get__, is_repeated, is_message,
+         field._dirty_bit)
+        for field, is_repeated, is_message in fields_in_order]
+
+    def ListFields(self):
+      all_fields = []
+      has_bits = self._has_bits
+      while has_bits:
+        has_bit = has_bits & -has_bits
+        has_bits ^= has_bit
+        field, get_slot, is_repeated, is_message = (
+            slots_by_index[has_bit.bit_length() - 1])
+        value = get_slot(self)
+        if is_repeated:
+          if not value:
+            continue
+        elif is_message and not value._is_present_in_parent:
+          continue
+        all_fields.append((field, value))
+      extension_fields = self._extension_fields
+      if extension_fields:
+        all_fields.extend([item for item in extension_fields.iteritems()
+                           if _IsPresent(item)])
+        all_fields.sort(key=_ItemFieldNumber)
+      elif not slots_in_number_order:
+        all_fields.sort(key=_ItemFieldNumber)
+      return all_fields
+
+    def IterDeclaredFields(self):
+      has_bits = self._has_bits
+      if slots_in_number_order:
+        while has_bits:
+          has_bit = has_bits & -has_bits
+          has_bits ^= has_bit
+          field, get_slot, is_repeated, is_message = (
+              slots_by_index[has_bit.bit_length() - 1])
+          value = get_slot(self)
+          if is_repeated:
+            if not value:
+              continue
+          elif is_message and not value._is_present_in_parent:
+            continue
+          yield (field, value)
+      else:
+        for field, get_slot, is_repeated, is_message, has_bit in (
+            slots_in_order):
+          if not has_bits:
+            return
+          if not has_bits & has_bit:
+            continue
+          has_bits ^= has_bit
+          value = get_slot(self)
+          if is_repeated:
+            if not value:
+              continue
+          elif is_message and not value._is_present_in_parent:
+            continue
+          yield (field, value)
+
+    def IterFields(self):
+      extension_fields = self._extension_fields
+      if not extension_fields:
+        return IterDeclaredFields(self)
+      return _MergeByNumber(IterDeclaredFields(self),
+                            _PresentExtensions(extension_fields.iteritems()))
+
+  # _ListRawFields() is ListFields() without parsing lazy fields; it is what
+  # ByteSize() and serialization use, so untouched lazy fields are written
+  # back in their original encoding.
+  cls._ListRawFields = ListFields
+
+  lazy_fields = [field for field in message_descriptor.fields if field._lazy]
+  if lazy_fields:
+    def MaterializeLazyFields(self):
+      fields = self._fields
+      for field in lazy_fields:
+        value = fields.get(field)
+        if isinstance(value, _LazyField):
+          value._Materialize(self)
+
+    list_raw_fields = ListFields
+    def ListFields(self):
+      MaterializeLazyFields(self)
+      return list_raw_fields(self)
+
+    iter_raw_fields = IterFields
+    def IterFields(self):
+      MaterializeLazyFields(self)
+      return iter_raw_fields(self)
+
   cls.ListFields = ListFields
+  # ListFields() without the list, for callers which only go through it once.
+  cls._IterFields = IterFields
 
 
 def _AddHasFieldMethod(message_descriptor, cls):
@@ -602,6 +1124,28 @@ def _AddHasFieldMethod(message_descriptor, cls):
       return value is not None and value._is_present_in_parent
     else:
       return field in self._fields
+
+  if api_implementation.ClassLayout() == 'slots':
+    # Maps the name of each singular field to its bit in _has_bits and, for
+    # message fields, its slot getter.
+    singular_slots = {}
+    for field_name, field in singular_fields.iteritems():
+      get_slot = None
+      if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+        get_slot = cls._field_slots[field][0].__get__
+      singular_slots[field_name] = (field._dirty_bit, get_slot)
+
+    def HasField(self, field_name):
+      try:
+        has_bit, get_slot = singular_slots[field_name]
+      except KeyError:
+        raise ValueError(
+            'Protocol message has no singular "%s" field.' % field_name)
+
+      if not self._has_bits & has_bit:
+        return False
+      return get_slot is None or get_slot(self)._is_present_in_parent
+
   cls.HasField = HasField
 
 
@@ -616,13 +1160,13 @@ def _AddClearFieldMethod(message_descriptor, cls):
     if field in self._fields:
       # Note:  If the field is a sub-message, its listener will still point
       #   at us.  That's fine, because the worst than can happen is that it
-      #   will call _Modified() and invalidate our byte size.  Big deal.
+      #   will call _FieldModified() and invalidate our byte size.  Big deal.
       del self._fields[field]
 
-    # Always call _Modified() -- even if nothing was changed, this is
+    # Always call _FieldModified() -- even if nothing was changed, this is
     # a mutating method, and thus calling it should cause the field to become
     # present in the parent message.
-    self._Modified()
+    self._FieldModified(field)
 
   cls.ClearField = ClearField
 
@@ -635,7 +1179,7 @@ def _AddClearExtensionMethod(cls):
     # Similar to ClearField(), above.
     if extension_handle in self._fields:
       del self._fields[extension_handle]
-    self._Modified()
+    self._FieldModified(extension_handle)
   cls.ClearExtension = ClearExtension
 
 
@@ -646,6 +1190,20 @@ def _AddClearMethod(message_descriptor, cls):
     self._fields = {}
     self._unknown_fields = ()
     self._Modified()
+
+  if api_implementation.ClassLayout() == 'slots':
+    slots = cls._field_slots.values()
+    def Clear(self):
+      has_bits = self._has_bits
+      if has_bits:
+        for slot, has_bit in slots:
+          if has_bits & has_bit:
+            slot.__delete__(self)
+        self._has_bits = 0
+      self._extension_fields = None
+      self._unknown_fields = ()
+      self._Modified()
+
   cls.Clear = Clear
 
 
@@ -674,8 +1232,10 @@ def _AddEqualsMethod(message_descriptor, cls):
     if self is other:
       return True
 
-    if not self.ListFields() == other.ListFields():
-      return False
+    for item, other_item in itertools.izip_longest(self._IterFields(),
+                                                   other._IterFields()):
+      if not item == other_item:
+        return False
 
     # Sort unknown fields because their order shouldn't affect equality test.
     unknown_fields = list(self._unknown_fields)
@@ -707,7 +1267,7 @@ def _AddSetListenerMethod(cls):
   """Helper for _AddMessageMethods()."""
   def SetListener(self, listener):
     if listener is None:
-      self._listener = message_listener_mod.NullMessageListener()
+      self._listener = message_listener_mod.NULL_MESSAGE_LISTENER
     else:
       self._listener = listener
   cls._SetListener = SetListener
@@ -736,20 +1296,60 @@ def _BytesForNonRepeatedElement(value, field_number, field_type):
 def _AddByteSizeMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
+  declared_fields = message_descriptor.fields
+
   def ByteSize(self):
     if not self._cached_byte_size_dirty:
       return self._cached_byte_size
 
-    size = 0
-    for field_descriptor, field_value in self.ListFields():
-      size += field_descriptor._sizer(field_value)
-
-    for tag_bytes, value_bytes in self._unknown_fields:
-      size += len(tag_bytes) + len(value_bytes)
-
+    fields = self._fields
+    field_sizes = self._field_sizes
+    dirty_bits = self._dirty_bits
+    listeners = self._listeners_for_children
+    if field_sizes is None or dirty_bits is None:
+      field_sizes = self._field_sizes = [0] * len(declared_fields)
+      size = 0
+      for item in fields.iteritems():
+        if _IsPresent(item):
+          field_descriptor, field_value = item
+          field_size = field_descriptor._sizer(field_value)
+          if field_descriptor._dirty_bit:
+            field_sizes[field_descriptor.index] = field_size
+          size += field_size
+      for tag_bytes, value_bytes in self._unknown_fields:
+        size += len(tag_bytes) + len(value_bytes)
+      if listeners is not None:
+        for listener in listeners.itervalues():
+          listener.dirty = False
+    else:
+      # Only the modified fields' sizes can have changed.
+      size = self._cached_byte_size
+      while dirty_bits:
+        index = (dirty_bits & -dirty_bits).bit_length() - 1
+        dirty_bits &= dirty_bits - 1
+        field_descriptor = declared_fields[index]
+        size -= field_sizes[index]
+        field_value = fields.get(field_descriptor)
+        if (field_value is not None and
+            _IsPresent((field_descriptor, field_value))):
+          field_size = field_descriptor._sizer(field_value)
+        else:
+          field_size = 0
+        field_sizes[index] = field_size
+        size += field_size
+        if listeners is not None:
+          listener = listeners.get(field_descriptor)
+          if listener is not None:
+            listener.dirty = False
+
+    # The modified fields have not been checked by IsInitialized() yet.
+    if self._dirty_bits is None:
+      self._unchecked_bits = None
+    elif self._unchecked_bits is not None:
+      self._unchecked_bits |= self._dirty_bits
+    self._dirty_bits = 0
     self._cached_byte_size = size
     self._cached_byte_size_dirty = False
-    self._listener_for_children.dirty = False
     return size
 
   cls.ByteSize = ByteSize
@@ -759,8 +1359,12 @@ def _AddSerializeToStringMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
   def SerializeToString(self):
+    if self._unchecked_bits is not None:
+      # The message has been checked before.  Sizing it, which serializing
+      # its sub-messages does anyway, tells IsInitialized() which fields have
+      # changed since then, so that only those are checked again.
+      self.ByteSize()
     # Check if the message has all of its required fields set.
-    errors = []
     if not self.IsInitialized():
       raise message_mod.EncodeError(
           'Message %s is missing required fields: %s' % (
@@ -773,23 +1377,86 @@ def _AddSerializePartialToStringMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
 
   def SerializePartialToString(self):
-    out = StringIO()
-    self._InternalSerialize(out.write)
-    return out.getvalue()
+    serialized = self._cached_serialization
+    if serialized is not None:
+      return serialized
+    # Collecting the pieces in a list and joining them once is cheaper than
+    # writing each one to a StringIO.  The encoders only write strs.
+    out = []
+    self._InternalSerialize(out.append)
+    serialized = ''.join(out)
+    if not self._cached_byte_size_dirty:
+      # Nothing can change the message now without making it dirty, which
+      # drops the cached serialization.
+      self._cached_serialization = serialized
+    return serialized
   cls.SerializePartialToString = SerializePartialToString
 
+  fields_in_order = cls._fields_in_order
+  min_fields_to_walk = cls._min_fields_to_walk
+
   def InternalSerialize(self, write_bytes):
-    for field_descriptor, field_value in self.ListFields():
-      field_descriptor._encoder(write_bytes, field_value)
+    serialized = self._cached_serialization
+    if serialized is not None:
+      write_bytes(serialized)
+      return
+    fields = self._fields
+    if len(fields) < min_fields_to_walk:
+      for field_descriptor, field_value in self._ListRawFields():
+        field_descriptor._encoder(write_bytes, field_value)
+    else:
+      # Like _ListRawFields(), without building the list.
+      for field_descriptor, is_repeated, is_message in fields_in_order:
+        field_value = fields.get(field_descriptor)
+        if field_value is None:
+          continue
+        if is_repeated:
+          if not field_value:
+            continue
+        elif is_message and not field_value._is_present_in_parent:
+          continue
+        field_descriptor._encoder(write_bytes, field_value)
     for tag_bytes, value_bytes in self._unknown_fields:
       write_bytes(tag_bytes)
       write_bytes(value_bytes)
+
+  if api_implementation.ClassLayout() == 'slots':
+    slots_by_index = cls._slots_by_index
+    slots_in_number_order = cls._slots_in_number_order
+    def InternalSerialize(self, write_bytes):
+      serialized = self._cached_serialization
+      if serialized is not None:
+        write_bytes(serialized)
+        return
+      if self._extension_fields or not slots_in_number_order:
+        for field_descriptor, field_value in self._ListRawFields():
+          field_descriptor._encoder(write_bytes, field_value)
+      else:
+        # Like _ListRawFields(), without building the list.
+        has_bits = self._has_bits
+        while has_bits:
+          has_bit = has_bits & -has_bits
+          has_bits ^= has_bit
+          field_descriptor, get_slot, is_repeated, is_message = (
+              slots_by_index[has_bit.bit_length() - 1])
+          field_value = get_slot(self)
+          if is_repeated:
+            if not field_value:
+              continue
+          elif is_message and not field_value._is_present_in_parent:
+            continue
+          field_descriptor._encoder(write_bytes, field_value)
+      for tag_bytes, value_bytes in self._unknown_fields:
+        write_bytes(tag_bytes)
+        write_bytes(value_bytes)
+
   cls._InternalSerialize = InternalSerialize
 
 
 def _AddMergeFromStringMethod(message_descriptor, cls):
   """Helper for _AddMessageMethods()."""
   def MergeFromString(self, serialized):
+    serialized = local_AsBuffer(serialized)
     length = len(serialized)
     try:
       if self._InternalParse(serialized, 0, length) != length:
@@ -803,16 +1470,28 @@ def _AddMergeFromStringMethod(message_descriptor, cls):
     return length   # Return this for legacy reasons.
   cls.MergeFromString = MergeFromString
 
+  local_AsBuffer = decoder.AsBuffer
   local_ReadTag = decoder.ReadTag
+  local_ReadViewTag = decoder.ReadViewTag
+  local_StringOf = decoder.StringOf
+  local_memoryview = decoder._memoryview
   local_SkipField = decoder.SkipField
   decoders_by_tag = cls._decoders_by_tag
+  # With the 'slots' layout, only the decoders of extensions use field_dict.
+  uses_field_dict = (api_implementation.ClassLayout() != 'slots' or
+                     message_descriptor.is_extendable)
 
   def InternalParse(self, buffer, pos, end):
     self._Modified()
-    field_dict = self._fields
+    field_dict = None
+    if uses_field_dict:
+      field_dict = self._fields
     unknown_field_list = self._unknown_fields
+    read_tag = local_ReadTag
+    if buffer.__class__ is local_memoryview:
+      read_tag = local_ReadViewTag
     while pos != end:
-      (tag_bytes, new_pos) = local_ReadTag(buffer, pos)
+      (tag_bytes, new_pos) = read_tag(buffer, pos)
       field_decoder = decoders_by_tag.get(tag_bytes)
       if field_decoder is None:
         value_start_pos = new_pos
@@ -821,12 +1500,17 @@ def _AddMergeFromStringMethod(message_descriptor, cls):
           return pos
         if not unknown_field_list:
           unknown_field_list = self._unknown_fields = []
-        unknown_field_list.append((tag_bytes, buffer[value_start_pos:new_pos]))
+        unknown_field_list.append(
+            (tag_bytes, local_StringOf(buffer[value_start_pos:new_pos])))
         pos = new_pos
       else:
         pos = field_decoder(buffer, new_pos, end, self, field_dict)
     return pos
-  cls._InternalParse = InternalParse
+
+  if api_implementation.ParserType() == 'table':
+    cls._InternalParse = table_decoder.TableParser(cls)
+  else:
+    cls._InternalParse = InternalParse
 
 
 def _AddIsInitializedMethod(message_descriptor, cls):
@@ -835,10 +1519,15 @@ def _AddIsInitializedMethod(message_descriptor, cls):
 
   required_fields = [field for field in message_descriptor.fields
                            if field.label == _FieldDescriptor.LABEL_REQUIRED]
+  declared_fields = message_descriptor.fields
 
   def IsInitialized(self, errors=None):
     """Checks if all required fields of a message are set.
 
+    Only the fields modified since the last successful check are checked
+    again.  Modifications are tracked like they are for ByteSize(), so the
+    check of a sub-message which has not changed returns at once.
+
     Args:
       errors:  A list which, if provided, will be populated with the field
                paths of all missing required fields.
@@ -849,15 +1538,51 @@ def _AddIsInitializedMethod(message_descriptor, cls):
 
     # Performance is critical so we avoid HasField() and ListFields().
 
-    for field in required_fields:
-      if (field not in self._fields or
-          (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
-           not self._fields[field]._is_present_in_parent)):
-        if errors is not None:
-          errors.extend(self.FindInitializationErrors())
-        return False
+    may_lack_required_fields = cls._may_lack_required_fields
+    if may_lack_required_fields is None:
+      may_lack_required_fields = cls._may_lack_required_fields = (
+          _MayLackRequiredFields(message_descriptor))
+    if not may_lack_required_fields:
+      return True
 
-    for field, value in self._fields.iteritems():
+    unchecked_bits = self._unchecked_bits
+    if unchecked_bits is not None:
+      dirty_bits = self._dirty_bits
+      if dirty_bits is None:
+        unchecked_bits = None
+      else:
+        unchecked_bits |= dirty_bits
+        if not unchecked_bits:
+          return True
+
+    fields = self._fields
+    if unchecked_bits is None:
+      for field in required_fields:
+        if (field not in fields or
+            (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+             not fields[field]._is_present_in_parent)):
+          if errors is not None:
+            errors.extend(self.FindInitializationErrors())
+          return False
+      items = fields.iteritems()
+    else:
+      items = []
+      while unchecked_bits:
+        index = (unchecked_bits & -unchecked_bits).bit_length() - 1
+        unchecked_bits &= unchecked_bits - 1
+        field = declared_fields[index]
+        value = fields.get(field)
+        if field.label == _FieldDescriptor.LABEL_REQUIRED and (
+            value is None or
+            (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+             not value._is_present_in_parent)):
+          if errors is not None:
+            errors.extend(self.FindInitializationErrors())
+          return False
+        if value is not None:
+          items.append((field, value))
+
+    for field, value in items:
       if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
         if field.label == _FieldDescriptor.LABEL_REPEATED:
           for element in value:
@@ -870,6 +1595,7 @@ def _AddIsInitializedMethod(message_descriptor, cls):
             errors.extend(self.FindInitializationErrors())
           return False
 
+    self._unchecked_bits = 0
     return True
 
   cls.IsInitialized = IsInitialized
@@ -888,7 +1614,7 @@ def _AddIsInitializedMethod(message_descriptor, cls):
       if not self.HasField(field.name):
         errors.append(field.name)
 
-    for field, value in self.ListFields():
+    for field, value in self._IterFields():
       if field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
         if field.is_extension:
           name = "(%s)" % field.full_name
@@ -914,6 +1640,8 @@ def _AddIsInitializedMethod(message_descriptor, cls):
 def _AddMergeFromMethod(cls):
   LABEL_REPEATED = _FieldDescriptor.LABEL_REPEATED
   CPPTYPE_MESSAGE = _FieldDescriptor.CPPTYPE_MESSAGE
+  lazy_fields = frozenset(
+      [field for field in cls.DESCRIPTOR.fields if field._lazy])
 
   def MergeFrom(self, msg):
     if not isinstance(msg, cls):
@@ -927,6 +1655,13 @@ def _AddMergeFromMethod(cls):
     fields = self._fields
 
     for field, value in msg._fields.iteritems():
+      if field in lazy_fields:
+        if isinstance(value, _LazyField):
+          value._MergeIntoParent(self)
+          continue
+        field_value = fields.get(field)
+        if isinstance(field_value, _LazyField):
+          field_value._Materialize(self)
       if field.label == LABEL_REPEATED:
         field_value = fields.get(field)
         if field_value is None:
@@ -953,6 +1688,90 @@ def _AddMergeFromMethod(cls):
   cls.MergeFrom = MergeFrom
 
 
+def _CopyMessage(source, dest):
+  """Makes |dest|, a new or just cleared message of the same type as |source|,
+  a copy of it.
+
+  Unlike MergeFrom(), this shares what it can with |source| instead of copying
+  it: the values of repeated scalar fields, until either container is modified
+  (see RepeatedScalarFieldContainer._ShareValues()), and the encoded ranges of
+  unparsed lazy fields.  Sub-messages each have a single parent, so they are
+  copied the same way into new objects.  If |source| is clean, |dest| takes
+  its cached size and serialization too rather than computing them again.
+  """
+  fields = dest._fields
+  fields.update(source._fields)
+  for field, value in source._fields.iteritems():
+    if field.label == _FieldDescriptor.LABEL_REPEATED:
+      if field.cpp_type != _FieldDescriptor.CPPTYPE_MESSAGE:
+        copy = fields[field] = field._default_constructor(dest)
+        copy._ShareValues(value)
+      elif value.__class__ is _LazyRepeatedMessages:
+        copy = fields[field] = _LazyRepeatedMessages(field)
+        copy._ranges = value._ranges[:]
+      else:
+        copy = fields[field] = field._default_constructor(dest)
+        listener = copy._message_listener
+        for element in value:
+          element_copy = element.__class__()
+          element_copy._SetListener(listener)
+          _CopyMessage(element, element_copy)
+          copy._values.append(element_copy)
+    elif field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
+      if value.__class__ is _LazyMessage:
+        copy = fields[field] = _LazyMessage(field)
+        copy._ranges = value._ranges[:]
+      elif value._is_present_in_parent:
+        copy = fields[field] = field._default_constructor(dest)
+        _CopyMessage(value, copy)
+      else:
+        del fields[field]
+
+  if source._unknown_fields:
+    dest._unknown_fields = list(source._unknown_fields)
+
+  if source._cached_byte_size_dirty:
+    dest._Modified()
+    return
+  dest._cached_byte_size = source._cached_byte_size
+  field_sizes = source._field_sizes
+  if field_sizes is not None:
+    field_sizes = field_sizes[:]
+  dest._field_sizes = field_sizes
+  dest._dirty_bits = source._dirty_bits
+  dest._unchecked_bits = source._unchecked_bits
+  dest._cached_serialization = source._cached_serialization
+  dest._cached_byte_size_dirty = False
+  dest._is_present_in_parent = True
+  # The listeners may have been told of changes to the fields dest had
+  # before, which must not keep them from reporting changes to the copies.
+  listeners = dest._listeners_for_children
+  if listeners is not None:
+    for listener in listeners.itervalues():
+      listener.dirty = False
+
+
+def _AddCopyFromMethod(cls):
+  """Helper for _AddMessageMethods()."""
+
+  def CopyFrom(self, msg):
+    if msg is self:
+      return
+    if not isinstance(msg, cls):
+      raise TypeError(
+          "Parameter to CopyFrom() must be instance of same class: "
+          "expected %s got %s." % (cls.__name__, type(msg).__name__))
+    self.Clear()
+    _CopyMessage(msg, self)
+  cls.CopyFrom = CopyFrom
+
+  def __deepcopy__(self, memo=None):
+    clone = cls()
+    _CopyMessage(self, clone)
+    return clone
+  cls.__deepcopy__ = __deepcopy__
+
+
 def _AddMessageMethods(message_descriptor, cls):
   """Adds implementations of all Message methods to cls."""
   _AddListFieldsMethod(message_descriptor, cls)
@@ -972,29 +1791,425 @@ def _AddMessageMethods(message_descriptor, cls):
   _AddMergeFromStringMethod(message_descriptor, cls)
   _AddIsInitializedMethod(message_descriptor, cls)
   _AddMergeFromMethod(cls)
+  _AddCopyFromMethod(cls)
 
 
 def _AddPrivateHelperMethods(cls):
   """Adds implementation of private helper methods to cls."""
 
   def Modified(self):
-    """Sets the _cached_byte_size_dirty bit to true,
-    and propagates this to our listener iff this was a state change.
+    """Sets the _cached_byte_size_dirty bit to true, so that ByteSize() sizes
+    every field again, and propagates this to our listener iff this was a state
+    change.
     """
-
-    # Note:  Some callers check _cached_byte_size_dirty before calling
-    #   _Modified() as an extra optimization.  So, if this method is ever
-    #   changed such that it does stuff even when _cached_byte_size_dirty is
-    #   already true, the callers need to be updated.
+    self._dirty_bits = None
     if not self._cached_byte_size_dirty:
       self._cached_byte_size_dirty = True
-      self._listener_for_children.dirty = True
+      self._cached_serialization = None
       self._is_present_in_parent = True
       self._listener.Modified()
 
   cls._Modified = Modified
   cls.SetInParent = Modified
 
+  def FieldModified(self, field):
+    """Like _Modified(), but only |field| needs to be sized again."""
+
+    # Note:  Scalar setters inline the case where _cached_byte_size_dirty is
+    #   already true as an extra optimization.  So, if this method is ever
+    #   changed, they need to be updated.
+    dirty_bits = self._dirty_bits
+    if dirty_bits is not None:
+      if field._dirty_bit:
+        self._dirty_bits = dirty_bits | field._dirty_bit
+      else:
+        self._dirty_bits = None
+    if not self._cached_byte_size_dirty:
+      self._cached_byte_size_dirty = True
+      self._cached_serialization = None
+      self._is_present_in_parent = True
+      self._listener.Modified()
+
+  cls._FieldModified = FieldModified
+
+  def ListenerForField(self, field):
+    """Returns the listener to register with the value of |field|."""
+    listeners = self._listeners_for_children
+    if listeners is None:
+      listeners = self._listeners_for_children = {}
+    listener = listeners.get(field)
+    if listener is None:
+      # The listener's weak reference back to us is only made here, once a
+      # child needs it.
+      listener = listeners.setdefault(field, _Listener(self, field))
+    return listener
+
+  cls._ListenerForField = ListenerForField
+
+
+def _ParseRange(message, buffer, start, end):
+  """Parses buffer[start:end] into |message|, as MergeFromString() would."""
+  try:
+    if message._InternalParse(buffer, start, end) != end:
+      # The only reason _InternalParse would return early is if it
+      # encountered an end-group tag.
+      raise message_mod.DecodeError('Unexpected end-group tag.')
+  except IndexError:
+    raise message_mod.DecodeError('Truncated message.')
+  except struct.error, e:
+    raise message_mod.DecodeError(e)
+
+
+def _ProjectionTree(message_descriptor, field_paths):
+  """Groups dotted field paths by their first field.
+
+  Returns:
+    A dict mapping each FieldDescriptor named first by a path to None, if the
+    whole field is wanted, or else to the tree of its message type's fields.
+  """
+  tree = {}
+  sub_paths = {}
+  for path in field_paths:
+    name, _, rest = path.partition('.')
+    field = _GetFieldByName(message_descriptor, name)
+    if not rest:
+      tree[field] = None
+      continue
+    if field.type != _FieldDescriptor.TYPE_MESSAGE:
+      raise ValueError('Field "%s" of "%s" is not a message; cannot parse "%s".'
+                       % (name, message_descriptor.full_name, path))
+    sub_paths.setdefault(field, []).append(rest)
+  for field, paths in sub_paths.iteritems():
+    if field not in tree:
+      tree[field] = _ProjectionTree(field.message_type, paths)
+  return tree
+
+
+def _ProjectedParser(cls, tree, keep_skipped_fields):
+  """Returns a function which parses only the fields in |tree|, a dict from
+  _ProjectionTree(), into a message of class |cls|.
+
+  The function has the signature and contract of _InternalParse().  The
+  fields of all other tags are skipped and, if |keep_skipped_fields|, kept as
+  unknown fields.
+  """
+  # The decoders of a class are only there once it has been set up.
+  MaterializeMessage(cls)
+  decoders = {}
+  for field, sub_tree in tree.iteritems():
+    wire_type = type_checkers.FIELD_TYPE_TO_WIRE_TYPE[field.type]
+    if sub_tree is not None:
+      sub_parse = _ProjectedParser(
+          field.message_type._concrete_class, sub_tree, keep_skipped_fields)
+      decoders[encoder.TagBytes(field.number, wire_type)] = (
+          _ProjectedMessageDecoder(field, sub_parse))
+      continue
+    tags = [encoder.TagBytes(field.number, wire_type)]
+    if (field.label == _FieldDescriptor.LABEL_REPEATED and
+        wire_format.IsTypePackable(field.type)):
+      tags.append(encoder.TagBytes(field.number,
+                                   wire_format.WIRETYPE_LENGTH_DELIMITED))
+    for tag_bytes in tags:
+      decoders[tag_bytes] = cls._decoders_by_tag[tag_bytes]
+
+  local_ReadTag = decoder.ReadTag
+  local_ReadViewTag = decoder.ReadViewTag
+  local_StringOf = decoder.StringOf
+  local_memoryview = decoder._memoryview
+  local_SkipField = decoder.SkipField
+
+  def ProjectedParse(message, buffer, pos, end):
+    message._Modified()
+    field_dict = message._fields
+    read_tag = local_ReadTag
+    if buffer.__class__ is local_memoryview:
+      read_tag = local_ReadViewTag
+    while pos != end:
+      (tag_bytes, new_pos) = read_tag(buffer, pos)
+      field_decoder = decoders.get(tag_bytes)
+      if field_decoder is None:
+        value_start_pos = new_pos
+        new_pos = local_SkipField(buffer, new_pos, end, tag_bytes)
+        if new_pos == -1:
+          return pos
+        if keep_skipped_fields:
+          if not message._unknown_fields:
+            message._unknown_fields = []
+          message._unknown_fields.append(
+              (tag_bytes, local_StringOf(buffer[value_start_pos:new_pos])))
+        pos = new_pos
+      else:
+        pos = field_decoder(buffer, new_pos, end, message, field_dict)
+    return pos
+  return ProjectedParse
+
+
+def _ProjectedMessageDecoder(field, sub_parse):
+  """Returns a decoder for a message field, like decoder.MessageDecoder(),
+  which parses each sub-message with |sub_parse|."""
+  local_DecodeVarint = decoder._DecodeVarint
+  new_default = field._default_constructor
+
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    tag_bytes = encoder.TagBytes(field.number,
+                                 wire_format.WIRETYPE_LENGTH_DELIMITED)
+    tag_len = len(tag_bytes)
+    def DecodeRepeatedField(buffer, pos, end, message, field_dict):
+      value = field_dict.get(field)
+      if value is None:
+        value = field_dict.setdefault(field, new_default(message))
+      add = value.add
+      while 1:
+        (size, pos) = local_DecodeVarint(buffer, pos)
+        new_pos = pos + size
+        if new_pos > end:
+          raise message_mod.DecodeError('Truncated message.')
+        if sub_parse(add(), buffer, pos, new_pos) != new_pos:
+          raise message_mod.DecodeError('Unexpected end-group tag.')
+        # Predict that the next tag is another copy of the same repeated field.
+        pos = new_pos + tag_len
+        if buffer[new_pos:pos] != tag_bytes or new_pos == end:
+          return new_pos
+    return DecodeRepeatedField
+
+  def DecodeField(buffer, pos, end, message, field_dict):
+    value = field_dict.get(field)
+    if value is None:
+      value = field_dict.setdefault(field, new_default(message))
+    (size, pos) = local_DecodeVarint(buffer, pos)
+    new_pos = pos + size
+    if new_pos > end:
+      raise message_mod.DecodeError('Truncated message.')
+    if sub_parse(value, buffer, pos, new_pos) != new_pos:
+      raise message_mod.DecodeError('Unexpected end-group tag.')
+    return new_pos
+  return DecodeField
+
+
+class _LazyField(object):
+
+  """Placeholder for a message field which has not been parsed yet.
+
+  LazyMessageDecoder stores one of these in _fields instead of the field's
+  real value.  It holds the (buffer, start, end) ranges in which the field was
+  encoded.  The property getters and ListFields() call _Materialize() to swap
+  in the real value the first time the field is accessed; until then,
+  ByteSize() and serialization work directly from the encoded form.
+  """
+
+  __slots__ = ['_field', '_ranges']
+
+  def __init__(self, field):
+    self._field = field
+    self._ranges = []
+
+  def _Materialize(self, parent):
+    """Parses the field and stores the result in |parent| in place of self."""
+    value = self._field._default_constructor(parent)
+    self._MergeInto(value)
+    parent._fields[self._field] = value
+    return value
+
+  def _MergeIntoParent(self, parent):
+    """Merges the field into the same field of |parent|, as MergeFrom() does.
+
+    The field stays unparsed if |parent| does not have it yet, and repeated
+    elements are appended unparsed to those of |parent|.  A singular message
+    which |parent| has already is parsed and merged into, since appending the
+    ranges would encode the sub-message twice.
+    """
+    fields = parent._fields
+    value = fields.get(self._field)
+    if value is None:
+      value = fields[self._field] = self.__class__(self._field)
+      value._ranges.extend(self._ranges)
+    elif value.__class__ is _LazyRepeatedMessages:
+      value._ranges.extend(self._ranges)
+    else:
+      if isinstance(value, _LazyField):
+        value = value._Materialize(parent)
+      self._MergeInto(value)
+
+
+class _LazyMessage(_LazyField):
+
+  """_LazyField for a singular message field.  Like repeated occurrences of
+  the field on the wire, the ranges concatenated make up the sub-message.
+  """
+
+  __slots__ = []
+
+  _is_present_in_parent = True
+
+  def _MergeInto(self, message):
+    for buffer, start, end in self._ranges:
+      _ParseRange(message, buffer, start, end)
+
+  def ByteSize(self):
+    size = 0
+    for unused_buffer, start, end in self._ranges:
+      size += end - start
+    return size
+
+  def _InternalSerialize(self, write_bytes):
+    for buffer, start, end in self._ranges:
+      write_bytes(decoder.StringOf(buffer[start:end]))
+
+  def IsInitialized(self):
+    return _IsEncodedInitialized(self._field.message_type, self._ranges)
+
+
+class _LazyRepeatedMessages(_LazyField):
+
+  """_LazyField for a repeated message field, holding one range per element.
+  """
+
+  __slots__ = []
+
+  def _MergeInto(self, container):
+    for buffer, start, end in self._ranges:
+      _ParseRange(container.add(), buffer, start, end)
+
+  def __len__(self):
+    return len(self._ranges)
+
+  def __iter__(self):
+    # The sizer, the encoder and IsInitialized() only need each element's
+    # encoded form, so hand them unparsed elements.
+    for element_range in self._ranges:
+      element = _LazyMessage(self._field)
+      element._ranges.append(element_range)
+      yield element
+
+
+# Returned by _RequiredFieldScan() for message types whose encoded form cannot
+# be checked for required fields without parsing it.
+_SCAN_BY_PARSING = object()
+
+# Maps a message Descriptor to its _RequiredFieldScan() result.
+_required_field_scans = {}
+
+
+def _MayLackRequiredFields(message_descriptor):
+  """Returns true if a message of this type can be missing required fields,
+  either its own or those of a sub-message."""
+  pending = [message_descriptor]
+  seen = set(pending)
+  while pending:
+    descriptor = pending.pop()
+    if descriptor.is_extendable:
+      # Extensions can be messages with required fields of their own.
+      return True
+    for field in descriptor.fields:
+      if field.label == _FieldDescriptor.LABEL_REQUIRED:
+        return True
+      if (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+          field.message_type not in seen):
+        seen.add(field.message_type)
+        pending.append(field.message_type)
+  return False
+
+
+def _RequiredFieldScan(message_descriptor):
+  """Returns what _IsEncodedInitialized() needs to know about a message type.
+
+  Returns:
+    None if a message of this type can never be missing required fields, or
+    _SCAN_BY_PARSING if it has extensions or groups which may be.  Otherwise
+    a (required_tags, nested) tuple: the set of the required fields' tags, as
+    integers, and a dict mapping the number of every message field which may
+    be missing required fields to a (message_descriptor, is_repeated) tuple.
+  """
+  scan = _required_field_scans.get(message_descriptor, _SCAN_BY_PARSING)
+  if scan is not _SCAN_BY_PARSING:
+    return scan
+
+  if not _MayLackRequiredFields(message_descriptor):
+    scan = None
+  elif message_descriptor.is_extendable:
+    scan = _SCAN_BY_PARSING
+  else:
+    required_tags = set()
+    nested = {}
+    for field in message_descriptor.fields:
+      if field.label == _FieldDescriptor.LABEL_REQUIRED:
+        required_tags.add(wire_format.PackTag(
+            field.number, type_checkers.FIELD_TYPE_TO_WIRE_TYPE[field.type]))
+      if (field.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE and
+          _MayLackRequiredFields(field.message_type)):
+        if field.type == _FieldDescriptor.TYPE_GROUP:
+          scan = _SCAN_BY_PARSING
+          break
+        nested[field.number] = (
+            field.message_type,
+            field.label == _FieldDescriptor.LABEL_REPEATED)
+    else:
+      scan = (required_tags, nested)
+
+  _required_field_scans[message_descriptor] = scan
+  return scan
+
+
+def _IsEncodedInitialized(message_descriptor, ranges):
+  """Checks whether an encoded message has all of its required fields set,
+  scanning its tags rather than parsing it where possible.
+
+  Args:
+    message_descriptor: Descriptor of the message type.
+    ranges: List of (buffer, start, end) ranges which, concatenated, make up
+      the message.
+  """
+  scan = _RequiredFieldScan(message_descriptor)
+  if scan is None:
+    return True
+  if scan is _SCAN_BY_PARSING:
+    message = message_descriptor._concrete_class()
+    for buffer, start, end in ranges:
+      _ParseRange(message, buffer, start, end)
+    return message.IsInitialized()
+
+  required_tags, nested = scan
+  local_DecodeVarint = decoder._DecodeVarint
+  seen_tags = set()
+  nested_ranges = {}
+  try:
+    for buffer, pos, end in ranges:
+      while pos != end:
+        (tag, value_pos) = local_DecodeVarint(buffer, pos)
+        seen_tags.add(tag)
+        field_number = tag >> wire_format.TAG_TYPE_BITS
+        if (field_number in nested and
+            tag & wire_format.TAG_TYPE_MASK ==
+            wire_format.WIRETYPE_LENGTH_DELIMITED):
+          (size, value_pos) = local_DecodeVarint(buffer, value_pos)
+          new_pos = value_pos + size
+          nested_ranges.setdefault(field_number, []).append(
+              (buffer, value_pos, new_pos))
+        else:
+          new_pos = decoder.SkipField(buffer, value_pos, end,
+                                      buffer[pos:value_pos])
+          if new_pos == -1:
+            raise message_mod.DecodeError('Unexpected end-group tag.')
+        if new_pos > end:
+          raise message_mod.DecodeError('Truncated message.')
+        pos = new_pos
+  except IndexError:
+    raise message_mod.DecodeError('Truncated message.')
+  except struct.error, e:
+    raise message_mod.DecodeError(e)
+
+  if not required_tags.issubset(seen_tags):
+    return False
+  for field_number, field_ranges in nested_ranges.iteritems():
+    sub_descriptor, is_repeated = nested[field_number]
+    if is_repeated:
+      for element_range in field_ranges:
+        if not _IsEncodedInitialized(sub_descriptor, [element_range]):
+          return False
+    elif not _IsEncodedInitialized(sub_descriptor, field_ranges):
+      return False
+  return True
+
 
 class _Listener(object):
 
@@ -1010,10 +2225,11 @@ class _Listener(object):
   This helper class is at the heart of this support.
   """
 
-  def __init__(self, parent_message):
+  def __init__(self, parent_message, field):
     """Args:
-      parent_message: The message whose _Modified() method we should call when
-        we receive Modified() messages.
+      parent_message: The message whose _FieldModified() method we should call
+        when we receive Modified() messages.
+      field: The FieldDescriptor of the field holding the child.
     """
     # This listener establishes a back reference from a child (contained) object
     # to its parent (containing) object.  We make this a weak reference to avoid
@@ -1023,18 +2239,22 @@ class _Listener(object):
       self._parent_message_weakref = parent_message
     else:
       self._parent_message_weakref = weakref.proxy(parent_message)
+    self._field = field
 
     # As an optimization, we also indicate directly on the listener whether
-    # or not the parent message is dirty.  This way we can avoid traversing
-    # up the tree in the common case.
+    # or not the parent message already knows the field is modified.  This way
+    # we can avoid traversing up the tree in the common case.  The parent
+    # clears this flag when it recomputes its size.
     self.dirty = False
 
   def Modified(self):
     if self.dirty:
       return
     try:
-      # Propagate the signal to our parents iff this is the first field set.
-      self._parent_message_weakref._Modified()
+      # Propagate the signal to our parents iff this is the first change to
+      # the field since the parent was last sized.
+      self._parent_message_weakref._FieldModified(self._field)
+      self.dirty = True
     except ReferenceError:
       # We can get here if a client has kept a reference to a child object,
       # and is now setting a field on it, but the child's parent has been
@@ -1042,6 +2262,98 @@ class _Listener(object):
       pass
 
 
+class _SlotFieldDict(object):
+
+  """The _fields of a message using the 'slots' class layout.
+
+  Such a message keeps each declared field in a slot of its own and
+  extensions in a dict of their own (see _AddSlots()).  This view presents
+  them as the dict from FieldDescriptor to value which _fields holds in the
+  'dict' layout, so that the code which only needs a field now and then, like
+  MergeFrom() or the decoders of repeated fields, works with either layout.
+  The property getters and setters, ListFields(), HasField() and
+  serialization read the slots themselves.
+  """
+
+  __slots__ = ['_message', '_field_slots']
+
+  def __init__(self, message):
+    self._message = message
+    self._field_slots = message._field_slots
+
+  def get(self, field, default=None):
+    slot = self._field_slots.get(field)
+    if slot is None:
+      extension_fields = self._message._extension_fields
+      if extension_fields is None:
+        return default
+      return extension_fields.get(field, default)
+    if self._message._has_bits & slot[1]:
+      return slot[0].__get__(self._message)
+    return default
+
+  def __getitem__(self, field):
+    value = self.get(field)
+    if value is None:
+      raise KeyError(field)
+    return value
+
+  def __contains__(self, field):
+    return self.get(field) is not None
+
+  def __setitem__(self, field, value):
+    slot = self._field_slots.get(field)
+    if slot is None:
+      extension_fields = self._message._extension_fields
+      if extension_fields is None:
+        extension_fields = self._message._extension_fields = {}
+      extension_fields[field] = value
+    else:
+      slot[0].__set__(self._message, value)
+      self._message._has_bits |= slot[1]
+
+  def setdefault(self, field, value):
+    current = self.get(field)
+    if current is None:
+      self[field] = value
+      return value
+    return current
+
+  def __delitem__(self, field):
+    slot = self._field_slots.get(field)
+    if slot is None:
+      extension_fields = self._message._extension_fields
+      if extension_fields is None:
+        raise KeyError(field)
+      del extension_fields[field]
+    elif self._message._has_bits & slot[1]:
+      slot[0].__delete__(self._message)
+      self._message._has_bits &= ~slot[1]
+    else:
+      raise KeyError(field)
+
+  def iteritems(self):
+    message = self._message
+    has_bits = message._has_bits
+    if has_bits:
+      for field, (slot, has_bit) in self._field_slots.iteritems():
+        if has_bits & has_bit:
+          yield field, slot.__get__(message)
+    if message._extension_fields:
+      for item in message._extension_fields.iteritems():
+        yield item
+
+  def __len__(self):
+    length = bin(self._message._has_bits).count('1')
+    if self._message._extension_fields:
+      length += len(self._message._extension_fields)
+    return length
+
+  def update(self, other):
+    for field, value in other.iteritems():
+      self[field] = value
+
+
 # TODO(robinson): Move elsewhere?  This file is getting pretty ridiculous...
 # TODO(robinson): Unify error handling of "unknown extension" crap.
 # TODO(robinson): Support iteritems()-style iteration over all
@@ -1075,7 +2387,8 @@ class _ExtensionDict(object):
     elif extension_handle.cpp_type == _FieldDescriptor.CPPTYPE_MESSAGE:
       result = extension_handle.message_type._concrete_class()
       try:
-        result._SetListener(self._extended_message._listener_for_children)
+        result._SetListener(
+            self._extended_message._ListenerForField(extension_handle))
       except ReferenceError:
         pass
     else:
@@ -1136,7 +2449,7 @@ class _ExtensionDict(object):
         extension_handle.cpp_type, extension_handle.type)
     type_checker.CheckValue(value)
     self._extended_message._fields[extension_handle] = value
-    self._extended_message._Modified()
+    self._extended_message._FieldModified(extension_handle)
 
   def _FindExtensionByName(self, name):
     """Tries to find a known extension with the specified name.
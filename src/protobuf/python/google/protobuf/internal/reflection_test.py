@@ -37,6 +37,7 @@ pure-Python protocol compiler.
 
 __author__ = 'robinson@google.com (Will Robinson)'
 
+import copy
 import gc
 import operator
 import struct
@@ -49,12 +50,14 @@ from google.protobuf import descriptor_pb2
 from google.protobuf import descriptor
 from google.protobuf import message
 from google.protobuf import reflection
+from google.protobuf import wire_scanner
 from google.protobuf.internal import api_implementation
 from google.protobuf.internal import more_extensions_pb2
 from google.protobuf.internal import more_messages_pb2
 from google.protobuf.internal import wire_format
 from google.protobuf.internal import test_util
 from google.protobuf.internal import decoder
+from google.protobuf.internal import type_checkers
 
 
 class _MiniDecoder(object):
@@ -478,6 +481,68 @@ class ReflectionTest(unittest.TestCase):
           ['foo', 'bar', 'baz', '0', '1']) ],
       proto.ListFields())
 
+  def testListFieldsOfManyFields(self):
+    # Set enough fields for ListFields() to walk them in field number order,
+    # rather than sort them, and set them in reverse order.
+    proto = unittest_pb2.TestAllTypes()
+    fields = sorted(proto.DESCRIPTOR.fields, key=lambda field: -field.number)
+    expected = []
+    for field in fields:
+      if field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_STRING:
+        value = '1'
+      elif field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_BOOL:
+        value = True
+      elif (field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_INT32 or
+            field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_INT64):
+        value = 1
+      else:
+        continue
+      if field.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+        getattr(proto, field.name).append(value)
+        expected.append((field, [value]))
+      else:
+        setattr(proto, field.name, value)
+        expected.append((field, value))
+    proto.optional_nested_message  # Accessed but not set.
+    proto.repeated_nested_message  # Empty.
+    expected.reverse()
+    self.assertEqual(expected, proto.ListFields())
+
+    serialized = proto.SerializeToString()
+    self.assertEqual(
+        [field.number for field, value in expected],
+        [field_number for field_number, unused_wire_type, unused_offset,
+         unused_length in wire_scanner.ScanFields(serialized)])
+
+    # With most fields cleared again, the few left are sorted instead.
+    for field, value in expected[2:]:
+      proto.ClearField(field.name)
+    self.assertEqual(expected[:2], proto.ListFields())
+
+  def testIterFields(self):
+    proto = unittest_pb2.TestAllTypes()
+    self.assertEqual([], list(proto._IterFields()))
+    proto.optional_string = 'x'
+    proto.repeated_int32.append(1)
+    proto.optional_nested_message  # Accessed but not set.
+    proto.repeated_nested_message  # Empty.
+    self.assertFalse(isinstance(proto._IterFields(), list))
+    self.assertEqual(proto.ListFields(), list(proto._IterFields()))
+    test_util.SetAllFields(proto)
+    self.assertEqual(proto.ListFields(), list(proto._IterFields()))
+
+    proto = unittest_pb2.TestAllExtensions()
+    test_util.SetAllExtensions(proto)
+    self.assertEqual(proto.ListFields(), list(proto._IterFields()))
+
+    # Extensions fall between the declared fields.
+    proto = unittest_pb2.TestFieldOrderings()
+    test_util.SetAllFieldsAndExtensions(proto)
+    self.assertEqual(
+        [1, 5, 11, 50, 101],
+        [field.number for field, value in proto._IterFields()])
+    self.assertEqual(proto.ListFields(), list(proto._IterFields()))
+
   def testSingularListExtensions(self):
     proto = unittest_pb2.TestAllExtensions()
     proto.Extensions[unittest_pb2.optional_fixed32_extension] = 1
@@ -873,6 +938,63 @@ class ReflectionTest(unittest.TestCase):
     # Remove a non-existent element.
     self.assertRaises(ValueError, proto.repeated_int32.remove, 123)
 
+  def testRepeatedNumericScalarsExtend(self):
+    proto = unittest_pb2.TestAllTypes()
+    proto.repeated_uint64.extend([0, 1L, True, (1 << 64) - 1])
+    self.assertEqual([0, 1, 1, (1 << 64) - 1], proto.repeated_uint64)
+    self.assertRaises(ValueError, proto.repeated_uint64.extend, [1, -1])
+    self.assertRaises(ValueError, proto.repeated_int32.extend, [1 << 31])
+    self.assertRaises(TypeError, proto.repeated_int32.extend, [1, 2.5])
+    self.assertRaises(TypeError, proto.repeated_double.extend, [1.5, '2'])
+    # A failed extend() leaves the field unchanged.
+    self.assertEqual(4, len(proto.repeated_uint64))
+    self.assertEqual(0, len(proto.repeated_int32))
+
+    proto.repeated_double.extend(xrange(3))
+    proto.repeated_double.append(0.25)
+    self.assertEqual([0.0, 1.0, 2.0, 0.25], proto.repeated_double)
+    self.assertEqual('[0.0, 1.0, 2.0, 0.25]', repr(proto.repeated_double))
+    self.assertTrue(isinstance(proto.repeated_double[1:3], list))
+    self.assertTrue(isinstance(proto.repeated_double[::2], list))
+
+    proto.repeated_int64.extend([3, -1, 2])
+    proto.repeated_int64.sort()
+    self.assertEqual([-1, 2, 3], proto.repeated_int64)
+    proto.repeated_int64.sort(sort_function=lambda a, b: cmp(b, a))
+    self.assertEqual([3, 2, -1], proto.repeated_int64)
+
+    other = unittest_pb2.TestAllTypes()
+    other.repeated_int64.MergeFrom(proto.repeated_int64)
+    self.assertEqual(proto.repeated_int64, other.repeated_int64)
+
+  def testRepeatedNumericScalarsConvertValues(self):
+    # Values are stored unboxed, so they read back as the type of the array's
+    # items rather than as the objects which were added.
+    if (descriptor.FieldDescriptor.CPPTYPE_UINT64 not in
+        type_checkers.CPPTYPE_TO_ARRAY_TYPECODE):
+      # 64-bit fields are stored in lists on this platform.
+      return
+    proto = unittest_pb2.TestAllTypes()
+    proto.repeated_double.append(1)
+    proto.repeated_float.extend([2L])
+    proto.repeated_int32.append(3L)
+    proto.repeated_int64.append(True)
+    proto.repeated_uint32.append(4)
+    proto.repeated_uint64.extend([5, False])
+    self.assertEqual([(float, 1.0), (float, 2.0)],
+                     [(type(v), v) for v in (proto.repeated_double[0],
+                                             proto.repeated_float[0])])
+    self.assertEqual([(int, 3), (int, 1)],
+                     [(type(v), v) for v in (proto.repeated_int32[0],
+                                             proto.repeated_int64[0])])
+    self.assertEqual([(long, 4L), (long, 5L), (long, 0L)],
+                     [(type(v), v) for v in (list(proto.repeated_uint32) +
+                                             list(proto.repeated_uint64))])
+    self.assertEqual('[1.0]', repr(proto.repeated_double))
+    self.assertEqual('[5L, 0L]', repr(proto.repeated_uint64))
+    self.assertEqual([1.0], proto.repeated_double[:])
+    self.assertEqual(float, type(proto.repeated_double[:][0]))
+
   def testRepeatedComposites(self):
     proto = unittest_pb2.TestAllTypes()
     self.assertTrue(not proto.repeated_nested_message)
@@ -1442,11 +1564,71 @@ class ReflectionTest(unittest.TestCase):
     self.assertEqual(2, proto1.optional_int32)
     self.assertEqual('important-text', proto1.optional_string)
 
+  def testCopyIsIndependentOfSource(self):
+    proto1 = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(proto1)
+    expected = unittest_pb2.TestAllTypes()
+    expected.MergeFrom(proto1)
+    proto2 = copy.deepcopy(proto1)
+    proto3 = unittest_pb2.TestAllTypes()
+    proto3.CopyFrom(proto1)
+
+    # The copies share the values of repeated scalar fields with proto1 until
+    # one of them is modified.
+    for proto in (proto2, proto3):
+      proto.repeated_int32.append(1)
+      proto.repeated_string[0] = 'changed'
+      proto.optional_nested_message.bb = 1
+      proto.repeated_nested_message[0].bb = 2
+    self.assertEqual(expected, proto1)
+    self.assertEqual(proto2, proto3)
+
+    proto2 = copy.deepcopy(proto1)
+    proto1.repeated_int32.sort(reverse=True)
+    proto1.repeated_string.append('added')
+    self.assertEqual(expected, proto2)
+    self.assertNotEqual(expected, proto1)
+
+  def testCopyOfCleanMessageKeepsSerialization(self):
+    proto1 = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(proto1)
+    proto1.ByteSize()
+    serialized = proto1.SerializeToString()
+    proto2 = copy.deepcopy(proto1)
+    self.assertTrue(serialized is proto2.SerializeToString())
+    proto3 = unittest_pb2.TestAllTypes(optional_int32=1)
+    proto3.optional_foreign_message.c = 1
+    proto3.CopyFrom(proto1)
+    self.assertTrue(serialized is proto3.SerializeToString())
+
+    # Modifying the copy, or any sub-message of it, drops its serialization.
+    proto2.optional_nested_message.bb = 1000
+    proto3.repeated_int32.append(5)
+    for proto in (proto2, proto3):
+      self.assertNotEqual(serialized, proto.SerializeToString())
+      self.assertEqual(proto.ByteSize(), len(proto.SerializeToString()))
+      self.assertEqual(
+          proto, unittest_pb2.TestAllTypes.FromString(proto.SerializeToString()))
+    self.assertTrue(serialized is proto1.SerializeToString())
+
+  def testSortingDropsSerialization(self):
+    proto = unittest_pb2.TestAllTypes()
+    proto.repeated_int32.extend([3, 1, 2])
+    proto.repeated_string.extend(['b', 'a'])
+    proto.ByteSize()
+    proto.SerializeToString()
+    proto.repeated_int32.sort()
+    proto.repeated_string.sort()
+    self.assertEqual(
+        [1, 2, 3],
+        unittest_pb2.TestAllTypes.FromString(
+            proto.SerializeToString()).repeated_int32)
+    self.assertEqual(
+        ['a', 'b'],
+        unittest_pb2.TestAllTypes.FromString(
+            proto.SerializeToString()).repeated_string)
+
   def testCopyFromBadType(self):
-    # The python implementation doesn't raise an exception in this
-    # case. In theory it should.
-    if api_implementation.Type() == 'python':
-      return
     proto1 = unittest_pb2.TestAllTypes()
     proto2 = unittest_pb2.TestAllExtensions()
     self.assertRaises(TypeError, proto1.CopyFrom, proto2)
@@ -1571,6 +1753,43 @@ class ReflectionTest(unittest.TestCase):
     self.assertFalse(proto.IsInitialized(errors))
     self.assertEqual(errors, ['a', 'b', 'c'])
 
+  def testIsInitializedAfterModifyingCheckedMessage(self):
+    proto = unittest_pb2.TestRequiredForeign()
+    for message1 in (proto.optional_message, proto.repeated_message.add(),
+                     proto.repeated_message.add()):
+      message1.a = message1.b = message1.c = 1
+    proto.SerializeToString()
+    self.assertInitialized(proto)
+
+    # Modifications below a checked message, whether or not it has been
+    # sized since, are seen by the next check.
+    proto.repeated_message[1].ClearField('b')
+    self.assertNotInitialized(proto)
+    proto.repeated_message[1].b = 1
+    self.assertInitialized(proto)
+    proto.ByteSize()
+    proto.optional_message.ClearField('c')
+    self.assertNotInitialized(proto)
+    self.assertRaises(message.EncodeError, proto.SerializeToString)
+    proto.optional_message.c = 1
+    proto.SerializeToString()
+    proto.repeated_message.add()
+    self.assertRaises(message.EncodeError, proto.SerializeToString)
+    del proto.repeated_message[2]
+    proto.SerializeToString()
+
+    # Unchanged sub-messages are not checked again.
+    def FailIsInitialized(unused_self, errors=None):
+      self.fail('IsInitialized() called.')
+    original_is_initialized = unittest_pb2.TestRequired.IsInitialized
+    unittest_pb2.TestRequired.IsInitialized = FailIsInitialized
+    try:
+      proto.dummy = 1
+      proto.SerializeToString()
+      self.assertInitialized(proto)
+    finally:
+      unittest_pb2.TestRequired.IsInitialized = original_is_initialized
+
   def testStringUTF8Encoding(self):
     proto = unittest_pb2.TestAllTypes()
 
@@ -2094,6 +2313,63 @@ class ByteSizeTest(unittest.TestCase):
     self.extended_proto.ClearExtension(extension)
     self.assertEqual(0, self.extended_proto.ByteSize())
 
+  def testCacheInvalidationIsPerField(self):
+    self.proto.optional_int32 = 1
+    nested = self.proto.optional_nested_message
+    nested.bb = 1
+    child = self.proto.repeated_nested_message.add()
+    child.bb = 1
+    self.assertEqual(12, self.Size())
+
+    # Changing one field must not size the other sub-messages again.
+    nested_class = unittest_pb2.TestAllTypes.NestedMessage
+    original_byte_size = nested_class.ByteSize
+    sized = []
+    def ByteSize(message):
+      sized.append(message)
+      return original_byte_size(message)
+    nested_class.ByteSize = ByteSize
+    try:
+      self.proto.optional_int32 = 300
+      self.assertEqual(13, self.Size())
+      self.assertEqual([], sized)
+      nested.bb = 300
+      self.assertEqual(14, self.Size())
+      self.assertEqual(1, len(sized))
+      self.assertTrue(sized[0] is nested)
+    finally:
+      nested_class.ByteSize = original_byte_size
+
+    child.bb = 300
+    self.assertEqual(15, self.Size())
+    self.proto.ClearField('optional_nested_message')
+    self.assertEqual(9, self.Size())
+    self.assertEqual(len(self.proto.SerializeToString()), self.Size())
+
+  def testCacheInvalidationMixingFieldsAndExtensions(self):
+    # default_cord is the 71st field, past the bits of a machine word.
+    self.proto.default_cord = 'a'
+    self.proto.optional_int32 = 1
+    self.assertEqual(6, self.Size())
+    self.proto.default_cord = 'abc'
+    self.proto.optional_int32 = 300
+    self.assertEqual(9, self.Size())
+    self.proto.ClearField('default_cord')
+    self.assertEqual(3, self.Size())
+
+    proto = unittest_pb2.TestFieldOrderings()
+    extension = unittest_pb2.my_extension_int
+    proto.Extensions[extension] = 1
+    proto.my_int = 1
+    self.assertEqual(4, proto.ByteSize())
+    proto.my_int = 300
+    self.assertEqual(5, proto.ByteSize())
+    proto.Extensions[extension] = 300
+    self.assertEqual(6, proto.ByteSize())
+    proto.ClearField('my_int')
+    self.assertEqual(3, proto.ByteSize())
+    self.assertEqual(len(proto.SerializeToString()), proto.ByteSize())
+
   def testPackedRepeatedScalars(self):
     self.assertEqual(0, self.packed_proto.ByteSize())
 
@@ -0,0 +1,136 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Tests for message classes which keep every declared field in a slot.
+
+Runs the message and reflection tests again with the 'slots' class layout.
+"""
+
+import os
+os.environ['PROTOCOL_BUFFERS_PYTHON_CLASS_LAYOUT'] = 'slots'
+
+import sys
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import python_message
+from google.protobuf.internal import test_util
+from google.protobuf.internal.message_test import *
+from google.protobuf.internal.reflection_test import *
+
+
+class SlotLayoutTest(unittest.TestCase):
+
+  def testClassLayoutSetting(self):
+    self.assertEqual('slots', api_implementation.ClassLayout())
+
+  def testNoFieldDict(self):
+    proto = unittest_pb2.ForeignMessage(c=1)
+    self.assertFalse(hasattr(proto, '__dict__'))
+    self.assertFalse('_fields' in unittest_pb2.ForeignMessage.__slots__)
+    self.assertTrue(python_message._SlotName(
+        unittest_pb2.ForeignMessage.DESCRIPTOR.fields_by_name['c']) in
+                    unittest_pb2.ForeignMessage.__slots__)
+    # A dict alone is bigger than the whole message.
+    self.assertTrue(sys.getsizeof(proto) < sys.getsizeof({}))
+
+  def testHasBits(self):
+    proto = unittest_pb2.TestAllTypes()
+    field = unittest_pb2.TestAllTypes.DESCRIPTOR.fields_by_name
+    int32_bit = field['optional_int32']._dirty_bit
+    self.assertEqual(0, proto._has_bits)
+    proto.optional_int32 = 0
+    self.assertEqual(int32_bit, proto._has_bits)
+    self.assertTrue(proto.HasField('optional_int32'))
+
+    proto = unittest_pb2.TestAllTypes.FromString(
+        unittest_pb2.TestAllTypes(optional_string=u'x',
+                                  repeated_int32=[1]).SerializeToString())
+    self.assertEqual(field['optional_string']._dirty_bit |
+                     field['repeated_int32']._dirty_bit, proto._has_bits)
+    proto.Clear()
+    self.assertEqual(0, proto._has_bits)
+    self.assertEqual(u'', proto.optional_string)
+    self.assertEqual([], proto.ListFields())
+
+  def testReadingSubMessageDoesNotSetIt(self):
+    proto = unittest_pb2.TestAllTypes()
+    self.assertEqual(0, proto.optional_nested_message.bb)
+    self.assertFalse(proto.HasField('optional_nested_message'))
+    self.assertEqual([], proto.ListFields())
+    self.assertEqual('', proto.SerializeToString())
+    proto.optional_nested_message.bb = 1
+    self.assertTrue(proto.HasField('optional_nested_message'))
+
+  def testListFieldsInNumberOrder(self):
+    proto = unittest_pb2.TestFieldOrderings()
+    proto.my_float = 1.0
+    proto.my_string = 'x'
+    proto.my_int = 1
+    self.assertEqual(['my_int', 'my_string', 'my_float'],
+                     [field.name for field, _ in proto.ListFields()])
+    self.assertEqual('\x08\x01\x5a\x01x\xad\x06\x00\x00\x80\x3f',
+                     proto.SerializeToString())
+
+  def testExtensions(self):
+    proto = unittest_pb2.TestAllExtensions()
+    self.assertEqual(None, proto._extension_fields)
+    test_util.SetAllExtensions(proto)
+    self.assertTrue(unittest_pb2.optional_int32_extension in
+                    proto._extension_fields)
+    self.assertEqual(0, proto._has_bits)
+    copy = unittest_pb2.TestAllExtensions.FromString(proto.SerializeToString())
+    self.assertEqual(proto, copy)
+    copy.Clear()
+    self.assertEqual(None, copy._extension_fields)
+
+  def testCopyAndMerge(self):
+    proto = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(proto)
+    copy = unittest_pb2.TestAllTypes()
+    copy.CopyFrom(proto)
+    self.assertEqual(proto, copy)
+    self.assertEqual(proto._has_bits, copy._has_bits)
+    # The copy does not share containers with the original.
+    copy.repeated_int32.append(1)
+    self.assertNotEqual(proto, copy)
+
+    merged = unittest_pb2.TestAllTypes(optional_int32=1)
+    merged.MergeFrom(unittest_pb2.TestAllTypes(optional_int64=2))
+    self.assertEqual(1, merged.optional_int32)
+    self.assertEqual(2, merged.optional_int64)
+    self.assertEqual(2, len(merged.ListFields()))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,318 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Table-driven parse engine for pure-Python protocol messages.
+
+This is an alternative to the _InternalParse() method built by
+python_message._AddMergeFromStringMethod().  Read decoder.py first.
+
+The default engine reads the raw bytes of every tag, looks them up in
+cls._decoders_by_tag, and calls the decoder closure found there, which in turn
+calls a value decoder.  For messages made of many small fields, most of the
+time goes into those calls rather than into actual decoding.
+
+Here we instead compile each message class, the first time it is parsed, into
+a flat table keyed by the decoded integer tag.  Each entry says what kind of
+field the tag belongs to, and the parse loop handles the common kinds --
+varints, bools, fixed-width integers, strings, bytes and sub-messages -- inline
+without any per-field function call.  Everything else (packed and repeated
+scalars, groups, floating point, MessageSet items) is delegated to the same
+decoder closures that the default engine uses, so both engines always produce
+the same messages.  Like those, it reads str, memoryview and buffer() inputs;
+see decoder.AsBuffer().
+
+The engine is selected by setting the environment variable
+PROTOCOL_BUFFERS_PYTHON_PARSER to 'table' before the first message class is
+created.  See api_implementation.ParserType().
+"""
+
+import struct
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import decoder
+from google.protobuf.internal import encoder
+from google.protobuf.internal import type_checkers
+from google.protobuf import descriptor as descriptor_mod
+from google.protobuf import message
+
+_FieldDescriptor = descriptor_mod.FieldDescriptor
+_DecodeError = message.DecodeError
+
+
+# Kinds of table entries.  The parse loop tests these in this order, so the
+# most common kinds come first.
+_KIND_BYTES = 0
+_KIND_VARINT = 1
+_KIND_REPEATED_MESSAGE = 2
+_KIND_MESSAGE = 3
+_KIND_STRING = 4
+_KIND_BOOL = 5
+_KIND_FIXED = 6
+_KIND_DECODER = 7
+
+# Value decoders for the varint types we handle inline.  Values which fit in a
+# single byte are handled without calling these at all.
+_VARINT_DECODERS = {
+    _FieldDescriptor.TYPE_INT32: decoder._DecodeSignedVarint32,
+    _FieldDescriptor.TYPE_ENUM: decoder._DecodeSignedVarint32,
+    _FieldDescriptor.TYPE_INT64: decoder._DecodeSignedVarint,
+    _FieldDescriptor.TYPE_UINT32: decoder._DecodeVarint32,
+    _FieldDescriptor.TYPE_UINT64: decoder._DecodeVarint,
+    }
+
+# struct formats for the fixed-width integer types we handle inline.  Floating
+# point values need the non-finite workarounds in decoder.py, so they are left
+# to the regular decoders.
+_FIXED_FORMATS = {
+    _FieldDescriptor.TYPE_FIXED32: '<I',
+    _FieldDescriptor.TYPE_FIXED64: '<Q',
+    _FieldDescriptor.TYPE_SFIXED32: '<i',
+    _FieldDescriptor.TYPE_SFIXED64: '<q',
+    }
+
+
+def _TagNumber(tag_bytes):
+  """Decodes the raw bytes of a tag into the integer used to key the table."""
+  return decoder._DecodeVarint(tag_bytes, 0)[0]
+
+
+def _EntryForField(field, field_decoder, has_slot):
+  """Returns the table entry for the canonical wire type of |field|.
+
+  Args:
+    field: A FieldDescriptor which has been through _AttachFieldHelpers().
+    field_decoder: The decoder closure the default engine uses for |field|.
+    has_slot: Whether the message class keeps |field| in a slot of its own
+      rather than in _fields; see api_implementation.ClassLayout().
+
+  Returns:
+    A (kind, field, extra) tuple.  The meaning of |extra| depends on |kind|.
+  """
+  field_type = field.type
+  if field._lazy or has_slot:
+    # The inline kinds below store into _fields.  A slot-aware decoder stores
+    # into the field's slot instead.
+    return (_KIND_DECODER, field, field_decoder)
+  if field.label == _FieldDescriptor.LABEL_REPEATED:
+    if field_type == _FieldDescriptor.TYPE_MESSAGE:
+      return (_KIND_REPEATED_MESSAGE, field, None)
+  elif field_type == _FieldDescriptor.TYPE_MESSAGE:
+    return (_KIND_MESSAGE, field, None)
+  elif field_type == _FieldDescriptor.TYPE_BYTES:
+    return (_KIND_BYTES, field, None)
+  elif field_type in _VARINT_DECODERS:
+    return (_KIND_VARINT, field, _VARINT_DECODERS[field_type])
+  elif field_type == _FieldDescriptor.TYPE_STRING:
+    return (_KIND_STRING, field, None)
+  elif field_type == _FieldDescriptor.TYPE_BOOL:
+    return (_KIND_BOOL, field, None)
+  elif field_type in _FIXED_FORMATS:
+    format = _FIXED_FORMATS[field_type]
+    return (_KIND_FIXED, field, (format, struct.calcsize(format)))
+  return (_KIND_DECODER, field, field_decoder)
+
+
+def CompileParseTable(cls):
+  """Builds the dispatch table for a message class.
+
+  The table maps every tag which cls._decoders_by_tag knows about, decoded as
+  an integer, to a (kind, field, extra) entry.  Entries of kind _KIND_DECODER
+  carry the decoder closure from cls._decoders_by_tag in |extra|.
+
+  Args:
+    cls: A message class built by python_message.
+
+  Returns:
+    The new table, which is also stored in cls._parse_table.
+  """
+  table = {}
+  for tag_bytes, field_decoder in cls._decoders_by_tag.iteritems():
+    table[_TagNumber(tag_bytes)] = (_KIND_DECODER, None, field_decoder)
+
+  fields = list(cls.DESCRIPTOR.fields)
+  fields.extend(cls._extensions_by_number.itervalues())
+  for field in fields:
+    tag_bytes = encoder.TagBytes(
+        field.number, type_checkers.FIELD_TYPE_TO_WIRE_TYPE[field.type])
+    table[_TagNumber(tag_bytes)] = _EntryForField(
+        field, cls._decoders_by_tag[tag_bytes], field in cls._field_slots)
+
+  cls._parse_table = table
+  return table
+
+
+def TableParser(cls):
+  """Returns an _InternalParse() implementation for cls.
+
+  The returned function has the same signature and contract as the
+  InternalParse function built by python_message._AddMergeFromStringMethod().
+  The table itself is built on first use, and rebuilt whenever
+  RegisterExtension() clears cls._parse_table.
+  """
+
+  cls._parse_table = None
+
+  local_ord = ord
+  local_unicode = unicode
+  local_unpack = struct.unpack
+  local_DecodeVarint = decoder._DecodeVarint
+  local_SkipField = decoder.SkipField
+  local_StringOf = decoder.StringOf
+  local_memoryview = decoder._memoryview
+  local_CompileParseTable = CompileParseTable
+
+  KIND_BYTES = _KIND_BYTES
+  KIND_VARINT = _KIND_VARINT
+  KIND_REPEATED_MESSAGE = _KIND_REPEATED_MESSAGE
+  KIND_MESSAGE = _KIND_MESSAGE
+  KIND_STRING = _KIND_STRING
+  KIND_BOOL = _KIND_BOOL
+  KIND_FIXED = _KIND_FIXED
+  # With the 'slots' layout, only the decoders of extensions use field_dict.
+  uses_field_dict = (api_implementation.ClassLayout() != 'slots' or
+                     cls.DESCRIPTOR.is_extendable)
+
+  def InternalParse(self, buffer, pos, end):
+    self._Modified()
+    field_dict = None
+    if uses_field_dict:
+      field_dict = self._fields
+    table = cls._parse_table
+    if table is None:
+      table = local_CompileParseTable(cls)
+
+    while pos != end:
+      # Read the tag.  Nearly all tags fit in one byte.
+      tag = local_ord(buffer[pos])
+      if tag < 0x80:
+        new_pos = pos + 1
+        entry = table.get(tag)
+      else:
+        (tag, new_pos) = local_DecodeVarint(buffer, pos)
+        if buffer[new_pos - 1] == '\x00':
+          # An over-long tag encoding.  The default engine looks tags up by
+          # their raw bytes, so it treats these as unknown; so do we.
+          entry = None
+        else:
+          entry = table.get(tag)
+
+      if entry is None:
+        tag_bytes = local_StringOf(buffer[pos:new_pos])
+        value_start_pos = new_pos
+        new_pos = local_SkipField(buffer, new_pos, end, tag_bytes)
+        if new_pos == -1:
+          return pos
+        if not self._unknown_fields:
+          self._unknown_fields = []
+        self._unknown_fields.append(
+            (tag_bytes, local_StringOf(buffer[value_start_pos:new_pos])))
+        pos = new_pos
+        continue
+
+      kind = entry[0]
+      if kind == KIND_BYTES:
+        size = local_ord(buffer[new_pos])
+        if size < 0x80:
+          new_pos += 1
+        else:
+          (size, new_pos) = local_DecodeVarint(buffer, new_pos)
+        pos = new_pos + size
+        if pos > end:
+          raise _DecodeError('Truncated string.')
+        field_dict[entry[1]] = buffer[new_pos:pos]
+
+      elif kind == KIND_VARINT:
+        value = local_ord(buffer[new_pos])
+        if value < 0x80:
+          pos = new_pos + 1
+        else:
+          (value, pos) = entry[2](buffer, new_pos)
+        if pos > end:
+          raise _DecodeError('Truncated message.')
+        field_dict[entry[1]] = value
+
+      elif kind == KIND_REPEATED_MESSAGE:
+        field = entry[1]
+        value = field_dict.get(field)
+        if value is None:
+          value = field_dict.setdefault(field, field._default_constructor(self))
+        size = local_ord(buffer[new_pos])
+        if size < 0x80:
+          new_pos += 1
+        else:
+          (size, new_pos) = local_DecodeVarint(buffer, new_pos)
+        pos = new_pos + size
+        if pos > end:
+          raise _DecodeError('Truncated message.')
+        if value.add()._InternalParse(buffer, new_pos, pos) != pos:
+          # The only reason _InternalParse would return early is if it
+          # encountered an end-group tag.
+          raise _DecodeError('Unexpected end-group tag.')
+
+      elif kind == KIND_MESSAGE:
+        field = entry[1]
+        value = field_dict.get(field)
+        if value is None:
+          value = field_dict.setdefault(field, field._default_constructor(self))
+        (size, new_pos) = local_DecodeVarint(buffer, new_pos)
+        pos = new_pos + size
+        if pos > end:
+          raise _DecodeError('Truncated message.')
+        if value._InternalParse(buffer, new_pos, pos) != pos:
+          raise _DecodeError('Unexpected end-group tag.')
+
+      elif kind == KIND_STRING:
+        (size, new_pos) = local_DecodeVarint(buffer, new_pos)
+        pos = new_pos + size
+        if pos > end:
+          raise _DecodeError('Truncated string.')
+        value = buffer[new_pos:pos]
+        if value.__class__ is local_memoryview:
+          value = value.tobytes()
+        field_dict[entry[1]] = local_unicode(value, 'utf-8')
+
+      elif kind == KIND_BOOL:
+        (value, pos) = local_DecodeVarint(buffer, new_pos)
+        if pos > end:
+          raise _DecodeError('Truncated message.')
+        field_dict[entry[1]] = value != 0
+
+      elif kind == KIND_FIXED:
+        (format, size) = entry[2]
+        pos = new_pos + size
+        if pos > end:
+          raise _DecodeError('Truncated message.')
+        field_dict[entry[1]] = local_unpack(format, buffer[new_pos:pos])[0]
+
+      else:
+        pos = entry[2](buffer, new_pos, end, self, field_dict)
+
+    return pos
+
+  return InternalParse
@@ -0,0 +1,103 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Tests for google.protobuf.internal.table_decoder.
+
+Runs the golden message and unknown field tests again with the table-driven
+parse engine selected.
+"""
+
+import os
+os.environ['PROTOCOL_BUFFERS_PYTHON_PARSER'] = 'table'
+
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import api_implementation
+from google.protobuf.internal import encoder
+from google.protobuf.internal import more_extensions_pb2
+from google.protobuf.internal import test_util
+from google.protobuf.internal import wire_format
+from google.protobuf import message
+from google.protobuf.internal.message_test import *
+from google.protobuf.internal.unknown_fields_test import *
+
+
+class TableDecoderTest(unittest.TestCase):
+
+  def testParserSetting(self):
+    self.assertEqual('table', api_implementation.ParserType())
+
+  def testMatchesDefaultEngineOutput(self):
+    all_set = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(all_set)
+    # Values which do not fit in a single byte take the slow varint path.
+    all_set.optional_int32 = -1
+    all_set.optional_uint64 = 1 << 63
+    all_set.optional_nested_message.bb = 300
+    data = all_set.SerializeToString()
+    parsed = unittest_pb2.TestAllTypes.FromString(data)
+    self.assertEqual(all_set, parsed)
+    self.assertEqual(data, parsed.SerializeToString())
+
+  def testOverlongTagIsUnknown(self):
+    # optional_int32 (field 1, varint) with its tag padded to two bytes.
+    data = '\x88\x00\x05'
+    parsed = unittest_pb2.TestAllTypes.FromString(data)
+    self.assertFalse(parsed.HasField('optional_int32'))
+    self.assertEqual([('\x88\x00', '\x05')], parsed._unknown_fields)
+    self.assertEqual(data, parsed.SerializeToString())
+
+  def testTruncatedFields(self):
+    for data in ('\x08\x96',              # varint
+                 '\x72\x05ab',            # string
+                 '\x7a\x05ab',            # bytes
+                 '\x3d\x01\x02',          # fixed32
+                 '\x92\x01\x05\x08'):     # message
+      self.assertRaises(message.DecodeError,
+                        unittest_pb2.TestAllTypes.FromString, data)
+
+  def testRegisterExtensionResetsTable(self):
+    field = more_extensions_pb2.optional_int_extension
+    more_extensions_pb2.ExtendedMessage.FromString('')
+    self.assertNotEqual(None, more_extensions_pb2.ExtendedMessage._parse_table)
+    more_extensions_pb2.ExtendedMessage.RegisterExtension(field)
+    self.assertEqual(None, more_extensions_pb2.ExtendedMessage._parse_table)
+
+    data = (encoder.TagBytes(field.number, wire_format.WIRETYPE_VARINT) +
+            encoder._VarintBytes(17))
+    parsed = more_extensions_pb2.ExtendedMessage.FromString(data)
+    self.assertEqual(17, parsed.Extensions[field])
+
+
+if __name__ == '__main__':
+  unittest.main()
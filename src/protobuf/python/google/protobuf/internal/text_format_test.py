@@ -34,6 +34,7 @@
 
 __author__ = 'kenton@google.com (Kenton Varda)'
 
+import cStringIO
 import difflib
 import re
 
@@ -225,6 +226,86 @@ class TextFormatTest(unittest.TestCase):
     text_format.Merge(wire_text, parsed_message)
     self.assertEquals(message, parsed_message)
 
+  def testRoundTripAllBytes(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_bytes = ''.join(map(chr, xrange(256)))
+    message.repeated_bytes.append('no escapes')
+    for as_utf8 in (False, True):
+      parsed_message = unittest_pb2.TestAllTypes()
+      text_format.Merge(text_format.MessageToString(message, as_utf8=as_utf8),
+                        parsed_message)
+      self.assertEquals(message, parsed_message)
+
+  def testPrintWithIndent(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_int32 = 1
+    message.repeated_nested_message.add().bb = 2
+    out = cStringIO.StringIO()
+    text_format.PrintMessage(message, out, indent=2)
+    self.CompareToGoldenText(
+        out.getvalue(),
+        '  optional_int32: 1\n'
+        '  repeated_nested_message {\n'
+        '    bb: 2\n'
+        '  }\n')
+    out = cStringIO.StringIO()
+    text_format.PrintMessage(message, out, indent=2, as_one_line=True)
+    self.assertEqual(
+        '  optional_int32: 1   repeated_nested_message {   bb: 2 } ',
+        out.getvalue())
+
+  def testPrintMessageParsedFromMemoryview(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    message.repeated_bytes.append('\x00\xff"')
+    data = message.SerializeToString()
+    message = unittest_pb2.TestAllTypes.FromString(data)
+    parsed = unittest_pb2.TestAllTypes.FromString(memoryview(data))
+    self.assertEqual(text_format.MessageToString(message),
+                     text_format.MessageToString(parsed))
+    self.assertEqual(
+        text_format.MessageToString(message, max_bytes_length=2),
+        text_format.MessageToString(parsed, max_bytes_length=2))
+    self.assertEqual(str(message), str(parsed))
+
+  def testMessageToChunks(self):
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    for as_one_line in (False, True):
+      chunks = list(text_format.MessageToChunks(
+          message, as_one_line=as_one_line, chunk_size=100))
+      self.assertTrue(len(chunks) > 1)
+      self.assertEqual(
+          text_format.MessageToString(message, as_one_line=as_one_line),
+          ''.join(chunks))
+    self.assertEqual([], list(text_format.MessageToChunks(
+        unittest_pb2.TestAllTypes())))
+
+  def testMessageToChunksElementLargerThanChunk(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_string = 'x' * 100
+    message.repeated_string.extend(['y' * 100, 'z'])
+    for as_one_line in (False, True):
+      chunks = list(text_format.MessageToChunks(
+          message, as_one_line=as_one_line, chunk_size=10))
+      self.assertFalse('' in chunks)
+      self.assertEqual(
+          text_format.MessageToString(message, as_one_line=as_one_line),
+          ''.join(chunks))
+
+  def testPrintTruncatedBytes(self):
+    message = unittest_pb2.TestAllTypes()
+    message.optional_bytes = '\001' * 10
+    message.optional_string = 'a' * 10
+    message.repeated_bytes.append('abc')
+    self.CompareToGoldenText(
+        text_format.MessageToString(message, max_bytes_length=3),
+        'optional_string: "aaaaaaaaaa"\n'
+        'optional_bytes: "\\001\\001\\001"...(10 bytes)\n'
+        'repeated_bytes: "abc"\n')
+    self.assertTrue('optional_bytes: "%s"' % ('\\001' * 10) in
+                    text_format.MessageToString(message))
+
   def testPrintRawUtf8String(self):
     message = unittest_pb2.TestAllTypes()
     message.repeated_string.append(u'\u00fc\ua71f')
@@ -258,6 +339,18 @@ class TextFormatTest(unittest.TestCase):
     test_util.SetAllFields(message)
     self.assertEquals(message, parsed_message)
 
+  def testMergeGoldenFile(self):
+    golden_file = test_util.GoldenFile('text_format_unittest_data.txt')
+    parsed_message = unittest_pb2.TestAllTypes()
+    try:
+      text_format.Merge(golden_file, parsed_message)
+    finally:
+      golden_file.close()
+
+    message = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(message)
+    self.assertEquals(message, parsed_message)
+
   def testMergeGoldenExtensions(self):
     golden_text = '\n'.join(self.ReadGolden(
         'text_format_unittest_extensions_data.txt'))
@@ -429,6 +522,18 @@ class TextFormatTest(unittest.TestCase):
         ('1:17 : Couldn\'t parse integer: bork'),
         text_format.Merge, text, message)
 
+  def testMergeErrorOnLaterLine(self):
+    message = unittest_pb2.TestAllTypes()
+    text = 'optional_int32: 1\n# comment\n\n  optional_int64: bork\n'
+    self.assertRaisesWithMessage(
+        text_format.ParseError,
+        ('4:19 : Couldn\'t parse integer: bork'),
+        text_format.Merge, text, message)
+    self.assertRaisesWithMessage(
+        text_format.ParseError,
+        ('4:19 : Couldn\'t parse integer: bork'),
+        text_format.Merge, cStringIO.StringIO(text), message)
+
   def testMergeStringFieldUnescape(self):
     message = unittest_pb2.TestAllTypes()
     text = r'''repeated_string: "\xf\x62"
@@ -612,6 +717,28 @@ class TokenizerTest(unittest.TestCase):
     tokenizer = text_format._Tokenizer(text)
     self.assertRaises(text_format.ParseError, tokenizer.ConsumeBool)
 
+  def testReadFileInChunks(self):
+    class SmallChunkTokenizer(text_format._Tokenizer):
+      _CHUNK_SIZE = 3
+
+    text = ('first: "a long string" # a comment\n\n'
+            '  second { third: 12345678 }\n'
+            'fourth: \'unterminated\n'
+            'fifth')
+    tokenizer = text_format._Tokenizer(text)
+    file_tokenizer = SmallChunkTokenizer(cStringIO.StringIO(text))
+    while not tokenizer.AtEnd():
+      self.assertEqual(tokenizer.token, file_tokenizer.token)
+      if tokenizer.token == 'third':
+        self.assertEqual('3:12 : here',
+                         str(file_tokenizer._ParseError('here')))
+      elif tokenizer.token == 'fifth':
+        self.assertEqual('4:9 : here',
+                         str(file_tokenizer.ParseErrorPreviousToken('here')))
+      tokenizer.NextToken()
+      file_tokenizer.NextToken()
+    self.assertTrue(file_tokenizer.AtEnd())
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -41,10 +41,13 @@ FIELD_TYPE_TO_WIRE_TYPE: A dictionary with field typed and their
   coresponding wire types.
 TYPE_TO_DESERIALIZE_METHOD: A dictionary with field types and deserialization
   function.
+CPPTYPE_TO_ARRAY_TYPECODE: A dictionary with C++ types and the array.array
+  typecodes their repeated fields are stored with.
 """
 
 __author__ = 'robinson@google.com (Will Robinson)'
 
+import array
 from google.protobuf.internal import decoder
 from google.protobuf.internal import encoder
 from google.protobuf.internal import wire_format
@@ -162,10 +165,32 @@ _VALUE_CHECKERS = {
         float, int, long),
     _FieldDescriptor.CPPTYPE_BOOL: TypeChecker(bool, int),
     _FieldDescriptor.CPPTYPE_ENUM: Int32ValueChecker(),
-    _FieldDescriptor.CPPTYPE_STRING: TypeChecker(str),
+    # Bytes fields parsed from a memoryview hold memoryview slices of it.
+    _FieldDescriptor.CPPTYPE_STRING: TypeChecker(str, decoder._memoryview),
     }
 
 
+# Maps from C++ types to the array.array typecodes which repeated fields of
+# those types are stored with.  Each integer typecode has the exact range of
+# its C++ type, so that storing a value in the array checks its range.  Floats
+# are stored as doubles, as Python floats are.  Types for which this platform
+# has no suitable typecode are left out and stored in lists.  The typecode also
+# decides the type values read back as: 'I' and 'L' items are longs, 'i' and
+# 'l' items are ints and 'd' items are floats.
+CPPTYPE_TO_ARRAY_TYPECODE = {}
+for _cpp_type, _typecode, _itemsize in (
+    (_FieldDescriptor.CPPTYPE_INT32, 'i', 4),
+    (_FieldDescriptor.CPPTYPE_UINT32, 'I', 4),
+    (_FieldDescriptor.CPPTYPE_INT64, 'l', 8),
+    (_FieldDescriptor.CPPTYPE_UINT64, 'L', 8),
+    (_FieldDescriptor.CPPTYPE_DOUBLE, 'd', 8),
+    (_FieldDescriptor.CPPTYPE_FLOAT, 'd', 8),
+    (_FieldDescriptor.CPPTYPE_ENUM, 'i', 4)):
+  if array.array(_typecode).itemsize == _itemsize:
+    CPPTYPE_TO_ARRAY_TYPECODE[_cpp_type] = _typecode
+del _cpp_type, _typecode, _itemsize
+
+
 # Map from field type to a function F, such that F(field_num, value)
 # gives the total byte size for a value of the given type.  This
 # byte size includes tag information and any other additional space
@@ -61,9 +61,9 @@ class UnknownFieldsTest(unittest.TestCase):
     for tag_bytes, value in self.unknown_fields:
       if tag_bytes == field_tag:
         decoder = unittest_pb2.TestAllTypes._decoders_by_tag[tag_bytes]
-        result_dict = {}
-        decoder(value, 0, len(value), self.all_fields, result_dict)
-        return result_dict[field_descriptor]
+        message = unittest_pb2.TestAllTypes()
+        decoder(value, 0, len(value), message, message._fields)
+        return message._fields[field_descriptor]
 
   def testVarint(self):
     value = self.GetField('optional_int32')
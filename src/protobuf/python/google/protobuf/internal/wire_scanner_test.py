@@ -0,0 +1,138 @@
+#! /usr/bin/python
+#
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Tests for google.protobuf.wire_scanner."""
+
+import unittest
+from google.protobuf import unittest_pb2
+from google.protobuf.internal import test_util
+from google.protobuf.internal import wire_format
+from google.protobuf import message
+from google.protobuf import wire_scanner
+
+
+class ScanFieldsTest(unittest.TestCase):
+
+  def testWireTypes(self):
+    proto = unittest_pb2.TestAllTypes(
+        optional_int32=300, optional_fixed64=1, optional_fixed32=2,
+        optional_string='abc')
+    proto.optionalgroup.a = 5
+    data = proto.SerializeToString()
+    fields = list(wire_scanner.ScanFields(data))
+    self.assertEqual(
+        [(1, wire_format.WIRETYPE_VARINT, 1, 2),
+         (7, wire_format.WIRETYPE_FIXED32, 4, 4),
+         (8, wire_format.WIRETYPE_FIXED64, 9, 8),
+         (14, wire_format.WIRETYPE_LENGTH_DELIMITED, 19, 3),
+         (16, wire_format.WIRETYPE_START_GROUP, 24, 3)],
+        fields)
+    self.assertEqual(300, wire_scanner.DecodeVarint(data, 1))
+    self.assertEqual('abc', data[19:22])
+    self.assertEqual('\x88\x01\x05', data[24:27])
+
+  def testRange(self):
+    data = unittest_pb2.TestAllTypes(optional_int32=1).SerializeToString()
+    data = 'xx' + data * 2
+    self.assertEqual([(1, 0, 3, 1), (1, 0, 5, 1)],
+                     list(wire_scanner.ScanFields(data, 2)))
+    self.assertEqual([(1, 0, 3, 1)],
+                     list(wire_scanner.ScanFields(data, 2, 4)))
+    self.assertEqual([], list(wire_scanner.ScanFields(data, 2, 2)))
+
+  def testBuffers(self):
+    golden = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(golden)
+    data = golden.SerializeToString()
+    expected = list(wire_scanner.ScanFields(data))
+    for buf in (bytearray(data), buffer(data), memoryview(data)):
+      self.assertEqual(expected, list(wire_scanner.ScanFields(buf)))
+
+  def testErrors(self):
+    for data in ('\x08', '\x0a\x05abc', '\x0d\x00', '\x0c', '\x0e\x00',
+                 '\x08\x80'):
+      self.assertRaises(message.DecodeError, list,
+                        wire_scanner.ScanFields(data))
+    self.assertRaises(message.DecodeError, list,
+                      wire_scanner.ScanFields('\x0a\x02ab', 0, 3))
+
+
+class FieldIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.golden = unittest_pb2.TestAllTypes()
+    test_util.SetAllFields(self.golden)
+    self.data = self.golden.SerializeToString()
+    self.descriptor = unittest_pb2.TestAllTypes.DESCRIPTOR
+
+  def testRepeatedMessages(self):
+    number = unittest_pb2.TestAllTypes.REPEATED_NESTED_MESSAGE_FIELD_NUMBER
+    index = wire_scanner.FieldIndex(self.data)
+    self.assertEqual(2, index.Count(number))
+    self.assertEqual(0, index.Count(1000))
+    for i, nested in enumerate(self.golden.repeated_nested_message):
+      self.assertEqual(nested.SerializeToString(), index.Bytes(number, i))
+      self.assertEqual(
+          nested,
+          index.ParseMessage(number, i, unittest_pb2.TestAllTypes.NestedMessage))
+    self.assertEqual(self.golden.repeated_nested_message[1],
+                     index.ParseMessage(number, -1,
+                                        unittest_pb2.TestAllTypes.NestedMessage))
+    self.assertRaises(IndexError, index.Range, number, 2)
+    self.assertRaises(IndexError, index.Range, 1000)
+    self.assertRaises(message.DecodeError, index.ParseMessage,
+                      unittest_pb2.TestAllTypes.OPTIONAL_INT32_FIELD_NUMBER, 0,
+                      unittest_pb2.TestAllTypes.NestedMessage)
+
+    nested_index = index.Index(number, 1)
+    self.assertEqual([1], nested_index.FieldNumbers())
+    self.assertEqual(self.golden.repeated_nested_message[1].bb,
+                     wire_scanner.DecodeVarint(self.data,
+                                               nested_index.Range(1)[1]))
+
+  def testFieldNumbers(self):
+    index = wire_scanner.FieldIndex(self.data)
+    self.assertEqual(
+        sorted(field.number for field, value in self.golden.ListFields()),
+        index.FieldNumbers())
+
+    index = wire_scanner.FieldIndex(self.data, field_numbers=[1, 31])
+    self.assertEqual([1, 31], index.FieldNumbers())
+    self.assertEqual(2, index.Count(31))
+    wire_type, offset, length = index.Range(1)
+    self.assertEqual(wire_format.WIRETYPE_VARINT, wire_type)
+    self.assertEqual(self.golden.optional_int32,
+                     wire_scanner.DecodeVarint(self.data, offset))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,437 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Converts protocol messages to and from JSON.
+
+A message becomes a JSON object with a member for each field which is set,
+named after the field, or "[full.extension.name]" for an extension.  Repeated
+fields become arrays and sub-messages nested objects.  Enum values are given
+by name, bytes in base64 or hex, and the non-finite floats as the strings
+"NaN", "Infinity" and "-Infinity".  Numbers are accepted as strings when
+parsing.
+"""
+
+import base64
+import binascii
+import collections
+import functools
+import json
+import operator
+
+from google.protobuf import descriptor
+
+__all__ = [ 'MessageToDict', 'MessageToJson', 'MessageToJsonChunks',
+            'ParseDict', 'Parse' ]
+
+
+_INFINITY = float('inf')
+
+# Maps a bytes_format to the functions encoding and decoding bytes values.
+_BYTES_FORMATS = {
+    'base64': (base64.b64encode, base64.b64decode),
+    'hex': (binascii.hexlify, binascii.unhexlify),
+}
+
+_encode_json = json.JSONEncoder().encode
+
+
+class ParseError(Exception):
+  """Thrown in case of JSON parsing error."""
+
+
+def MessageToDict(message, bytes_format='base64',
+                  use_integers_for_enums=False):
+  """Returns the JSON object for message as a dict.
+
+  The dict is an OrderedDict with the members in field number order, the
+  order ListFields() gives, so that it is dumped in the same order each time.
+
+  Args:
+    message: The message to convert.
+    bytes_format: 'base64' or 'hex', how to encode bytes values.
+    use_integers_for_enums: Give enum values by number rather than name.
+  """
+  return _GetConverter(bytes_format, use_integers_for_enums).MessageToDict(
+      message)
+
+
+def MessageToJson(message, indent=None, bytes_format='base64',
+                  use_integers_for_enums=False):
+  """Returns the JSON text of message.
+
+  See MessageToDict() for the arguments; indent is passed to json.dumps().
+  """
+  result = MessageToDict(message, bytes_format, use_integers_for_enums)
+  if indent is None:
+    return json.dumps(result)
+  return json.dumps(result, indent=indent, separators=(',', ': '))
+
+
+def MessageToJsonChunks(message, bytes_format='base64',
+                        use_integers_for_enums=False, chunk_size=1 << 16):
+  """Yields the JSON text of message in chunks of about chunk_size bytes.
+
+  The elements of repeated fields are converted one at a time, so only the
+  JSON of one element of a field of message is held in memory besides the
+  chunk.  Joined, the chunks are the text MessageToJson() returns without an
+  indent.  See MessageToDict() for the other arguments.
+  """
+  converter = _GetConverter(bytes_format, use_integers_for_enums)
+  pieces = []
+  size = 0
+  for piece in converter.JsonPieces(message):
+    pieces.append(piece)
+    size += len(piece)
+    if size >= chunk_size:
+      yield ''.join(pieces)
+      pieces = []
+      size = 0
+  if pieces:
+    yield ''.join(pieces)
+
+
+def ParseDict(js_dict, message, bytes_format='base64',
+              ignore_unknown_fields=False):
+  """Merges the fields of a JSON object into message.
+
+  Args:
+    js_dict: The JSON object, as a dict.
+    message: The message to merge into.
+    bytes_format: 'base64' or 'hex', how bytes values are encoded.
+    ignore_unknown_fields: Skip members naming no field of the message,
+      rather than raising ParseError.
+
+  Returns:
+    message.
+
+  Raises:
+    ParseError: On JSON which does not match the message type.
+  """
+  _GetConverter(bytes_format, False).ParseDict(
+      js_dict, message, ignore_unknown_fields)
+  return message
+
+
+def Parse(text, message, bytes_format='base64', ignore_unknown_fields=False):
+  """Merges JSON text into message.  See ParseDict()."""
+  try:
+    js_dict = json.loads(text)
+  except ValueError, e:
+    raise ParseError('Failed to load JSON: %s' % e)
+  return ParseDict(js_dict, message, bytes_format, ignore_unknown_fields)
+
+
+class _Converter(object):
+
+  """Converts messages to and from JSON objects with one set of options.
+
+  How to convert a field is worked out the first time the field is converted
+  and kept for the next ones, as are the fields of each message type by the
+  names they are parsed under.
+  """
+
+  def __init__(self, bytes_format, use_integers_for_enums):
+    try:
+      self._encode_bytes, self._decode_bytes = _BYTES_FORMATS[bytes_format]
+    except KeyError:
+      raise ValueError('Unknown bytes_format: %r' % (bytes_format,))
+    self._use_integers_for_enums = use_integers_for_enums
+    # Map a FieldDescriptor to its JSON member name and the function
+    # converting the field's value, or one of its elements, to JSON.  The
+    # functions are None where the value is its own JSON.
+    self._field_converters = {}
+    self._element_converters = {}
+    # Map a message Descriptor to a dict from JSON member names to the
+    # functions parsing them.
+    self._parsers = {}
+
+  def MessageToDict(self, message):
+    result = collections.OrderedDict()
+    field_converters = self._field_converters
+    for field, value in message._IterFields():
+      converter = field_converters.get(field)
+      if converter is None:
+        converter = self.FieldConverter(field)
+      name, convert = converter
+      if convert is None:
+        result[name] = value
+      else:
+        result[name] = convert(value)
+    return result
+
+  def JsonPieces(self, message):
+    """Yields the JSON text of message, an element of a field at a time."""
+    separator = '{'
+    for field, value in message._IterFields():
+      name, convert = self.FieldConverter(field)
+      if field.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+        convert = self.ElementConverter(field)
+        element_separator = separator + _encode_json(name) + ': ['
+        for element in value:
+          if convert is not None:
+            element = convert(element)
+          yield element_separator + _encode_json(element)
+          element_separator = ', '
+        if element_separator == ', ':
+          yield ']'
+        else:
+          yield element_separator + ']'
+      else:
+        if convert is not None:
+          value = convert(value)
+        yield separator + _encode_json(name) + ': ' + _encode_json(value)
+      separator = ', '
+    if separator == '{':
+      yield '{}'
+    else:
+      yield '}'
+
+  def FieldConverter(self, field):
+    """Returns the JSON name of field and the function converting values."""
+    converter = self._field_converters.get(field)
+    if converter is None:
+      convert = self.ElementConverter(field)
+      if field.label != descriptor.FieldDescriptor.LABEL_REPEATED:
+        pass
+      elif convert is None:
+        convert = list
+      else:
+        convert = functools.partial(map, convert)
+      converter = self._field_converters[field] = (_FieldName(field), convert)
+    return converter
+
+  def ElementConverter(self, field):
+    """Returns the function converting one value of field, or None."""
+    try:
+      return self._element_converters[field]
+    except KeyError:
+      pass
+    cpp_type = field.cpp_type
+    if cpp_type == descriptor.FieldDescriptor.CPPTYPE_MESSAGE:
+      convert = self.MessageToDict
+    elif cpp_type == descriptor.FieldDescriptor.CPPTYPE_ENUM:
+      if self._use_integers_for_enums:
+        convert = None
+      else:
+        names = dict((value.number, value.name)
+                     for value in field.enum_type.values)
+        def ConvertEnum(value):
+          # Values missing from the enum type are given by number.
+          return names.get(value, value)
+        convert = ConvertEnum
+    elif field.type == descriptor.FieldDescriptor.TYPE_BYTES:
+      convert = self._encode_bytes
+    elif cpp_type in (descriptor.FieldDescriptor.CPPTYPE_FLOAT,
+                      descriptor.FieldDescriptor.CPPTYPE_DOUBLE):
+      convert = _ConvertFloat
+    else:
+      convert = None
+    self._element_converters[field] = convert
+    return convert
+
+  def ParseDict(self, js_dict, message, ignore_unknown_fields):
+    message_descriptor = message.DESCRIPTOR
+    if not isinstance(js_dict, dict):
+      raise ParseError('Expected a JSON object for message type "%s", got %r.'
+                       % (message_descriptor.full_name, js_dict))
+    parsers = self._parsers.get(message_descriptor)
+    if parsers is None:
+      parsers = self._parsers[message_descriptor] = dict(
+          (_FieldName(field), self._FieldParser(field))
+          for field in message_descriptor.fields)
+
+    for name, value in js_dict.iteritems():
+      parse = parsers.get(name)
+      if parse is None:
+        field = None
+        if (name.startswith('[') and name.endswith(']') and
+            message_descriptor.is_extendable):
+          field = message.Extensions._FindExtensionByName(name[1:-1])
+        if field is not None and field.containing_type == message_descriptor:
+          parse = parsers[name] = self._FieldParser(field)
+        elif ignore_unknown_fields:
+          continue
+        else:
+          raise ParseError('Message type "%s" has no field named "%s".' % (
+              message_descriptor.full_name, name))
+      # null stands for a field which is not set.
+      if value is None:
+        continue
+      try:
+        parse(message, value, ignore_unknown_fields)
+      except (TypeError, ValueError, KeyError), e:
+        raise ParseError('Failed to parse field "%s" of message type "%s": %s'
+                         % (name, message_descriptor.full_name, e))
+
+  def _FieldParser(self, field):
+    """Returns the function merging a JSON value of field into a message."""
+    if field.is_extension:
+      def GetField(message):
+        return message.Extensions[field]
+      def SetField(message, value):
+        message.Extensions[field] = value
+    else:
+      name = field.name
+      GetField = operator.attrgetter(name)
+      def SetField(message, value):
+        setattr(message, name, value)
+    is_repeated = field.label == descriptor.FieldDescriptor.LABEL_REPEATED
+
+    if field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_MESSAGE:
+      parse_message = self.ParseDict
+      if is_repeated:
+        def ParseField(message, value, ignore_unknown_fields):
+          add = GetField(message).add
+          for element in _CheckList(value):
+            parse_message(element, add(), ignore_unknown_fields)
+      else:
+        def ParseField(message, value, ignore_unknown_fields):
+          sub_message = GetField(message)
+          sub_message.SetInParent()
+          parse_message(value, sub_message, ignore_unknown_fields)
+    else:
+      parse_value = self._ValueParser(field)
+      if is_repeated:
+        def ParseField(message, value, ignore_unknown_fields):
+          value = _CheckList(value)
+          if parse_value is not None:
+            value = map(parse_value, value)
+          GetField(message).extend(value)
+      elif parse_value is None:
+        def ParseField(message, value, ignore_unknown_fields):
+          SetField(message, value)
+      else:
+        def ParseField(message, value, ignore_unknown_fields):
+          SetField(message, parse_value(value))
+    return ParseField
+
+  def _ValueParser(self, field):
+    """Returns the function parsing a JSON value of scalar field, or None.
+
+    The values returned are checked by the message as they are set.
+    """
+    cpp_type = field.cpp_type
+    if cpp_type == descriptor.FieldDescriptor.CPPTYPE_ENUM:
+      values_by_name = field.enum_type.values_by_name
+      def ParseEnum(value):
+        if isinstance(value, basestring):
+          return values_by_name[value].number
+        return value
+      return ParseEnum
+    elif field.type == descriptor.FieldDescriptor.TYPE_BYTES:
+      decode_bytes = self._decode_bytes
+      def ParseBytes(value):
+        return decode_bytes(str(value))
+      return ParseBytes
+    elif cpp_type in (descriptor.FieldDescriptor.CPPTYPE_FLOAT,
+                      descriptor.FieldDescriptor.CPPTYPE_DOUBLE):
+      return _ParseFloat
+    elif cpp_type in (descriptor.FieldDescriptor.CPPTYPE_INT32,
+                      descriptor.FieldDescriptor.CPPTYPE_INT64,
+                      descriptor.FieldDescriptor.CPPTYPE_UINT32,
+                      descriptor.FieldDescriptor.CPPTYPE_UINT64):
+      return _ParseInteger
+    return None
+
+
+# Maps (bytes_format, use_integers_for_enums) to the _Converter converting
+# with those options.
+_converters = {}
+
+
+def _GetConverter(bytes_format, use_integers_for_enums):
+  key = (bytes_format, bool(use_integers_for_enums))
+  converter = _converters.get(key)
+  if converter is None:
+    converter = _converters.setdefault(key, _Converter(*key))
+  return converter
+
+
+def _FieldName(field):
+  """Returns the JSON member name of field."""
+  if field.is_extension:
+    return '[%s]' % field.full_name
+  return field.name
+
+
+def _CheckList(value):
+  if not isinstance(value, list):
+    raise ValueError('Expected a JSON array, got %r.' % (value,))
+  return value
+
+
+def _ConvertFloat(value):
+  if value != value:
+    return 'NaN'
+  elif value == _INFINITY:
+    return 'Infinity'
+  elif value == -_INFINITY:
+    return '-Infinity'
+  return value
+
+
+def _ParseFloat(value):
+  if isinstance(value, basestring):
+    if value not in ('NaN', 'Infinity', '-Infinity'):
+      # Reject the other spellings float() accepts, such as 'inf'.
+      value = _ParseNumber(value)
+    return float(value)
+  elif isinstance(value, bool):
+    raise ValueError('Expected a number, got %r.' % (value,))
+  return value
+
+
+def _ParseInteger(value):
+  if value.__class__ is int:
+    return value
+  elif isinstance(value, basestring):
+    value = _ParseNumber(value)
+  if isinstance(value, float):
+    if not value.is_integer():
+      raise ValueError('Expected an integer, got %r.' % (value,))
+    return int(value)
+  elif isinstance(value, bool):
+    raise ValueError('Expected an integer, got %r.' % (value,))
+  return value
+
+
+def _ParseNumber(text):
+  """Parses a number given as a JSON string."""
+  try:
+    value = json.loads(text, parse_constant=_RejectConstant)
+  except ValueError:
+    value = None
+  if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+    raise ValueError('Expected a number, got %r.' % (text,))
+  return value
+
+
+def _RejectConstant(name):
+  raise ValueError(name)
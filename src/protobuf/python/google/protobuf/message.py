@@ -160,7 +160,10 @@ class Message(object):
 
     Args:
       serialized: Any object that allows us to call buffer(serialized)
-        to access a string of bytes using the buffer interface.
+        to access a string of bytes using the buffer interface, e.g. a str,
+        bytearray or mmap.  The data is read in place, without first being
+        copied into a str.  If |serialized| is a memoryview, values of bytes
+        fields are returned as memoryview slices of it instead of copies.
 
     TODO(robinson): When we switch to a helper, this will return None.
 
@@ -228,6 +231,16 @@ class Message(object):
     number"""
     raise NotImplementedError
 
+  def _IterFields(self):
+    """Internal method used by the protocol message implementation,
+    text_format and json_format.  Clients should not call this directly.
+
+    Returns an iterator over the (FieldDescriptor, value) tuples ListFields()
+    returns, in the same order.  Implementations may produce them without
+    building the list.
+    """
+    return iter(self.ListFields())
+
   def HasField(self, field_name):
     """Checks if a certain field is set for the message. Note if the
     field_name is not defined in the message descriptor, ValueError will be
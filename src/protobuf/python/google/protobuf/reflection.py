@@ -64,10 +64,13 @@ if api_implementation.Type() == 'cpp':
     from google.protobuf.internal import cpp_message
     _NewMessage = cpp_message.NewMessage
     _InitMessage = cpp_message.InitMessage
+  # The C++ implementation always sets up a class completely.
+  _MaterializeMessage = None
 else:
   from google.protobuf.internal import python_message
   _NewMessage = python_message.NewMessage
   _InitMessage = python_message.InitMessage
+  _MaterializeMessage = python_message.MaterializeMessage
 
 
 class GeneratedProtocolMessageType(type):
@@ -148,6 +151,21 @@ class GeneratedProtocolMessageType(type):
     superclass = super(GeneratedProtocolMessageType, cls)
     superclass.__init__(name, bases, dictionary)
 
+  def __getattr__(cls, name):
+    """Looks up an attribute which the class does not have (yet).
+
+    With api_implementation.ClassSetup() == 'lazy', properties, methods and
+    field number constants are only added to a class when its first instance
+    is created.  An earlier lookup of one of them completes the class.
+    """
+    if _MaterializeMessage is not None:
+      _MaterializeMessage(cls)
+      # Look again even if this call did not complete the class: another
+      # thread may have completed it while this one waited for the lock.
+      return type.__getattribute__(cls, name)
+    raise AttributeError("type object '%s' has no attribute '%s'" %
+                         (cls.__name__, name))
+
 
 def ParseMessage(descriptor, byte_str):
   """Generate a new Message instance from this Descriptor and a byte string.
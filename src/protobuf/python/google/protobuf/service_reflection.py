@@ -233,7 +233,9 @@ class _ServiceStubBuilder(object):
 
   Given a service descriptor, this class constructs a suitable stub class.
   A stub is just a type-safe wrapper around an RpcChannel which emulates a
-  local implementation of the service.
+  local implementation of the service.  Its methods return what the channel
+  returns, so stubs on the channels of asyncio_rpc return futures, and may
+  have many calls in flight at once.
 
   One service stub builder instance constructs exactly one class. It means all
   instances of that class share the same service stub builder.
@@ -277,7 +279,9 @@ class _ServiceStubBuilder(object):
       request: Request protocol message.
       callback: A callback to execute when the method finishes.
     Returns:
-      Response message (in case of blocking call).
+      Whatever the channel's CallMethod() returns: the response message in
+      case of a blocking call, or a future for it from the channels of
+      asyncio_rpc.
     """
     return stub.rpc_channel.CallMethod(
         method_descriptor, rpc_controller, request,
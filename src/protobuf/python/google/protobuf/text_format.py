@@ -32,15 +32,15 @@
 
 __author__ = 'kenton@google.com (Kenton Varda)'
 
-import cStringIO
+import itertools
 import re
 
-from collections import deque
+from google.protobuf.internal import decoder
 from google.protobuf.internal import type_checkers
 from google.protobuf import descriptor
 
-__all__ = [ 'MessageToString', 'PrintMessage', 'PrintField',
-            'PrintFieldValue', 'Merge' ]
+__all__ = [ 'MessageToString', 'MessageToChunks', 'PrintMessage',
+            'PrintField', 'PrintFieldValue', 'Merge' ]
 
 
 _INTEGER_CHECKERS = (type_checkers.Uint32ValueChecker(),
@@ -55,99 +55,271 @@ class ParseError(Exception):
   """Thrown in case of ASCII parsing error."""
 
 
-def MessageToString(message, as_utf8=False, as_one_line=False):
-  out = cStringIO.StringIO()
-  PrintMessage(message, out, as_utf8=as_utf8, as_one_line=as_one_line)
-  result = out.getvalue()
-  out.close()
+def MessageToString(message, as_utf8=False, as_one_line=False,
+                    max_bytes_length=None):
+  """Returns the text format of message.
+
+  Args:
+    message: The message to print.
+    as_utf8: Print strings as UTF-8 rather than escaping non-ASCII bytes.
+    as_one_line: Print the message on one line.
+    max_bytes_length: If set, bytes values longer than this are cut short,
+      and followed by their full length as in "\001\002"...(1234 bytes).
+      The text cannot be merged back then.
+  """
+  out = []
+  _GetPrinter(as_utf8, as_one_line, max_bytes_length).PrintMessage(
+      message, out.append, '')
+  result = ''.join(out)
   if as_one_line:
     return result.rstrip()
   return result
 
 
-def PrintMessage(message, out, indent=0, as_utf8=False, as_one_line=False):
-  for field, value in message.ListFields():
+def MessageToChunks(message, as_utf8=False, as_one_line=False,
+                    max_bytes_length=None, chunk_size=1 << 16):
+  """Yields the text format of message in chunks of about chunk_size bytes.
+
+  The chunks join up to what MessageToString() returns with the same
+  arguments.  Only the text of one element of a field of message is held
+  in memory besides the chunk, so the text of a message with a large
+  repeated field can be written out, or piped to another process, without
+  ever being held in memory whole.
+  """
+  printer = _GetPrinter(as_utf8, as_one_line, max_bytes_length)
+  pieces = []
+  write = pieces.append
+  size = 0
+  for field, value in message._IterFields():
+    print_element = printer.ElementPrinter(field)
     if field.label == descriptor.FieldDescriptor.LABEL_REPEATED:
-      for element in value:
-        PrintField(field, element, out, indent, as_utf8, as_one_line)
+      elements = value
     else:
-      PrintField(field, value, out, indent, as_utf8, as_one_line)
+      elements = (value,)
+    for element in elements:
+      start = len(pieces)
+      print_element(element, write, '')
+      size += sum(itertools.imap(len, itertools.islice(pieces, start, None)))
+      if size >= chunk_size:
+        # Keep the last piece back, so that the trailing space of a message
+        # printed as_one_line can be stripped off the last chunk.
+        last_piece = pieces.pop()
+        chunk = ''.join(pieces)
+        if chunk:
+          yield chunk
+        pieces = [last_piece]
+        write = pieces.append
+        size = len(last_piece)
+  result = ''.join(pieces)
+  if as_one_line:
+    result = result.rstrip()
+  if result:
+    yield result
 
 
-def PrintField(field, value, out, indent=0, as_utf8=False, as_one_line=False):
-  """Print a single field name/value pair.  For repeated fields, the value
-  should be a single element."""
+def PrintMessage(message, out, indent=0, as_utf8=False, as_one_line=False,
+                 max_bytes_length=None):
+  """Writes the text format of message to out, a field at a time.
 
-  out.write(' ' * indent);
-  if field.is_extension:
-    out.write('[')
-    if (field.containing_type.GetOptions().message_set_wire_format and
-        field.type == descriptor.FieldDescriptor.TYPE_MESSAGE and
-        field.message_type == field.extension_scope and
-        field.label == descriptor.FieldDescriptor.LABEL_OPTIONAL):
-      out.write(field.message_type.full_name)
-    else:
-      out.write(field.full_name)
-    out.write(']')
-  elif field.type == descriptor.FieldDescriptor.TYPE_GROUP:
-    # For groups, use the capitalized name.
-    out.write(field.message_type.name)
-  else:
-    out.write(field.name)
+  See MessageToString() for the arguments.
+  """
+  _GetPrinter(as_utf8, as_one_line, max_bytes_length).PrintMessage(
+      message, out.write, ' ' * indent)
 
-  if field.cpp_type != descriptor.FieldDescriptor.CPPTYPE_MESSAGE:
-    # The colon is optional in this case, but our cross-language golden files
-    # don't include it.
-    out.write(': ')
 
-  PrintFieldValue(field, value, out, indent, as_utf8, as_one_line)
-  if as_one_line:
-    out.write(' ')
-  else:
-    out.write('\n')
+def PrintField(field, value, out, indent=0, as_utf8=False, as_one_line=False):
+  """Print a single field name/value pair.  For repeated fields, the value
+  should be a single element."""
+  _GetPrinter(as_utf8, as_one_line).ElementPrinter(field)(
+      value, out.write, ' ' * indent)
 
 
 def PrintFieldValue(field, value, out, indent=0,
                     as_utf8=False, as_one_line=False):
   """Print a single field value (not including name).  For repeated fields,
   the value should be a single element."""
-
+  printer = _GetPrinter(as_utf8, as_one_line)
   if field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_MESSAGE:
     if as_one_line:
       out.write(' { ')
-      PrintMessage(value, out, indent, as_utf8, as_one_line)
+      printer.PrintMessage(value, out.write, ' ' * indent)
       out.write('}')
     else:
       out.write(' {\n')
-      PrintMessage(value, out, indent + 2, as_utf8, as_one_line)
+      printer.PrintMessage(value, out.write, ' ' * (indent + 2))
       out.write(' ' * indent + '}')
-  elif field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_ENUM:
-    enum_value = field.enum_type.values_by_number.get(value, None)
-    if enum_value is not None:
-      out.write(enum_value.name)
-    else:
-      out.write(str(value))
-  elif field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_STRING:
-    out.write('\"')
-    if type(value) is unicode:
-      out.write(_CEscape(value.encode('utf-8'), as_utf8))
+  else:
+    out.write(printer.ValueFormatter(field)(value))
+
+
+class _Printer(object):
+
+  """Prints messages in text format with one set of options.
+
+  How to print a field, such as the name to print it under and how to format
+  its values, is worked out the first time the field is printed and kept for
+  the next ones.
+  """
+
+  def __init__(self, as_utf8, as_one_line, max_bytes_length):
+    self._as_utf8 = as_utf8
+    self._as_one_line = as_one_line
+    self._max_bytes_length = max_bytes_length
+    # Map a FieldDescriptor to the function printing the field's value, one
+    # of its elements, or the text of one of its scalar values.
+    self._field_printers = {}
+    self._element_printers = {}
+    self._value_formatters = {}
+
+  def PrintMessage(self, message, write, indent):
+    """Writes the fields of message, each starting with the indent string."""
+    field_printers = self._field_printers
+    for field, value in message._IterFields():
+      print_field = field_printers.get(field)
+      if print_field is None:
+        print_field = self._CompileField(field)
+      print_field(value, write, indent)
+
+  def ElementPrinter(self, field):
+    """Returns the function printing one name/value pair of field."""
+    print_element = self._element_printers.get(field)
+    if print_element is None:
+      self._CompileField(field)
+      print_element = self._element_printers[field]
+    return print_element
+
+  def ValueFormatter(self, field):
+    """Returns the function giving the text of a value of scalar field."""
+    format_value = self._value_formatters.get(field)
+    if format_value is None:
+      format_value = self._value_formatters[field] = _ValueFormatter(
+          field, self._as_utf8, self._max_bytes_length)
+    return format_value
+
+  def _CompileField(self, field):
+    name = _FieldName(field)
+    if self._as_one_line:
+      end = ' '
     else:
-      out.write(_CEscape(value, as_utf8))
-    out.write('\"')
-  elif field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_BOOL:
-    if value:
-      out.write("true")
+      end = '\n'
+    is_repeated = field.label == descriptor.FieldDescriptor.LABEL_REPEATED
+
+    if field.cpp_type == descriptor.FieldDescriptor.CPPTYPE_MESSAGE:
+      print_message = self.PrintMessage
+      if self._as_one_line:
+        start = name + ' { '
+        def PrintElement(value, write, indent):
+          write(indent + start)
+          print_message(value, write, indent)
+          write('} ')
+      else:
+        start = name + ' {\n'
+        def PrintElement(value, write, indent):
+          write(indent + start)
+          print_message(value, write, indent + '  ')
+          write(indent + '}\n')
+
+      if is_repeated:
+        def PrintField(value, write, indent):
+          for element in value:
+            PrintElement(element, write, indent)
+      else:
+        PrintField = PrintElement
     else:
-      out.write("false")
-  else:
-    out.write(str(value))
+      # The colon is optional for scalar fields, but our cross-language golden
+      # files include it.
+      name += ': '
+      format_value = self.ValueFormatter(field)
+
+      def PrintElement(value, write, indent):
+        write(indent + name + format_value(value) + end)
+
+      if is_repeated:
+        def PrintField(value, write, indent):
+          start = indent + name
+          for element in value:
+            write(start + format_value(element) + end)
+      else:
+        PrintField = PrintElement
+
+    self._element_printers[field] = PrintElement
+    self._field_printers[field] = PrintField
+    return PrintField
+
+
+# Maps (as_utf8, as_one_line, max_bytes_length) to the _Printer printing with
+# those options.
+_printers = {}
+
+
+def _GetPrinter(as_utf8, as_one_line, max_bytes_length=None):
+  key = (bool(as_utf8), bool(as_one_line), max_bytes_length)
+  printer = _printers.get(key)
+  if printer is None:
+    printer = _printers.setdefault(key, _Printer(*key))
+  return printer
+
+
+def _FieldName(field):
+  """Returns the name to print field under."""
+  if field.is_extension:
+    if (field.containing_type.GetOptions().message_set_wire_format and
+        field.type == descriptor.FieldDescriptor.TYPE_MESSAGE and
+        field.message_type == field.extension_scope and
+        field.label == descriptor.FieldDescriptor.LABEL_OPTIONAL):
+      return '[%s]' % field.message_type.full_name
+    return '[%s]' % field.full_name
+  elif field.type == descriptor.FieldDescriptor.TYPE_GROUP:
+    # For groups, use the capitalized name.
+    return field.message_type.name
+  return field.name
+
+
+def _ValueFormatter(field, as_utf8, max_bytes_length=None):
+  """Returns a function giving the text of a value of a scalar field."""
+  cpp_type = field.cpp_type
+  if cpp_type == descriptor.FieldDescriptor.CPPTYPE_ENUM:
+    names = dict((enum_value.number, enum_value.name)
+                 for enum_value in field.enum_type.values)
+    def FormatEnum(value):
+      name = names.get(value)
+      if name is None:
+        return str(value)
+      return name
+    return FormatEnum
+  elif (field.type == descriptor.FieldDescriptor.TYPE_BYTES and
+        max_bytes_length is not None):
+    def FormatBytes(value):
+      value = decoder.StringOf(value)
+      if len(value) <= max_bytes_length:
+        return '"' + _CEscape(value, as_utf8) + '"'
+      return '"%s"...(%d bytes)' % (
+          _CEscape(value[:max_bytes_length], as_utf8), len(value))
+    return FormatBytes
+  elif cpp_type == descriptor.FieldDescriptor.CPPTYPE_STRING:
+    def FormatString(value):
+      if type(value) is unicode:
+        value = value.encode('utf-8')
+      else:
+        # Bytes parsed from a memoryview are memoryviews.
+        value = decoder.StringOf(value)
+      return '"' + _CEscape(value, as_utf8) + '"'
+    return FormatString
+  elif cpp_type == descriptor.FieldDescriptor.CPPTYPE_BOOL:
+    def FormatBool(value):
+      if value:
+        return 'true'
+      return 'false'
+    return FormatBool
+  return str
 
 
 def Merge(text, message):
   """Merges an ASCII representation of a protocol message into a message.
 
   Args:
-    text: Message ASCII representation.
+    text: Message ASCII representation, or a file-like object to read it from.
+      A file is read a chunk at a time rather than all at once.
     message: A protocol buffer message to merge into.
 
   Raises:
@@ -299,30 +471,52 @@ class _Tokenizer(object):
   This class handles the lower level string parsing by splitting it into
   meaningful tokens.
 
-  It was directly ported from the Java protocol buffer API.
+  It was directly ported from the Java protocol buffer API.  Each token is
+  matched together with the whitespace and comments before it by a single
+  regular expression run over the whole text, and line and column numbers
+  are only worked out when a ParseError needs them.  The text can also be
+  read from a file, a chunk of lines at a time.
   """
 
-  _WHITESPACE = re.compile('(\\s|(#.*$))+', re.MULTILINE)
-  _TOKEN = re.compile(
-      '[a-zA-Z_][0-9a-zA-Z_+-]*|'           # an identifier
-      '[0-9+-][0-9a-zA-Z_.+-]*|'            # a number
-      '\"([^\"\n\\\\]|\\\\.)*(\"|\\\\?$)|'  # a double-quoted string
-      '\'([^\'\n\\\\]|\\\\.)*(\'|\\\\?$)')  # a single-quoted string
+  # Whitespace and comments, then the next token, if any.  Tokens never span
+  # lines: a string missing its ending quote stops at the end of its line.
+  _NEXT_TOKEN = re.compile(
+      '(?:\\s|#.*)*('
+      '[a-zA-Z_][0-9a-zA-Z_+-]*|'                  # an identifier
+      '[0-9+-][0-9a-zA-Z_.+-]*|'                   # a number
+      '\"(?:[^\"\n\\\\]|\\\\.)*(?:\"|\\\\?$)|'  # a double-quoted string
+      '\'(?:[^\'\n\\\\]|\\\\.)*(?:\'|\\\\?$)|'  # a single-quoted string
+      '\\S)?',                                      # any other character
+      re.MULTILINE)
   _IDENTIFIER = re.compile('\w+')
 
-  def __init__(self, text_message):
-    self._text_message = text_message
+  # How much to read from a file at a time.
+  _CHUNK_SIZE = 1 << 16
 
+  def __init__(self, text_message):
+    """
+    Args:
+      text_message: The text to tokenize, or a file-like object to read it
+        from.
+    """
+    if hasattr(text_message, 'read'):
+      self._file = text_message
+      self._text = ''
+    else:
+      self._file = None
+      self._text = text_message
+    # The text read from _file after its last complete line.
+    self._partial_line = ''
+    # The number of lines dropped from the front of _text since they were
+    # read from _file.
+    self._dropped_lines = 0
+
+    # Offsets into _text of the current token, of the token before it, and of
+    # the text after the current token.
+    self._token_start = 0
+    self._previous_start = 0
     self._position = 0
-    self._line = -1
-    self._column = 0
-    self._token_start = None
     self.token = ''
-    self._lines = deque(text_message.split('\n'))
-    self._current_line = ''
-    self._previous_line = 0
-    self._previous_column = 0
-    self._SkipWhitespace()
     self.NextToken()
 
   def AtEnd(self):
@@ -333,23 +527,34 @@ class _Tokenizer(object):
     """
     return self.token == ''
 
-  def _PopLine(self):
-    while len(self._current_line) <= self._column:
-      if not self._lines:
-        self._current_line = ''
-        return
-      self._line += 1
-      self._column = 0
-      self._current_line = self._lines.popleft()
+  def _ReadLines(self):
+    """Reads the next lines from _file onto the end of _text, dropping the
+    lines before the one the previous token is on.
 
-  def _SkipWhitespace(self):
+    Since tokens never span lines, a token can always be matched in full once
+    its line has been read.
+    """
+    text = self._text
+    drop = text.rfind('\n', 0, self._previous_start) + 1
+    if drop:
+      self._dropped_lines += text.count('\n', 0, drop)
+      self._token_start -= drop
+      self._previous_start -= drop
+      self._position -= drop
+      text = text[drop:]
     while True:
-      self._PopLine()
-      match = self._WHITESPACE.match(self._current_line, self._column)
-      if not match:
-        break
-      length = len(match.group(0))
-      self._column += length
+      chunk = self._file.read(self._CHUNK_SIZE)
+      if not chunk:
+        self._text = text + self._partial_line
+        self._partial_line = ''
+        self._file = None
+        return
+      end = chunk.rfind('\n') + 1
+      if end:
+        self._text = ''.join((text, self._partial_line, chunk[:end]))
+        self._partial_line = chunk[end:]
+        return
+      self._partial_line += chunk
 
   def TryConsume(self, token):
     """Tries to consume a given piece of text.
@@ -555,35 +760,40 @@ class _Tokenizer(object):
     Returns:
       A ParseError instance.
     """
-    return ParseError('%d:%d : %s' % (
-        self._previous_line + 1, self._previous_column + 1, message))
+    return self._ParseErrorAt(self._previous_start, message)
 
   def _ParseError(self, message):
     """Creates and *returns* a ParseError for the current token."""
+    return self._ParseErrorAt(self._token_start, message)
+
+  def _ParseErrorAt(self, offset, message):
+    """Creates and *returns* a ParseError for the token at offset in _text."""
+    text = self._text
+    line_start = text.rfind('\n', 0, offset) + 1
+    line = self._dropped_lines + text.count('\n', 0, line_start)
     return ParseError('%d:%d : %s' % (
-        self._line + 1, self._column + 1, message))
+        line + 1, offset - line_start + 1, message))
 
   def _StringParseError(self, e):
     return self._ParseError('Couldn\'t parse string: ' + str(e))
 
   def NextToken(self):
     """Reads the next meaningful token."""
-    self._previous_line = self._line
-    self._previous_column = self._column
+    self._previous_start = self._token_start
 
-    self._column += len(self.token)
-    self._SkipWhitespace()
+    match = self._NEXT_TOKEN.match(self._text, self._position)
+    while match.end() == len(self._text) and self._file is not None:
+      self._ReadLines()
+      match = self._NEXT_TOKEN.match(self._text, self._position)
 
-    if not self._lines and len(self._current_line) <= self._column:
+    self._position = match.end()
+    token = match.group(1)
+    if token is None:
+      self._token_start = self._position
       self.token = ''
-      return
-
-    match = self._TOKEN.match(self._current_line, self._column)
-    if match:
-      token = match.group(0)
-      self.token = token
     else:
-      self.token = self._current_line[self._column]
+      self._token_start = match.start(1)
+      self.token = token
 
 
 # text.encode('string_escape') does not seem to satisfy our needs as it
@@ -591,27 +801,47 @@ class _Tokenizer(object):
 # C++ unescaping function allows hex escapes to be any length.  So,
 # "\0011".encode('string_escape') ends up being "\\x011", which will be
 # decoded in C++ as a single-character string with char code 0x11.
-def _CEscape(text, as_utf8):
-  def escape(c):
-    o = ord(c)
-    if o == 10: return r"\n"   # optional escape
-    if o == 13: return r"\r"   # optional escape
-    if o ==  9: return r"\t"   # optional escape
-    if o == 39: return r"\'"   # optional escape
+def _CEscapeTable(as_utf8):
+  """Returns a dict mapping each of the 256 characters to its escaped form."""
+  table = {}
+  for o in xrange(256):
+    c = chr(o)
+    if not as_utf8 and (o >= 127 or o < 32):
+      table[c] = '\\%03o' % o  # necessary escapes
+    else:
+      table[c] = c
+  # optional escapes
+  table['\n'] = r'\n'
+  table['\r'] = r'\r'
+  table['\t'] = r'\t'
+  table["'"] = r"\'"
+  # necessary escapes
+  table['"'] = r'\"'
+  table['\\'] = r'\\'
+  return table
 
-    if o == 34: return r'\"'   # necessary escape
-    if o == 92: return r"\\"   # necessary escape
 
-    # necessary escapes
-    if not as_utf8 and (o >= 127 or o < 32): return "\\%03o" % o
-    return c
-  return "".join([escape(c) for c in text])
+_CESCAPE_TABLES = (_CEscapeTable(False), _CEscapeTable(True))
+# Matches the first character _CEscape() has to escape, if any.
+_CESCAPE_NEEDED = (re.compile('[\\x00-\\x1f\'"\\\\\\x7f-\\xff]'),
+                   re.compile('[\\t\\n\\r\'"\\\\]'))
+
+
+def _CEscape(text, as_utf8):
+  as_utf8 = bool(as_utf8)
+  if not _CESCAPE_NEEDED[as_utf8].search(text):
+    return text
+  return ''.join(map(_CESCAPE_TABLES[as_utf8].__getitem__, text))
 
 
 _CUNESCAPE_HEX = re.compile(r'(\\+)x([0-9a-fA-F])(?![0-9a-fA-F])')
 
 
 def _CUnescape(text):
+  if '\\' not in text:
+    # Most strings have nothing to unescape.
+    return str(text)
+
   def ReplaceHex(m):
     # Only replace the match if the number of leading back slashes is odd. i.e.
     # the slash itself is not escaped.
@@ -0,0 +1,229 @@
+# Protocol Buffers - Google's data interchange format
+# Copyright 2008 Google Inc.  All rights reserved.
+# http://code.google.com/p/protobuf/
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following disclaimer
+# in the documentation and/or other materials provided with the
+# distribution.
+#     * Neither the name of Google Inc. nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Scans serialized protocol messages without parsing them.
+
+ScanFields() walks the fields of a serialized message and reports where each
+one's value lies in the buffer, without creating any message objects:
+
+  for field_number, wire_type, offset, length in ScanFields(data):
+    ...
+
+FieldIndex records those positions, so that a field, or one element of a
+repeated field, can then be read, scanned or parsed on its own:
+
+  nodes = ripple_pb2.TMLedgerData.NODES_FIELD_NUMBER
+  index = FieldIndex(data, field_numbers=[nodes])
+  node = index.ParseMessage(nodes, 7, ripple_pb2.TMLedgerNode)
+
+The value of a varint field is the varint itself; DecodeVarint() reads it.
+Fixed-width values are 4 or 8 little-endian bytes.  Length-delimited values
+(strings, bytes, messages and packed repeated fields) exclude their length
+prefix, and groups exclude their start and end tags.
+"""
+
+import array
+
+from google.protobuf.internal import decoder
+from google.protobuf.internal import encoder
+from google.protobuf.internal import wire_format
+from google.protobuf import message
+
+
+def DecodeVarint(buffer, offset):
+  """Returns the unsigned value of the varint at buffer[offset]."""
+  return decoder._DecodeVarint(decoder.AsBuffer(buffer), offset)[0]
+
+
+def ScanFields(buffer, start=0, end=None):
+  """Walks the fields of a serialized message.
+
+  Args:
+    buffer: The serialized message, as a str, buffer, bytearray, memoryview
+      or mmap.
+    start, end: The range of buffer holding the message.  end defaults to
+      the end of buffer.
+
+  Yields:
+    A (field_number, wire_type, value_offset, value_length) tuple for every
+    field, in buffer order.  Offsets are relative to the start of buffer.
+
+  Raises:
+    message.DecodeError: The range is not a valid serialized message.
+  """
+  buffer = decoder.AsBuffer(buffer)
+  if end is None:
+    end = len(buffer)
+  local_ord = ord
+  local_DecodeVarint = decoder._DecodeVarint
+  pos = start
+  try:
+    while pos < end:
+      tag = local_ord(buffer[pos])
+      if tag < 0x80:
+        pos += 1
+      else:
+        (tag, pos) = local_DecodeVarint(buffer, pos)
+        # Decoded varints are longs.
+        tag = int(tag)
+      wire_type = tag & wire_format.TAG_TYPE_MASK
+      if wire_type == wire_format.WIRETYPE_LENGTH_DELIMITED:
+        length = local_ord(buffer[pos])
+        if length < 0x80:
+          offset = pos + 1
+        else:
+          (length, offset) = local_DecodeVarint(buffer, pos)
+          length = int(length)
+        pos = offset + length
+      elif wire_type == wire_format.WIRETYPE_VARINT:
+        offset = pos
+        while local_ord(buffer[pos]) & 0x80:
+          pos += 1
+        pos += 1
+        length = pos - offset
+      elif wire_type == wire_format.WIRETYPE_FIXED64:
+        offset = pos
+        length = 8
+        pos += 8
+      elif wire_type == wire_format.WIRETYPE_FIXED32:
+        offset = pos
+        length = 4
+        pos += 4
+      elif wire_type == wire_format.WIRETYPE_START_GROUP:
+        offset = pos
+        pos = decoder._SkipGroup(buffer, pos, end)
+        length = pos - offset - len(encoder.TagBytes(
+            tag >> wire_format.TAG_TYPE_BITS, wire_format.WIRETYPE_END_GROUP))
+      elif wire_type == wire_format.WIRETYPE_END_GROUP:
+        raise message.DecodeError('Unexpected end-group tag.')
+      else:
+        raise message.DecodeError('Tag had invalid wire type.')
+      if pos > end:
+        raise message.DecodeError('Truncated message.')
+      yield (tag >> wire_format.TAG_TYPE_BITS, wire_type, offset, length)
+  except IndexError:
+    raise message.DecodeError('Truncated message.')
+
+
+class FieldIndex(object):
+
+  """The positions of the fields of a serialized message.
+
+  The index is built with one ScanFields() pass and holds two machine words
+  and a byte per field occurrence, so it stays small next to the message.  The
+  elements of a repeated field are numbered in buffer order; a packed
+  repeated field is a single length-delimited element.
+  """
+
+  def __init__(self, buffer, start=0, end=None, field_numbers=None):
+    """Args:
+      buffer: The serialized message, as accepted by ScanFields().  The index
+        keeps a reference to it.
+      start, end: The range of buffer holding the message.
+      field_numbers: If not None, the only field numbers to record.
+
+    Raises:
+      message.DecodeError: The range is not a valid serialized message.
+    """
+    self._buffer = decoder.AsBuffer(buffer)
+    # Maps a field number to an (offsets_and_lengths, wire_types) pair of
+    # arrays.  offsets_and_lengths holds two entries per element.
+    self._fields = {}
+    if field_numbers is not None:
+      field_numbers = frozenset(field_numbers)
+    fields = self._fields
+    for field_number, wire_type, offset, length in ScanFields(
+        self._buffer, start, end):
+      entry = fields.get(field_number)
+      if entry is None:
+        if field_numbers is not None and field_number not in field_numbers:
+          continue
+        entry = fields[field_number] = (array.array('l'), array.array('B'))
+      entry[0].append(offset)
+      entry[0].append(length)
+      entry[1].append(wire_type)
+
+  def FieldNumbers(self):
+    """Returns the recorded field numbers, in ascending order."""
+    return sorted(self._fields)
+
+  def Count(self, field_number):
+    """Returns the number of occurrences of a field."""
+    entry = self._fields.get(field_number)
+    if entry is None:
+      return 0
+    return len(entry[1])
+
+  def Range(self, field_number, i=-1):
+    """Returns the (wire_type, value_offset, value_length) of an element.
+
+    Args:
+      field_number: The field.
+      i: Which occurrence of the field, as a list index.  The default, the
+        last one, is the value of a non-repeated scalar field.
+
+    Raises:
+      IndexError: The field does not have an element i.
+    """
+    entry = self._fields.get(field_number)
+    if entry is None:
+      raise IndexError('Field %d is not present.' % field_number)
+    offsets_and_lengths, wire_types = entry
+    wire_type = wire_types[i]
+    if i < 0:
+      i += len(wire_types)
+    return (wire_type, offsets_and_lengths[2 * i],
+            offsets_and_lengths[2 * i + 1])
+
+  def Bytes(self, field_number, i=-1):
+    """Returns the value of an element as a str; see Range()."""
+    unused_wire_type, offset, length = self.Range(field_number, i)
+    return decoder.StringOf(self._buffer[offset:offset + length])
+
+  def Index(self, field_number, i=-1, field_numbers=None):
+    """Returns a FieldIndex of an element which is a message; see Range()."""
+    unused_wire_type, offset, length = self.Range(field_number, i)
+    return FieldIndex(self._buffer, offset, offset + length, field_numbers)
+
+  def ParseMessage(self, field_number, i, message_class):
+    """Parses an element which is a message of class message_class.
+
+    Raises:
+      IndexError: The field does not have an element i.
+      message.DecodeError: The element is not a valid message.
+    """
+    wire_type, offset, length = self.Range(field_number, i)
+    if wire_type != wire_format.WIRETYPE_LENGTH_DELIMITED:
+      raise message.DecodeError(
+          'Field %d has wire type %d, not a message.' % (field_number,
+                                                         wire_type))
+    result = message_class()
+    result.MergeFromString(self._buffer[offset:offset + length])
+    return result
@@ -93,7 +93,11 @@ def MakeTestSuite():
   import google.protobuf.internal.service_reflection_test \
     as service_reflection_test
   import google.protobuf.internal.text_format_test   as text_format_test
+  import google.protobuf.internal.json_format_test   as json_format_test
   import google.protobuf.internal.wire_format_test   as wire_format_test
+  import google.protobuf.internal.asyncio_framing_test \
+      as asyncio_framing_test
+  import google.protobuf.internal.asyncio_rpc_test   as asyncio_rpc_test
   import google.protobuf.internal.unknown_fields_test as unknown_fields_test
   import google.protobuf.internal.descriptor_database_test \
       as descriptor_database_test
@@ -110,7 +114,10 @@ def MakeTestSuite():
                 reflection_test,
                 service_reflection_test,
                 text_format_test,
-                wire_format_test ]:
+                json_format_test,
+                wire_format_test,
+                asyncio_framing_test,
+                asyncio_rpc_test ]:
     suite.addTest(loader.loadTestsFromModule(test))
 
   return suite
@@ -169,6 +176,7 @@ if __name__ == '__main__':
           'google.protobuf.internal.enum_type_wrapper',
           'google.protobuf.internal.message_listener',
           'google.protobuf.internal.python_message',
+          'google.protobuf.internal.table_decoder',
           'google.protobuf.internal.type_checkers',
           'google.protobuf.internal.wire_format',
           'google.protobuf.descriptor',
@@ -176,14 +184,22 @@ if __name__ == '__main__':
           'google.protobuf.compiler.plugin_pb2',
           'google.protobuf.message',
           'google.protobuf.descriptor_database',
+          'google.protobuf.asyncio_framing',
+          'google.protobuf.asyncio_rpc',
           'google.protobuf.descriptor_pool',
+          'google.protobuf.framing',
+          'google.protobuf.json_format',
           'google.protobuf.message_factory',
           'google.protobuf.reflection',
           'google.protobuf.service',
           'google.protobuf.service_reflection',
-          'google.protobuf.text_format' ],
+          'google.protobuf.text_format',
+          'google.protobuf.wire_scanner' ],
         cmdclass = { 'clean': clean, 'build_py': build_py },
         install_requires = ['setuptools'],
+        # asyncio_framing and asyncio_rpc need asyncio, which Python 2 only
+        # has as trollius.
+        extras_require = { 'asyncio': ['trollius'] },
         ext_modules = ext_module_list,
         url = 'http://code.google.com/p/protobuf/',
         maintainer = maintainer_email,